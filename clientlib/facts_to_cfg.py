@@ -1,6 +1,11 @@
-from typing import Tuple, List, Union, Mapping, Set
-from collections import namedtuple, defaultdict
-from itertools import chain
+from typing import Tuple, List, Mapping, Set, Dict, Iterable, Optional, TextIO
+from collections import namedtuple, defaultdict, Counter
+from itertools import accumulate, chain
+from array import array
+import gzip
+import os
+import pickle
+import sys
 
 Statement = namedtuple('Statement', ['ident', 'op', 'operands', 'defs'])
 
@@ -19,8 +24,16 @@ class Function:
         self.is_public = is_public
         self.head_block = head_block
 
-def load_csv(path: str, seperator: str='\t') -> List[Union[str, List[str]]]:
-    with open(path) as f:
+GZIP_MAGIC = b'\x1f\x8b'
+
+def open_fact_file(path: str) -> TextIO:
+    """Opens a decompiler output for reading, whether plain or gzip-compressed (see clientlib/fact_io.dl)."""
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    return gzip.open(path, 'rt') if compressed else open(path)
+
+def load_csv(path: str, seperator: str='\t') -> List[List[str]]:
+    with open_fact_file(path) as f:
         return [line.split(seperator) for line in f.read().splitlines()]
 
 def load_csv_map(path: str, seperator: str='\t', reverse: bool=False) -> Mapping[str, str]:
@@ -38,74 +51,212 @@ def load_csv_multimap(path: str, seperator: str='\t', reverse: bool=False) -> Ma
 
     return ret
 
-def construct_cfg() -> Tuple[Mapping[str, Block], Mapping[str, Function]]:
-    # Load facts
-    tac_function_blocks = load_csv_multimap('InFunction.csv', reverse=True)
+CFG_CACHE_DIR = 'cfg_cache'
+"""Subdirectory of the facts dir holding CFG_CACHE_FILE, so that it is not listed among the contract's relations."""
 
-    tac_func_id_to_public = load_csv_map('PublicFunction.csv')
-    tac_high_level_func_name = load_csv_map('HighLevelFunctionName.csv')
+CFG_CACHE_FILE = os.path.join(CFG_CACHE_DIR, 'CFG.pickle')
+"""Sidecar file memoizing the IndexedCFG of a contract, shared by the script clients run on it."""
 
-    tac_formal_args: Mapping[str, List[Tuple[str, int]]] = defaultdict(list)
-    for func_id, arg, pos in load_csv('FormalArgs.csv'):
-        tac_formal_args[func_id].append((arg, int(pos)))
-    
-    # Inverse mapping
-    tac_block_function: Mapping[str, str] = {}
-    for func_id, block_ids in tac_function_blocks.items():
-        for block in block_ids:
-            tac_block_function[block] = func_id
+CFG_INPUT_FILES = [
+    'InFunction.csv', 'PublicFunction.csv', 'HighLevelFunctionName.csv', 'FormalArgs.csv', 'IRFunctionEntry.csv',
+    'TAC_Block.csv', 'TAC_Op.csv', 'TAC_Def.csv', 'TAC_Use.csv', 'LocalBlockEdge.csv'
+]
 
+def stmt_sort_key(stmt_id: str) -> int:
+    return int(stmt_id.replace("S", "").split('0x')[1].split('_')[0], base=16)
 
-    tac_block_stmts = load_csv_multimap('TAC_Block.csv', reverse=True)
-    tac_op = load_csv_map('TAC_Op.csv')
+def file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
 
-    # Load statement defs/uses
-    tac_defs: Mapping[str, List[Tuple[str, int]]] = defaultdict(list)
-    for stmt_id, var, pos in load_csv('TAC_Def.csv'):
-        tac_defs[stmt_id].append((var, int(pos)))
+def to_csr(num_keys: int, keys: List[int], values: Iterable[int]) -> Tuple[array, array]:
+    """
+    Packs values, sorted by their keys, into an offsets array and a values array:
+    the values of key k are values[offsets[k]:offsets[k + 1]].
+    """
+    counts = Counter(keys)
+    offsets = array('l', accumulate(chain([0], (counts[k] for k in range(num_keys)))))
+    return offsets, array('l', values)
 
-    tac_uses: Mapping[str, List[Tuple[str, int]]] = defaultdict(list)
-    for stmt_id, var, pos in load_csv('TAC_Use.csv'):
-        tac_uses[stmt_id].append((var, int(pos)))
+class IndexedCFG:
+    """
+    Compact CFG of a contract, with blocks, statements, variables and functions numbered
+    and the relations between them kept in int arrays. Statements are numbered so that
+    the statements of each block are consecutive and in order. The variables used/defined
+    by statements, the formals of functions and the successors/predecessors of blocks
+    are kept in CSR form (see to_csr).
 
-    # Load block edges
-    tac_block_succ = load_csv_multimap('LocalBlockEdge.csv')
-    tac_block_pred: Mapping[str, List[str]] = defaultdict(list)
-    for block, succs in tac_block_succ.items():
-        for succ in succs:
-            tac_block_pred[succ].append(block)
+    Built from the decompiler facts in the current dir, reading each file once, and memoized
+    in CFG_CACHE_FILE, so that the script clients run on the same contract share it.
+    """
 
-    def stmt_sort_key(stmt_id: str) -> int:
-        return int(stmt_id.replace("S", "").split('0x')[1].split('_')[0], base=16)
+    def __init__(self) -> None:
+        self.stamps: List[Optional[Tuple[int, int]]] = []
+        """Size and modification time of the CFG_INPUT_FILES it was built from"""
 
-    # Construct blocks
-    blocks: Mapping[str, Block] = {}
-    for block_id in chain(*tac_function_blocks.values()):
+        self.block_ids: List[str] = []
+        self.block_stmt_offsets = array('l')
+        """The statements of block b are range(block_stmt_offsets[b], block_stmt_offsets[b + 1])"""
+        self.succ_offsets, self.succs = array('l'), array('l')
+        self.pred_offsets, self.preds = array('l'), array('l')
+
+        self.stmt_ids: List[str] = []
+        self.stmt_ops: List[str] = []
+        self.use_offsets, self.uses = array('l'), array('l')
+        self.def_offsets, self.defs = array('l'), array('l')
+
+        self.var_ids: List[str] = []
+
+        self.function_ids: List[str] = []
+        self.function_names: List[str] = []
+        self.function_public = bytearray()
+        self.function_entries = array('l')
+        self.formal_offsets, self.formals = array('l'), array('l')
+
+    @staticmethod
+    def load() -> 'IndexedCFG':
+        """
+        Returns the CFG memoized in CFG_CACHE_FILE, building (and memoizing) it if missing or stale.
+        Only the attributes of the CFG are pickled, as plain lists and arrays: unpickling an IndexedCFG
+        would need this module under the name it was pickled from (clientlib.facts_to_cfg or facts_to_cfg,
+        depending on the client).
+        """
+        stamps = [file_stamp(path) for path in CFG_INPUT_FILES]
         try:
-            statements = [
-                Statement(
-                    s_id,
-                    tac_op[s_id],
-                    [var for var, _ in sorted(tac_uses[s_id], key=lambda x: x[1])],
-                    [var for var, _ in sorted(tac_defs[s_id], key=lambda x: x[1])]
-                ) for s_id in sorted(tac_block_stmts[block_id], key=stmt_sort_key)
-            ]
-            blocks[block_id] = Block(block_id, statements)
-        except:
-            __import__('pdb').set_trace()
+            with open(CFG_CACHE_FILE, 'rb') as f:
+                state = pickle.load(f)
+            if isinstance(state, dict) and state.get('stamps') == stamps:
+                cfg = IndexedCFG()
+                cfg.__dict__.update(state)
+                return cfg
+        except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+            pass
 
-    # Link blocks together
-    for block in blocks.values():
-        block.predecessors = [blocks[pred] for pred in tac_block_pred[block.ident]]
-        block.successors   = [blocks[succ] for succ in tac_block_succ[block.ident]]
+        cfg = IndexedCFG.build()
+        cfg.stamps = stamps
+        tmp_path = f'{CFG_CACHE_FILE}.tmp{os.getpid()}'
+        try:
+            os.makedirs(CFG_CACHE_DIR, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(vars(cfg), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, CFG_CACHE_FILE)
+        except OSError:
+            # not worth failing the client over
+            pass
+        return cfg
+
+    @staticmethod
+    def build() -> 'IndexedCFG':
+        cfg = IndexedCFG()
+
+        block_index: Dict[str, int] = {}
+        block_function: Dict[str, str] = {}
+        for block_id, func_id in load_csv('InFunction.csv'):
+            block_index.setdefault(block_id, len(block_index))
+            block_function[block_id] = func_id
+        cfg.block_ids = list(block_index)
+        num_blocks = len(block_index)
+
+        # Number statements by block, in order (ties in TAC_Block order)
+        stmts: List[Tuple[int, int, int, str]] = []
+        seen: Set[str] = set()
+        for stmt_id, block_id in load_csv('TAC_Block.csv'):
+            block = block_index.get(block_id)
+            if block is not None and stmt_id not in seen:
+                seen.add(stmt_id)
+                stmts.append((block, stmt_sort_key(stmt_id), len(stmts), stmt_id))
+        stmts.sort()
+        cfg.stmt_ids = [stmt_id for _, _, _, stmt_id in stmts]
+        stmt_index = {stmt_id: i for i, stmt_id in enumerate(cfg.stmt_ids)}
+        num_stmts = len(stmts)
+        cfg.block_stmt_offsets, _ = to_csr(num_blocks, [block for block, _, _, _ in stmts], [])
+
+        ops: List[Optional[str]] = [None] * num_stmts
+        for stmt_id, op in load_csv('TAC_Op.csv'):
+            stmt = stmt_index.get(stmt_id)
+            if stmt is not None:
+                ops[stmt] = sys.intern(op)
+        if None in ops:
+            raise KeyError(cfg.stmt_ids[ops.index(None)])
+        cfg.stmt_ops = ops # type: ignore
+
+        var_index: Dict[str, int] = {}
+        def load_vars(path: str, index: Dict[str, int], num_keys: int) -> Tuple[array, array]:
+            rows = sorted((index[key_id], int(pos), var_index.setdefault(var, len(var_index))) for key_id, var, pos in load_csv(path) if key_id in index)
+            return to_csr(num_keys, [key for key, _, _ in rows], (var for _, _, var in rows))
 
-    functions: Mapping[str, Function] = {}
-    for block_id, in load_csv('IRFunctionEntry.csv'):
-        func_id = tac_block_function[block_id]
+        cfg.use_offsets, cfg.uses = load_vars('TAC_Use.csv', stmt_index, num_stmts)
+        cfg.def_offsets, cfg.defs = load_vars('TAC_Def.csv', stmt_index, num_stmts)
 
-        high_level_name = 'fallback()' if tac_func_id_to_public.get(func_id, '_') == '0x0' else tac_high_level_func_name[func_id]
-        formals = [var for var, _ in sorted(tac_formal_args[func_id], key=lambda x: x[1])]
+        # Block edges, the predecessors of a block in the order they first appear as sources
+        edges = []
+        first_source: Dict[int, int] = {}
+        for block_id, succ_id in load_csv('LocalBlockEdge.csv'):
+            block, succ = block_index.get(block_id), block_index.get(succ_id)
+            if block is not None and succ is not None:
+                edges.append((block, first_source.setdefault(block, len(first_source)), succ))
+        edges.sort(key=lambda edge: edge[0])
+        cfg.succ_offsets, cfg.succs = to_csr(num_blocks, [block for block, _, _ in edges], (succ for _, _, succ in edges))
+        edges.sort(key=lambda edge: (edge[2], edge[1]))
+        cfg.pred_offsets, cfg.preds = to_csr(num_blocks, [succ for _, _, succ in edges], (block for block, _, _ in edges))
+
+        # Functions, in the order of their entries
+        public = load_csv_map('PublicFunction.csv')
+        high_level_names = load_csv_map('HighLevelFunctionName.csv')
+        function_index: Dict[str, int] = {}
+        for block_id, in load_csv('IRFunctionEntry.csv'):
+            func_id = block_function[block_id]
+            if func_id in function_index:
+                continue
+            function_index[func_id] = len(function_index)
+            cfg.function_names.append('fallback()' if public.get(func_id, '_') == '0x0' else high_level_names[func_id])
+            cfg.function_public.append(func_id in public or func_id == '0x0')
+            cfg.function_entries.append(block_index[block_id])
+        cfg.function_ids = list(function_index)
+        cfg.formal_offsets, cfg.formals = load_vars('FormalArgs.csv', function_index, len(function_index))
+
+        cfg.var_ids = list(var_index)
+        return cfg
+
+    def block_statements(self, block: int) -> range:
+        return range(self.block_stmt_offsets[block], self.block_stmt_offsets[block + 1])
+
+    def successors(self, block: int) -> array:
+        return self.succs[self.succ_offsets[block]:self.succ_offsets[block + 1]]
+
+    def predecessors(self, block: int) -> array:
+        return self.preds[self.pred_offsets[block]:self.pred_offsets[block + 1]]
+
+    def stmt_uses(self, stmt: int) -> List[str]:
+        return [self.var_ids[var] for var in self.uses[self.use_offsets[stmt]:self.use_offsets[stmt + 1]]]
+
+    def stmt_defs(self, stmt: int) -> List[str]:
+        return [self.var_ids[var] for var in self.defs[self.def_offsets[stmt]:self.def_offsets[stmt + 1]]]
+
+    def function_formals(self, function: int) -> List[str]:
+        return [self.var_ids[var] for var in self.formals[self.formal_offsets[function]:self.formal_offsets[function + 1]]]
+
+def construct_cfg() -> Tuple[Mapping[str, Block], Mapping[str, Function]]:
+    cfg = IndexedCFG.load()
+
+    # Construct blocks
+    block_list = [
+        Block(block_id, [
+            Statement(cfg.stmt_ids[s], cfg.stmt_ops[s], cfg.stmt_uses(s), cfg.stmt_defs(s)) for s in cfg.block_statements(b)
+        ]) for b, block_id in enumerate(cfg.block_ids)
+    ]
+
+    # Link blocks together
+    for b, block in enumerate(block_list):
+        block.predecessors = [block_list[pred] for pred in cfg.predecessors(b)]
+        block.successors   = [block_list[succ] for succ in cfg.successors(b)]
 
-        functions[func_id] = Function(func_id, high_level_name, blocks[block_id], func_id in tac_func_id_to_public or func_id == '0x0', formals)
+    functions: Mapping[str, Function] = {
+        func_id: Function(func_id, cfg.function_names[f], block_list[cfg.function_entries[f]], bool(cfg.function_public[f]), cfg.function_formals(f))
+        for f, func_id in enumerate(cfg.function_ids)
+    }
 
-    return blocks, functions
+    return {block.ident: block for block in block_list}, functions
@@ -0,0 +1,191 @@
+"""
+Typed, lazily loaded tables over the relations (csv files) of a contract's facts dir, for Python clients:
+
+    db = load_database()  # the current dir, where script clients are run
+    for stmt, var, pos in db['TAC_Use']:
+        ...
+    db['TAC_Use'].lookup('stmt', stmt_id)  # hash index on the column, built on first use
+
+Relations are only read when first used. Column names and types come from the .input
+declarations of clientlib/decompiler_imports.dl, and can be given for other relations (e.g. client outputs).
+Loaded relations are memoized in RELATION_CACHE_DIR, so that the script clients run on the same contract share them.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from array import array
+import os
+import pickle
+import re
+import sys
+
+from .facts_to_cfg import file_stamp, open_fact_file
+
+DECOMPILER_IMPORTS_DL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'decompiler_imports.dl')
+
+RELATION_CACHE_DIR = 'relation_cache'
+"""Subdirectory of the facts dir holding the loaded relations, pickled."""
+
+SOUFFLE_TYPES = {'number': int, 'unsigned': int, 'float': float}
+"""Python types of souffle's numeric types, all others are read as str"""
+
+Schema = Dict[str, Tuple[List[str], List[type]]]
+
+def parse_schema(dl_file: str) -> Schema:
+    """
+    Returns the column names and types of the relations read by the .input declarations
+    of dl_file, by file name (without the extension).
+    """
+    with open(dl_file) as f:
+        text = f.read()
+
+    types: Dict[str, type] = dict(SOUFFLE_TYPES)
+    for name, base in re.findall(r'^\.type\s+(\w+)\s*(?:<:|=)\s*(\w+)', text, re.M):
+        types[name] = types.get(base, str)
+
+    decls: Schema = {}
+    for name, params in re.findall(r'^\.decl\s+(\w+)\s*\(([^)]*)\)', text, re.M):
+        columns = [param.split(':') for param in params.split(',') if ':' in param]
+        decls[name] = ([column.strip() for column, _ in columns], [types.get(t.strip(), str) for _, t in columns])
+
+    schema: Schema = {}
+    for name, filename in re.findall(r'^\.input\s+(\w+)\s*\([^)]*filename="([^"]+)"', text, re.M):
+        if name in decls:
+            schema[os.path.splitext(filename)[0]] = decls[name]
+    return schema
+
+decompiler_schema: Optional[Schema] = None
+
+def get_decompiler_schema() -> Schema:
+    global decompiler_schema
+    if decompiler_schema is None:
+        decompiler_schema = parse_schema(DECOMPILER_IMPORTS_DL)
+    return decompiler_schema
+
+def to_column(values: Sequence[str], column_type: type) -> Sequence[Any]:
+    if column_type is int:
+        try:
+            return array('q', map(int, values))
+        except OverflowError:
+            return list(map(int, values))
+    if column_type is float:
+        return array('d', map(float, values))
+    # equal strings share memory
+    return list(map(sys.intern, values))
+
+class Relation:
+    """
+    A relation of the facts dir, stored by column: numeric columns as arrays, the rest as lists of strings.
+    Columns can be referred to by name or position.
+    """
+    def __init__(self, facts_dir: str, name: str, columns: Optional[List[str]] = None, types: Optional[List[type]] = None):
+        self.facts_dir = facts_dir
+        self.name = name
+        self.path = os.path.join(facts_dir, name + '.csv')
+        self.column_names = columns
+        self.types = types
+
+        self._columns: Optional[List[Sequence[Any]]] = None
+        self._indexes: Dict[int, Dict[Any, List[int]]] = {}
+
+    def columns(self) -> List[Sequence[Any]]:
+        if self._columns is None:
+            self._columns = self._load()
+        return self._columns
+
+    def _load(self) -> List[Sequence[Any]]:
+        stamp = file_stamp(self.path)
+        type_names = [t.__name__ for t in self.types] if self.types else None
+        cache_path = os.path.join(self.facts_dir, RELATION_CACHE_DIR, self.name + '.pickle')
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_stamp, cached_types, columns = pickle.load(f)
+            if cached_stamp == stamp and cached_types == type_names:
+                return columns
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+
+        with open_fact_file(self.path) as f:
+            rows = [line.split('\t') for line in f.read().splitlines()]
+
+        arity = len(self.types) if self.types else len(rows[0]) if rows else 0
+        types = self.types or [str] * arity
+        values = list(zip(*rows)) if rows else [()] * arity
+        columns = [to_column(column, column_type) for column, column_type in zip(values, types)]
+
+        tmp_path = f'{cache_path}.tmp{os.getpid()}'
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((stamp, type_names, columns), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # not worth failing the client over
+            pass
+        return columns
+
+    def column_index(self, column: Union[int, str]) -> int:
+        if isinstance(column, int):
+            return column
+        if self.column_names is None or column not in self.column_names:
+            raise KeyError(f"{self.name} has no column {column}")
+        return self.column_names.index(column)
+
+    def column(self, column: Union[int, str]) -> Sequence[Any]:
+        return self.columns()[self.column_index(column)]
+
+    def __len__(self) -> int:
+        columns = self.columns()
+        return len(columns[0]) if columns else 0
+
+    def __iter__(self) -> Iterator[Tuple[Any, ...]]:
+        return zip(*self.columns())
+
+    def row(self, i: int) -> Tuple[Any, ...]:
+        return tuple(column[i] for column in self.columns())
+
+    def index(self, column: Union[int, str]) -> Dict[Any, List[int]]:
+        """Hash index from the values of the column to the (positions of the) rows they appear in, built on first use."""
+        i = self.column_index(column)
+        if i not in self._indexes:
+            index: Dict[Any, List[int]] = {}
+            for row, value in enumerate(self.columns()[i]):
+                index.setdefault(value, []).append(row)
+            self._indexes[i] = index
+        return self._indexes[i]
+
+    def lookup(self, column: Union[int, str], value: Any) -> List[Tuple[Any, ...]]:
+        """The rows whose column has the given value."""
+        return [self.row(i) for i in self.index(column).get(value, [])]
+
+    def as_map(self, key: Union[int, str] = 0, value: Union[int, str] = 1) -> Dict[Any, Any]:
+        return dict(zip(self.column(key), self.column(value)))
+
+class Database:
+    """The relations of a facts dir, each loaded on first use."""
+    def __init__(self, facts_dir: str = '.'):
+        self.facts_dir = facts_dir
+        self.relations: Dict[str, Relation] = {}
+
+    def relation(self, name: str, columns: Optional[List[str]] = None, types: Optional[List[type]] = None) -> Relation:
+        """
+        Returns the relation of file <name>.csv, with the given column names and types.
+        These default to the declared ones for the decompiler outputs, and to unnamed str columns otherwise.
+        """
+        if name not in self.relations or (types is not None and self.relations[name].types != types):
+            declared_columns, declared_types = get_decompiler_schema().get(name, (None, None))
+            self.relations[name] = Relation(self.facts_dir, name, columns or declared_columns, types or declared_types)
+        return self.relations[name]
+
+    def __getitem__(self, name: str) -> Relation:
+        return self.relation(name)
+
+    def __contains__(self, name: str) -> bool:
+        return os.path.isfile(os.path.join(self.facts_dir, name + '.csv'))
+
+databases: Dict[str, Database] = {}
+
+def load_database(facts_dir: str = '.') -> Database:
+    """Returns the database of facts_dir, shared by all the code of a client."""
+    path = os.path.abspath(facts_dir)
+    if path not in databases:
+        databases[path] = Database(path)
+    return databases[path]
@@ -1,22 +1,27 @@
 #!/usr/bin/env python3
-from typing import Mapping, Set, TextIO
+from typing import Iterator, List, Mapping, Optional, Tuple
 
+import argparse
 import os
 import sys
+from multiprocessing import Pool
 
 # IT: Ugly hack; this can be avoided if we pull the script at the top level
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from clientlib.facts_to_cfg import Statement, Block, Function, construct_cfg, load_csv_map # type: ignore
+from clientlib.facts_to_cfg import Statement, Block, Function, construct_cfg # type: ignore
+from clientlib.relations import Database # type: ignore
 
+# 4 spaces
+INDENT_BASE = '    '
 
-def emit(s: str, out: TextIO, indent: int=0):
-    # 4 spaces
-    INDENT_BASE = '    '
+OUTPUT_FILE = 'contract.tac'
 
-    print(f'{indent*INDENT_BASE}{s}', file=out)
 
+def emit(s: str, out: List[str], indent: int=0):
+    out.append(f'{indent*INDENT_BASE}{s}')
 
-def emit_stmt(stmt: Statement, out: TextIO):
+
+def emit_stmt(stmt: Statement, tac_variable_value: Mapping[str, str], out: List[str]):
     def render_var(var: str):
         if var in tac_variable_value:
             return f"v{var.replace('0x', '')}({tac_variable_value[var]})"
@@ -32,7 +37,7 @@ def emit_stmt(stmt: Statement, out: TextIO):
         emit(f"{stmt.ident}: {stmt.op} {', '.join(uses)}", out, 1)
 
 
-def pretty_print_block(block: Block, visited: Set[str], out: TextIO):
+def emit_block(block: Block, tac_variable_value: Mapping[str, str], out: List[str]):
     emit(f"Begin block {block.ident}", out, 1)
 
     prev = [p.ident for p in block.predecessors]
@@ -42,34 +47,96 @@ def pretty_print_block(block: Block, visited: Set[str], out: TextIO):
     emit(f"=================================", out, 1)
 
     for stmt in block.statements:
-        emit_stmt(stmt, out)
+        emit_stmt(stmt, tac_variable_value, out)
 
     emit('', out)
 
-    for block in block.successors:
-        if block.ident not in visited:
-            visited.add(block.ident)
-            pretty_print_block(block, visited, out)
+
+def pretty_print_blocks(head_block: Block, tac_variable_value: Mapping[str, str], out: List[str]):
+    """
+    Emits the blocks reachable from head_block, depth-first, each block before its successors.
+    Uses a stack of successor iterators rather than recursion, as the CFGs of large functions
+    are deeper than Python's recursion limit.
+    """
+    emit_block(head_block, tac_variable_value, out)
+
+    visited = set()
+    stack: List[Iterator[Block]] = [iter(head_block.successors)]
+    while stack:
+        for block in stack[-1]:
+            if block.ident not in visited:
+                visited.add(block.ident)
+                emit_block(block, tac_variable_value, out)
+                stack.append(iter(block.successors))
+                break
+        else:
+            stack.pop()
 
 
-def pretty_print_tac(functions: Mapping[str, Function], out: TextIO):
+def pretty_print_tac(functions: Mapping[str, Function], tac_variable_value: Mapping[str, str]) -> List[str]:
+    out: List[str] = []
     for function in sorted(functions.values(), key=lambda x: x.ident):
         visibility = 'public' if function.is_public else 'private'
         emit(f"function {function.name}({', '.join(function.formals)}) {visibility} {{", out)
-        pretty_print_block(function.head_block, set(), out)
+        pretty_print_blocks(function.head_block, tac_variable_value, out)
 
         emit("}", out)
         emit("", out)
+    return out
 
 
-def main():
-    global tac_variable_value
-    tac_variable_value = load_csv_map('TAC_Variable_Value.csv')
+def visualize(out_dir: str = '.') -> None:
+    """Writes the pretty-printed TAC of the decompiler output in out_dir to its OUTPUT_FILE."""
+    os.chdir(out_dir)
+    tac_variable_value = Database()['TAC_Variable_Value'].as_map()
 
     _, functions,  = construct_cfg()
 
-    with open('contract.tac', 'w') as f:
-        pretty_print_tac(functions, f)
+    lines = pretty_print_tac(functions, tac_variable_value)
+    with open(OUTPUT_FILE, 'w') as f:
+        f.write('\n'.join(lines))
+        if lines:
+            f.write('\n')
+
+
+def visualize_task(out_dir: str) -> Tuple[str, Optional[str]]:
+    try:
+        visualize(out_dir)
+        return out_dir, None
+    except Exception as e:
+        return out_dir, f"{type(e).__name__}: {e}"
+
+
+def find_out_dirs(working_dir: str) -> List[str]:
+    """The output dirs (holding decompiler outputs) of the contracts under working_dir."""
+    return sorted(root for root, _, files in os.walk(working_dir) if 'TAC_Op.csv' in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Pretty-prints the decompiler output of a contract to {OUTPUT_FILE}.")
+    parser.add_argument("--batch",
+                        metavar="WORKING_DIR",
+                        help=f"Pretty-print all the contracts under WORKING_DIR (e.g. .temp), writing each {OUTPUT_FILE} to its output dir.")
+    parser.add_argument("-j",
+                        "--jobs",
+                        type=int,
+                        default=os.cpu_count(),
+                        help="The number of contracts pretty-printed at once in batch mode (the number of CPUs by default).")
+    args = parser.parse_args()
+
+    if not args.batch:
+        visualize()
+        return
+
+    out_dirs = find_out_dirs(os.path.abspath(args.batch))
+    failed = 0
+    with Pool(args.jobs) as pool:
+        for out_dir, error in pool.imap_unordered(visualize_task, out_dirs):
+            if error:
+                failed += 1
+                print(f"{out_dir}: {error}", file=sys.stderr)
+
+    print(f"Pretty-printed {len(out_dirs) - failed} of {len(out_dirs)} contracts.")
 
 
 if __name__ == "__main__":
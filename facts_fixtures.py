@@ -0,0 +1,81 @@
+"""Decompiler outputs shared by the tests of the Python client library: a small hand-written contract, and random ones"""
+
+import random
+from os.path import join
+from typing import Any, Iterable, List, Mapping, Tuple
+
+from clientlib.facts_to_cfg import Block, Function
+
+SEEDS = range(30)
+
+EXAMPLE_FACTS: Mapping[str, List[Tuple[str, ...]]] = {
+    # three functions: the fallback (public, with selector 0x0), a public function and a private one
+    'InFunction.csv': [('0x0', '0x0'), ('0x1a', '0x0'), ('0x2b', '0x0'), ('0x40', '0x10'), ('0x52', '0x10'), ('0x60', '0x20')],
+    'PublicFunction.csv': [('0x0', '0x0'), ('0x10', '0xa9059cbb')],
+    'HighLevelFunctionName.csv': [('0x0', '__function_selector__'), ('0x10', 'transfer(address,uint256)'), ('0x20', 'helper')],
+    'IRFunctionEntry.csv': [('0x60',), ('0x0',), ('0x40',)],
+    'FormalArgs.csv': [('0x10', '0x102', '1'), ('0x10', '0x101', '0'), ('0x20', '0x103', '0')],
+    # statements out of order, 0x1b_1 and 0x1b_0 have the same sort key
+    'TAC_Block.csv': [
+        ('0x4', '0x0'), ('0x0', '0x0'), ('0x2', '0x0'),
+        ('0x1b_1', '0x1a'), ('0x1a', '0x1a'), ('0x1b_0', '0x1a'),
+        ('S0x2b', '0x2b'), ('0x40', '0x40'), ('0x52', '0x52'), ('0x61', '0x60'), ('0x60', '0x60'),
+    ],
+    'TAC_Op.csv': [
+        ('0x0', 'CALLDATALOAD'), ('0x2', 'EQ'), ('0x4', 'JUMPI'), ('0x1a', 'ADD'), ('0x1b_1', 'CALLER'), ('0x1b_0', 'MUL'),
+        ('S0x2b', 'STOP'), ('0x40', 'SSTORE'), ('0x52', 'JUMP'), ('0x60', 'ADD'), ('0x61', 'RETURNPRIVATE'),
+    ],
+    'TAC_Def.csv': [('0x0', '0x100', '0'), ('0x2', '0x104', '0'), ('0x1a', '0x105', '0'), ('0x1b_1', '0x106', '0'), ('0x1b_0', '0x107', '0'), ('0x60', '0x108', '0')],
+    'TAC_Use.csv': [
+        ('0x2', '0x100', '1'), ('0x2', '0x109', '0'), ('0x4', '0x104', '0'), ('0x1a', '0x100', '0'), ('0x1a', '0x100', '1'),
+        ('0x1b_0', '0x105', '0'), ('0x40', '0x102', '1'), ('0x40', '0x101', '0'), ('0x60', '0x103', '0'), ('0x60', '0x103', '1'), ('0x61', '0x108', '0'),
+    ],
+    # 0x1a appears as a source first, a loop between 0x40 and 0x52
+    'LocalBlockEdge.csv': [('0x1a', '0x2b'), ('0x0', '0x1a'), ('0x0', '0x2b'), ('0x40', '0x52'), ('0x52', '0x40')],
+    'TAC_Variable_Value.csv': [('0x109', '0xa9059cbb')],
+}
+"""The decompiler outputs of a small contract."""
+
+
+def write_facts(facts_dir: str, facts: Mapping[str, Iterable[Tuple[Any, ...]]]) -> None:
+    for fname, rows in facts.items():
+        with open(join(facts_dir, fname), 'w') as f:
+            f.writelines('\t'.join(map(str, row)) + '\n' for row in rows)
+
+
+def write_random_facts(facts_dir: str, seed: int) -> None:
+    """Writes the facts of a random CFG, shuffled, with statements out of order in their blocks and duplicate stmt_sort_keys"""
+    rng = random.Random(seed)
+
+    def write(fname: str, rows: List[Tuple[Any, ...]]) -> None:
+        rng.shuffle(rows)
+        write_facts(facts_dir, {fname: rows})
+
+    funcs = ['0x0'] + [hex(0x1000 + i) for i in range(rng.randint(1, 8))]
+    in_function = [(f'0x{rng.randrange(1 << 20):x}B{i}', func) for i, func in enumerate(f for f in funcs for _ in range(rng.randint(1, 15)))]
+    blocks = [block for block, _ in in_function]
+    write('InFunction.csv', list(in_function))
+    write('PublicFunction.csv', [(f, '0x0' if f == '0x0' else hex(rng.randrange(1 << 32))) for f in funcs if f == '0x0' or rng.random() < .6])
+    write('HighLevelFunctionName.csv', [(f, f'fn{f}()') for f in funcs])
+    write('IRFunctionEntry.csv', [(next(block for block, func in in_function if func == f),) for f in funcs])
+    write('FormalArgs.csv', [(f, f'0x{rng.randrange(1 << 16):x}', pos) for f in funcs for pos in range(rng.randint(0, 4))])
+
+    stmts = []
+    for block in blocks:
+        for _ in range(rng.randint(0, 10)):
+            stmt = f'0x{rng.randrange(1 << 12):x}' + ('' if rng.random() < .5 else f'_{rng.randint(0, 3)}') + f'S{len(stmts)}'
+            stmts.append(('S' + stmt if rng.random() < .3 else stmt, block))
+    write('TAC_Block.csv', list(stmts))
+    write('TAC_Op.csv', [(stmt, rng.choice(['ADD', 'SSTORE', 'JUMP', 'CALL'])) for stmt, _ in stmts])
+    write('TAC_Use.csv', [(stmt, f'0x{rng.randrange(300):x}', pos) for stmt, _ in stmts for pos in range(rng.randint(0, 4))])
+    write('TAC_Def.csv', [(stmt, f'0x{rng.randrange(300):x}', 0) for stmt, _ in stmts if rng.random() < .6])
+    write('LocalBlockEdge.csv', list({(rng.choice(blocks), rng.choice(blocks)) for _ in range(len(blocks) * 2)}))
+    write('TAC_Variable_Value.csv', [(f'0x{var:x}', f'0x{rng.randrange(1 << 64):x}') for var in range(300) if rng.random() < .3])
+
+
+def dump_cfg(cfg: Tuple[Mapping[str, Block], Mapping[str, Function]]) -> Tuple[Any, Any]:
+    blocks, functions = cfg
+    return (
+        {ident: ([tuple(s) for s in block.statements], [b.ident for b in block.predecessors], [b.ident for b in block.successors]) for ident, block in blocks.items()},
+        [(ident, f.name, f.formals, f.is_public, f.head_block.ident) for ident, f in functions.items()]
+    )
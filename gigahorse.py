@@ -3,20 +3,33 @@
 ## IMPORTS
 
 import argparse
+import hashlib
 import json
 import logging
 import shutil
+import signal
+import socketserver
 import sys
+import threading
 import time
 from collections import defaultdict
-from multiprocessing import Process, SimpleQueue, Manager, Event, cpu_count
-from typing import List, Tuple, Any, Dict, DefaultDict
+from multiprocessing import Event, Process, Pool, SimpleQueue, active_children, cpu_count
+from multiprocessing.connection import wait
+from queue import Queue, Empty
+from typing import List, Tuple, Any, Dict, DefaultDict, Optional, Iterator, TextIO, Callable, Set, cast
 from os.path import join, getsize
 import os
 
 # Local project imports
-from src.common import GIGAHORSE_DIR, DEFAULT_SOUFFLE_BIN, log
-from src.runners import get_souffle_executable_path, compile_datalog, AbstractFactGenerator, DecompilerFactGenerator, CustomFactGenerator, MixedFactGenerator, AnalysisExecutor, TimeoutException
+from src.common import GIGAHORSE_DIR, DEFAULT_SOUFFLE_BIN, log, open_fact_file, fact_file_is_empty, is_json_lines
+from src.decomp_cache import DecompilationCache, hash_file
+from src.client_manifest import CLIENT_MANIFEST_FILE
+from src.compile_cache import evict_compile_cache
+from src.results_summary import ResultsSummary
+from src.work_archive import ARCHIVE_MODES, DEFAULT_ARCHIVE_KEEP, WorkArchive, shard_prefix
+from src.exporter import normalize_bytecode
+from src.scheduling import SCHEDULING_POLICIES, FallbackPredictor, MemoryAdmission, ThreadBudget, predict_costs, order_by_cost, schedule_report, get_physical_memory, group_duplicate_contracts
+from src.runners import get_souffle_executable_path, get_compile_cache_key, compile_datalog, AbstractFactGenerator, DecompilerFactGenerator, CustomFactGenerator, MixedFactGenerator, AnalysisExecutor, TimeoutException
 
 ## Constants
 
@@ -25,22 +38,53 @@ DEFAULT_TAC_GEN_CONFIG_FILE = join(GIGAHORSE_DIR, 'tac_gen_config.json')
 DEFAULT_RESULTS_FILE = 'results.json'
 """File to write results to by default."""
 
+RESULTS_STREAM_SUFFIX = '.jsonl'
+"""Suffix of the JSON Lines file results are streamed to while the analysis is running."""
+
 DEFAULT_INLINER_DL = join(GIGAHORSE_DIR, 'clientlib/function_inliner.dl')
 """IR helping inliner specification file."""
 
 DEFAULT_INLINER_ROUNDS = 6
+"""Maximum number of inliner rounds, fewer are run if a round leaves nothing more to inline."""
+
+INLINER_PENDING_FILE = 'NeedsMoreInlining.csv'
+"""Inliner output listing the functions left to inline by a subsequent round."""
 
 DEFAULT_CACHE_DIR = join(GIGAHORSE_DIR, 'cache')
 
+DEFAULT_DECOMP_CACHE_SIZE = 20
+"""Default size limit (in GB) of the decompilation cache."""
+
+DEFAULT_COMPILE_CACHE_SIZE = 10
+"""Default size limit (in GB) of the compiled executables kept in the cache dir."""
+
 TEMP_WORKING_DIR = ".temp"
 """Scratch working directory."""
 
+SERVER_REQUESTS_DIR = "requests"
+"""Subdirectory of the working directory where contracts submitted to the server are written."""
+
+DEFAULT_SERVER_SOCKET = "gigahorse.sock"
+"""Default Unix socket the server listens on."""
+
 DEFAULT_TIMEOUT = 120
 """Default time before killing analysis of a contract."""
 
 DEFAULT_MINIMUM_CLIENT_TIME = 10
 """Default minimum time to allow each client to work."""
 
+DEFAULT_MEMORY_BUDGET = get_physical_memory() * 0.9 / 1_000_000_000
+"""Memory (in GB) the analyses running at once are allowed to use."""
+
+MEMORY_POLL_INTERVAL = 1.0
+"""How often (in seconds) to recheck memory use while delaying a contract."""
+
+WORKER_POLL_INTERVAL = 1.0
+"""How often (in seconds) to check that the workers analyzing contracts are still alive, while waiting for results."""
+
+DEFAULT_BATCH_CONTRACT_SIZE = 2000
+"""Bytecode size (in bytes) up to which contracts are batched when using --batch_small_contracts."""
+
 DEFAULT_NUM_JOBS = max(int(cpu_count() * 0.9), 1)
 """Bugfix for one core systems."""
 
@@ -55,7 +99,7 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "filepath",
     metavar = "DIR",
-    nargs="+",
+    nargs="*",
     help="The location to grab contracts from (as bytecode files). Accepts both filenames and directories. All contract filenames should be unique."
 )
 
@@ -87,6 +131,13 @@ parser.add_argument("-r",
                     metavar="FILE",
                     help="the location to write the results.")
 
+parser.add_argument("--results_format",
+                    choices=["json", "jsonl"],
+                    default="json",
+                    help="Format of the results file. Results are always appended to a JSON Lines file as each contract finishes; "
+                         "'json' (the default) additionally writes the legacy results array to the results file at the end of the run, "
+                         "'jsonl' uses the results file itself as the JSON Lines stream.")
+
 parser.add_argument("-w",
                     "--working_dir",
                     nargs="?",
@@ -95,6 +146,33 @@ parser.add_argument("-w",
                     metavar="DIR",
                     help="the location to were temporary files are placed.")
 
+parser.add_argument("--scratch_dir",
+                    metavar="DIR",
+                    help="Analyze each contract in a directory under DIR, ideally a memory-backed (tmpfs) mount such as /dev/shm. "
+                         "Facts are then handed between the decompiler, the inliner and the clients without touching the disk, "
+                         "the contract's directory is moved to the working directory once its analysis is complete.")
+
+parser.add_argument("--shard_working_dir",
+                    action="store_true",
+                    default=False,
+                    help="Place the directory of each contract under a subdirectory of the working dir named after a hash prefix "
+                         "of the contract's name, keeping directory listings short for large batches.")
+
+parser.add_argument("--archive_working_dirs",
+                    choices=ARCHIVE_MODES,
+                    nargs="?",
+                    default=None,
+                    const="contract",
+                    help="Compact the directory of each contract once its analysis is complete into a compressed archive, "
+                         "holding only the files matching --archive_keep: a .tar.gz file per contract (the default), "
+                         "or one shard file per hash prefix. --rerun_clients unpacks the archives on demand.")
+
+parser.add_argument("--archive_keep",
+                    default=DEFAULT_ARCHIVE_KEEP,
+                    metavar="PATTERNS",
+                    help="Comma-separated glob patterns, relative to a contract's directory, of the files kept by --archive_working_dirs. "
+                         "Patterns starting with '!' exclude files. Files the kept symlinks point to are kept too. (default: %(default)s)")
+
 parser.add_argument('--cache_dir',
                     nargs="?",
                     default=DEFAULT_CACHE_DIR,
@@ -103,6 +181,45 @@ parser.add_argument('--cache_dir',
                     help="the location to were temporary files are placed.")
 
 
+parser.add_argument("--compile_cache_size",
+                    type=float,
+                    default=DEFAULT_COMPILE_CACHE_SIZE,
+                    metavar="GB",
+                    help="Size limit of the compiled souffle executables kept in the cache dir (%(default)s GB by default), "
+                         "least recently used executables not in use are removed beyond it.")
+
+parser.add_argument("--enable_decomp_cache",
+                    action="store_true",
+                    default=False,
+                    help="Reuse the decompiler output of previously decompiled contracts with identical bytecode "
+                         "(and decompiler configuration). Outputs are kept in the cache dir.")
+
+parser.add_argument("--decomp_cache_size",
+                    type=int,
+                    nargs="?",
+                    default=DEFAULT_DECOMP_CACHE_SIZE,
+                    const=DEFAULT_DECOMP_CACHE_SIZE,
+                    metavar="GB",
+                    help="Size limit of the decompilation cache, least recently used entries are evicted at the end of each run.")
+
+parser.add_argument("--dedup_contracts",
+                    action="store_true",
+                    default=False,
+                    help="Analyze contracts with identical bytecode only once, replicating the results to all of them.")
+
+parser.add_argument("--dedup_ignore_metadata",
+                    action="store_true",
+                    default=False,
+                    help="When deduplicating contracts, ignore the compiler metadata appended to the bytecode by solc/vyper.")
+
+parser.add_argument("--server",
+                    nargs="?",
+                    default=None,
+                    const=DEFAULT_SERVER_SOCKET,
+                    metavar="SOCKET",
+                    help="Instead of analyzing the given contracts, keep running and analyze the contracts submitted over "
+                         "the given Unix socket. Requests and responses are JSON objects, one per line.")
+
 parser.add_argument("-j",
                     "--jobs",
                     type=int,
@@ -112,6 +229,61 @@ parser.add_argument("-j",
                     metavar="NUM",
                     help="The number of subprocesses to run at once.")
 
+parser.add_argument("--thread_budget",
+                    type=int,
+                    nargs="?",
+                    default=None,
+                    const=cpu_count(),
+                    metavar="NUM",
+                    help="Share NUM threads (the number of cores by default) among the Souffle processes of all workers: "
+                         "threads left unused, e.g. once fewer contracts than workers remain at the end of a batch, "
+                         "are given to the Souffle processes started next (using souffle -j).")
+
+parser.add_argument("--client_jobs",
+                    type=int,
+                    default=1,
+                    metavar="NUM",
+                    help="The number of Souffle clients of a contract to run at once (1 by default). "
+                         "Clients reading the outputs of earlier clients (or writing files these read), as declared by their .input and .output directives, "
+                         "wait for them. Script clients still run one after the other, after the Souffle clients.")
+
+parser.add_argument("--schedule",
+                    choices=SCHEDULING_POLICIES,
+                    default="listing",
+                    help="The order in which contracts are analyzed: directory listing order (default), largest bytecode first, "
+                         "or most expensive first, as predicted using the results of a previous run (see --previous_results).")
+
+parser.add_argument("--previous_results",
+                    nargs="?",
+                    default=None,
+                    metavar="FILE",
+                    help="Results file (json or jsonl) of a previous run, used to predict analysis costs "
+                         "for --schedule predicted_cost and --adaptive_fallback.")
+
+parser.add_argument("--adaptive_fallback",
+                    action="store_true",
+                    default=False,
+                    help="Decompile contracts likely to time out with the default decompiler config using the scalable fallback config right away. "
+                         "Predicted from their bytecode features, using the contracts that needed the fallback in --previous_results.")
+
+parser.add_argument("--batch_small_contracts",
+                    type=int,
+                    nargs="?",
+                    default=None,
+                    const=DEFAULT_BATCH_CONTRACT_SIZE,
+                    metavar="BYTES",
+                    help="Analyze contracts of up to BYTES bytes (%(const)s by default) using Souffle programs kept loaded by each worker, "
+                         "avoiding the start-up cost of the decompiler, inliner and clients per contract. Not available in interpreted mode.")
+
+parser.add_argument("--memory_budget",
+                    type=float,
+                    nargs="?",
+                    default=DEFAULT_MEMORY_BUDGET,
+                    const=DEFAULT_MEMORY_BUDGET,
+                    metavar="GB",
+                    help="Delay starting new contracts while the running analyses use close to this much memory "
+                         "(90%% of physical memory by default, 0 disables).")
+
 parser.add_argument("-k",
                     "--skip",
                     type=int,
@@ -153,6 +325,12 @@ parser.add_argument("--enable_limitsize",
                         )
                     )
 
+parser.add_argument("--compress_facts",
+                    action="store_true",
+                    default=False,
+                    help="Write the decompiler outputs (TAC_Op.csv, TAC_Use.csv, etc.) gzip-compressed, keeping their names, "
+                         "to reduce the size of the working dir. Requires souffle built with zlib.")
+
 parser.add_argument("--disable_inline",
                     action="store_true",
                     default=False,
@@ -168,7 +346,13 @@ parser.add_argument("-q",
 parser.add_argument("--rerun_clients",
                     action="store_true",
                     default=False,
-                    help="Rerun client analyses. Only attempts to decompile if it hasn't tried in the current working dir.")
+                    help="Rerun client analyses. Only attempts to decompile if it hasn't tried in the current working dir. "
+                         "Clients whose executable (or script) and inputs are unchanged since they last ran on a contract are skipped, keeping their earlier outputs.")
+
+parser.add_argument("--rerun_all_clients",
+                    action="store_true",
+                    default=False,
+                    help="With --rerun_clients, rerun all clients, including the unchanged ones.")
 
 parser.add_argument("--restart",
                     action="store_true",
@@ -191,6 +375,12 @@ parser.add_argument("-i",
                     default=False,
                     help="Run souffle in interpreted mode.")
 
+parser.add_argument("--analyze_while_compiling",
+                    action="store_true",
+                    default=False,
+                    help="Start analyzing contracts right away, running the souffle programs still being compiled in interpreted mode. "
+                         "Workers switch to the compiled executables as soon as they are ready.")
+
 parser.add_argument(
     "--tac_gen_config",
     nargs="?",
@@ -199,20 +389,78 @@ parser.add_argument(
     help="the location of the TAC generation configuration file",
 )
 
+ContractResult = Tuple[str, List[str], List[str], Dict[str, Any]]
+"""(filename, files, meta, analytics) quadruple produced for each analyzed contract."""
+
 def get_working_dir(contract_name: str) -> str:
-    return join(os.path.abspath(args.working_dir), os.path.split(contract_name)[1].split('.')[0])
+    name = os.path.split(contract_name)[1].split('.')[0]
+    if args.shard_working_dir:
+        return join(os.path.abspath(args.working_dir), shard_prefix(name), name)
+    return join(os.path.abspath(args.working_dir), name)
+
+def get_work_archive() -> Optional[WorkArchive]:
+    if not args.archive_working_dirs:
+        return None
+    return WorkArchive(args.working_dir, args.archive_working_dirs, [p.strip() for p in args.archive_keep.split(',') if p.strip()])
+
+def working_dir_exists(contract_name: str) -> bool:
+    """Whether the contract has a working directory, possibly archived."""
+    working_dir = get_working_dir(contract_name)
+    work_archive = get_work_archive()
+    return os.path.isdir(working_dir) or (work_archive is not None and work_archive.exists(working_dir))
+
+def remove_working_dir(contract_name: str) -> None:
+    working_dir = get_working_dir(contract_name)
+    shutil.rmtree(working_dir, ignore_errors=True)
+    work_archive = get_work_archive()
+    if work_archive:
+        work_archive.remove(working_dir)
 
 def prepare_working_dir(contract_name: str) -> Tuple[bool, str, str]:
-    newdir = get_working_dir(contract_name)
-    out_dir = join(newdir, 'out')
+    """
+    Returns whether the contract's working directory already exists, along with
+    the directory (and its out subdirectory) its analysis should use: the working
+    directory itself, or a fresh directory under the scratch dir (see finish_working_dir).
+    """
+    final_dir = newdir = get_working_dir(contract_name)
 
     if os.path.isdir(newdir):
-        return True, newdir, out_dir
+        return True, newdir, join(newdir, 'out')
+
+    work_archive = get_work_archive()
+    archived = work_archive is not None and work_archive.exists(final_dir)
+    if archived and not args.rerun_clients:
+        # nothing to do for the contract, no need to unpack it
+        return True, newdir, join(newdir, 'out')
 
     # recreate dir
+    if args.scratch_dir:
+        # a worker analyzes one contract at a time, the pid keeps concurrent runs apart
+        newdir = join(os.path.abspath(args.scratch_dir), f'{os.getpid()}_{os.path.basename(newdir)}')
+        # leftover of an interrupted run
+        shutil.rmtree(newdir, ignore_errors=True)
     os.makedirs(newdir)
-    os.makedirs(out_dir)
-    return False, newdir, out_dir
+    out_dir = join(newdir, 'out')
+    if work_archive is not None and archived:
+        archived = work_archive.restore(final_dir, newdir)
+    os.makedirs(out_dir, exist_ok=True)
+    return archived, newdir, out_dir
+
+def finish_working_dir(contract_name: str, work_dir: str) -> None:
+    """
+    Moves a contract's directory from the scratch dir to its working directory,
+    or archives it with --archive_working_dirs, where it is looked up by later runs
+    (e.g. using --rerun_clients).
+    """
+    final_dir = get_working_dir(contract_name)
+    work_archive = get_work_archive()
+    if work_archive:
+        if os.path.isdir(work_dir):
+            work_archive.store(final_dir, work_dir)
+    elif work_dir != final_dir and os.path.isdir(work_dir):
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.makedirs(os.path.dirname(final_dir), exist_ok=True)
+        shutil.move(work_dir, final_dir)
 
 def get_souffle_macros() -> str:
     souffle_macros = f'GIGAHORSE_DIR={GIGAHORSE_DIR} {args.souffle_macros}'.strip()
@@ -226,22 +474,135 @@ def get_souffle_macros() -> str:
     if args.early_cloning:
         souffle_macros += ' BLOCK_CLONING=HeuristicBlockCloner'
 
+    if args.compress_facts:
+        souffle_macros += ' COMPRESS_FACTS='
+
     return souffle_macros
 
-def analyze_contract(index: int, contract_filename: str, result_queue, fact_generator: AbstractFactGenerator, souffle_clients: List[str], other_clients: List[str]) -> None:
+def get_schedule(contracts: List[str]) -> List[int]:
+    """
+    Returns the indices of contracts, in the order they are to be analyzed
+    according to the --schedule policy.
     """
-    Perform static analysis on a contract, storing the result in the queue.
-    This is a worker function to be passed to a subprocess.
+    if args.schedule == 'listing':
+        return list(range(len(contracts)))
+
+    # bytecode files are hex, with two characters per byte
+    sizes = [getsize(contract) // 2 for contract in contracts]
+    if args.schedule == 'largest_first':
+        return order_by_cost([float(size) for size in sizes])
+
+    history: Dict[str, float] = {}
+    history_sizes: Dict[str, int] = {}
+    if args.previous_results:
+        for name, _, meta, analytics in load_results(args.previous_results):
+            if 'TIMEOUT' in meta:
+                history[name] = args.timeout_secs
+            elif 'bytecode_size' in analytics:
+                history[name] = sum(analytics[k] for k in ['disassemble_time', 'decomp_time', 'inline_time', 'client_time'])
+                history_sizes[name] = analytics['bytecode_size']
+    else:
+        log("[WARNING]: No --previous_results given, predicting analysis times from bytecode sizes only.")
+
+    names = [os.path.split(contract)[1] for contract in contracts]
+    return order_by_cost(predict_costs(names, sizes, history, history_sizes))
+
+def get_program_hash(souffle_file: str) -> str:
+    """
+    Identifies the executable of a souffle program by its compile cache key, which is known before
+    the executable is ready (see --analyze_while_compiling) and, thanks to the build manifests,
+    usually costs a few stat calls rather than hashing the executable.
+    With --reuse_datalog_bin, the executable may not match the current source and is hashed instead.
+    """
+    if args.reuse_datalog_bin and not args.interpreted:
+        return hash_file(get_souffle_executable_path(args.cache_dir, souffle_file))
+    return get_compile_cache_key(souffle_file, args.souffle_bin, args.cache_dir, get_souffle_macros())
+
+def get_decomp_cache(fact_generator: AbstractFactGenerator) -> Optional[DecompilationCache]:
+    """
+    Sets up the decompilation cache, keyed on everything (other than the bytecode)
+    that can influence the decompiler output. Needs the souffle executables to be compiled.
+    """
+    if not args.enable_decomp_cache:
+        return None
+
+    if args.interpreted or not isinstance(fact_generator, DecompilerFactGenerator):
+        log("[WARNING]: The decompilation cache is only supported for compiled, default decompilation. Disabling it.")
+        return None
+
+    datalog_files = fact_generator.get_datalog_files()
+    if not args.disable_inline:
+        datalog_files.append(DEFAULT_INLINER_DL)
+
+    config = [get_program_hash(file) for file in datalog_files]
+    config += [hash_file(join(GIGAHORSE_DIR, 'src', module)) for module in ['blockparse.py', 'basicblock.py', 'exporter.py', 'opcodes.py']]
+    config += fact_generator.other_pre_clients
+    config += [
+        get_souffle_macros(),
+        f'context_depth={args.context_depth}',
+        f'disable_inline={args.disable_inline}',
+        f'disable_scalable_fallback={args.disable_scalable_fallback}'
+    ]
+
+    return DecompilationCache(args.cache_dir, args.decomp_cache_size * 1_000_000_000, config)
+
+def get_client_hashes(souffle_clients: List[str], other_clients: List[str]) -> Dict[str, str]:
+    """
+    Hashes identifying the current version of each client, used to only rerun the clients
+    that changed since they last ran on a contract.
+    """
+    hashes = {}
+    for client in souffle_clients:
+        # in interpreted mode too, the key identifies the preprocessed source
+        hashes[client] = get_program_hash(client)
+
+    for client in other_clients:
+        hasher = hashlib.sha256(client.encode('utf-8'))
+        script = join(os.getcwd(), client.split(' ')[0])
+        if os.path.isfile(script):
+            hasher.update(hash_file(script).encode('utf-8'))
+        hashes[client] = hasher.hexdigest()
+
+    return hashes
+
+def run_inliner(analysis_executor: AnalysisExecutor, out_dir: str, start_time: float) -> Tuple[List[float], bool]:
+    """
+    Runs inliner rounds on the decompiler output in out_dir, until a round leaves
+    nothing more to inline, up to DEFAULT_INLINER_ROUNDS rounds.
+    Returns the time each round took, and whether the last round timed out.
+    """
+    round_times = []
+    for _ in range(DEFAULT_INLINER_ROUNDS):
+        round_start = time.time()
+        # ignore errors here, a timed out round leaves nothing for the next ones
+        timeouts, _ = analysis_executor.run_clients([DEFAULT_INLINER_DL], [], out_dir, out_dir, start_time)
+        round_times.append(time.time() - round_start)
+
+        pending_file = join(out_dir, INLINER_PENDING_FILE)
+        if timeouts or not os.path.exists(pending_file) or getsize(pending_file) == 0:
+            break
+
+    return round_times, bool(timeouts)
+
+def analyze_contract(index: int, contract_filename: str, fact_generator: AbstractFactGenerator, souffle_clients: List[str], other_clients: List[str], decomp_cache: Optional[DecompilationCache] = None) -> Optional[ContractResult]:
+    """
+    Perform static analysis on a contract, returning the result.
+    This is a worker function, executed in one of the pool's worker processes.
 
     Args:
         index: the number of the particular contract being analyzed
         contract_filename: the absolute path of the contract bytecode file to process
-        result_queue: a multiprocessing queue in which to store the analysis results
         fact_generator: the fact generator to be used (decompiler is used by default)
         souffle_clients: list of souffle datalog clients
         other_clients: list of other clients (language agnostic)
+        decomp_cache: if given, decompiler outputs are looked up in and added to this cache
+
+    Returns:
+        A (filename, files, meta, analytics) quadruple, or None if the contract was already analyzed.
     """
     analysis_executor = fact_generator.analysis_executor
+    analysis_executor.reset_usage()
+    work_dir: Optional[str] = None
     try:
         # prepare working directory
         exists, work_dir, out_dir = prepare_working_dir(contract_filename)
@@ -251,6 +612,9 @@ def analyze_contract(index: int, contract_filename: str, result_queue, fact_gene
         with open(contract_filename) as file:
             bytecode = file.read().strip()
 
+        analysis_executor.use_batch_programs = args.batch_small_contracts is not None and (len(bytecode) - 2)//2 <= args.batch_small_contracts
+
+        cached = None
         if exists:
             disassemble_time = 0.0
             decomp_time = 0.0
@@ -258,31 +622,55 @@ def analyze_contract(index: int, contract_filename: str, result_queue, fact_gene
             decompiler_config = None
         else:
             start_time = time.time()
-            disassemble_time, decomp_time, decompiler_config = fact_generator.generate_facts(contract_filename, work_dir, out_dir)
+            if decomp_cache:
+                metadata_file = f"{contract_filename[:-4]}_metadata.json"
+                metadata = open(metadata_file).read() if os.path.exists(metadata_file) else ''
+                cache_key = decomp_cache.key(bytecode, metadata)
+                cached = decomp_cache.restore(cache_key, work_dir)
+
+            if cached:
+                disassemble_time = 0.0
+                decomp_time = time.time() - start_time
+                inline_time = 0.0
+                decompiler_config = cached['decompiler_config']
+            else:
+                disassemble_time, decomp_time, decompiler_config = fact_generator.generate_facts(contract_filename, work_dir, out_dir, analytics)
+
+                inline_start = time.time()
+                if not args.disable_inline:
+                    round_times, inline_timed_out = run_inliner(analysis_executor, out_dir, start_time)
+                    analytics['inline_rounds'] = len(round_times)
+                    analytics['inline_round_times'] = round_times
+                    analytics['inline_timeouts'] = int(inline_timed_out)
 
-            inline_start = time.time()
-            if not args.disable_inline:
-                # ignore timeouts and errors here
-                analysis_executor.run_clients([DEFAULT_INLINER_DL]*DEFAULT_INLINER_ROUNDS, [], out_dir, out_dir, start_time)
+                inline_time = time.time() - inline_start
 
-            inline_time = time.time() - inline_start
+                if decomp_cache:
+                    decomp_cache.store(cache_key, work_dir, decompiler_config, analytics)
 
             # end decompilation
         if exists and not args.rerun_clients:
-            return
+            return None
 
         # Do not attempt to decompile for earlier timeouts when using --rerun_clients
         if args.rerun_clients and not fact_generator.decomp_out_produced(out_dir):
             raise TimeoutException()
 
         client_start = time.time()
-        timeouts, errors = analysis_executor.run_clients(souffle_clients, other_clients, out_dir, out_dir, client_start)
+        client_times: Dict[str, float] = {}
+        skipped: List[str] = []
+        if args.rerun_clients or os.path.isfile(join(out_dir, CLIENT_MANIFEST_FILE)):
+            timeouts, errors, skipped = analysis_executor.run_clients_incremental(souffle_clients, other_clients, out_dir, client_start, client_times,
+                                                                                  reuse=exists and not args.rerun_all_clients)
+        else:
+            # the manifest is only used to skip unchanged clients when rerunning them
+            timeouts, errors = analysis_executor.run_clients(souffle_clients, other_clients, out_dir, out_dir, client_start, client_times=client_times)
 
         # Collect the results and put them in the result queue
         files = []
         for fname in os.listdir(out_dir):
             fpath = join(out_dir, fname)
-            if getsize(fpath) != 0:
+            if os.path.isfile(fpath) and fname != CLIENT_MANIFEST_FILE and not fact_file_is_empty(fpath):
                 files.append(fname.split(".")[0])
         meta = []
         # Decompile + Analysis time
@@ -292,8 +680,17 @@ def analyze_contract(index: int, contract_filename: str, result_queue, fact_gene
         analytics['client_time'] = time.time() - client_start
         analytics['errors'] = len(errors)
         analytics['client_timeouts'] = len(timeouts)
+        analytics['client_times'] = client_times
+        analytics['timed_out_clients'] = [os.path.basename(client.split(' ')[0]) for client in timeouts]
+        analytics['skipped_clients'] = [os.path.basename(client.split(' ')[0]) for client in skipped]
         analytics['bytecode_size'] = (len(bytecode) - 2)//2
         analytics['decompiler_config'] = decompiler_config
+        analytics['peak_memory'] = analysis_executor.peak_rss * 1024
+        analytics['stage_usage'] = analysis_executor.stage_usage
+        if args.analyze_while_compiling:
+            analytics['interpreted_programs'] = analysis_executor.interpreted_programs
+        if decomp_cache:
+            analytics['decomp_cache_hit'] = int(cached is not None)
         contract_msg = "{}: {:.36} completed in {:.2f} + {:.2f} + {:.2f} + {:.2f} secs.".format(
             index, contract_name, analytics['disassemble_time'],
             analytics['decomp_time'], analytics['inline_time'], analytics['client_time']
@@ -309,13 +706,64 @@ def analyze_contract(index: int, contract_filename: str, result_queue, fact_gene
 
         get_gigahorse_analytics(out_dir, analytics)
 
-        result_queue.put((contract_name, files, meta, analytics))
+        return contract_name, files, meta, analytics
     except TimeoutException as e:
-        result_queue.put((contract_name, [], ["TIMEOUT"], {}))
         log("{} timed out.".format(contract_name))
+        # timeouts are often due to memory pressure, keep track of it
+        return contract_name, [], ["TIMEOUT"], {'peak_memory': analysis_executor.peak_rss * 1024, 'stage_usage': analysis_executor.stage_usage}
     except Exception as e:
         log(f"Error: {e}")
-        result_queue.put((contract_name, [], ["ERROR"], {}))
+        return contract_name, [], ["ERROR"], {}
+    finally:
+        if work_dir is not None:
+            finish_working_dir(contract_filename, work_dir)
+
+# Per-worker state, set once by init_worker when each pool process starts
+worker_fact_generator: AbstractFactGenerator
+worker_souffle_clients: List[str]
+worker_other_clients: List[str]
+worker_decomp_cache: Optional[DecompilationCache]
+worker_started_queue: Optional[SimpleQueue]
+
+def init_worker(fact_generator: AbstractFactGenerator, souffle_clients: List[str], other_clients: List[str], decomp_cache: Optional[DecompilationCache],
+                started_queue: Optional[SimpleQueue] = None) -> None:
+    """
+    Pool initializer. Stores the batch-wide arguments in the (long-lived) worker
+    so they do not have to be pickled and sent along with every contract.
+    If given, the (index, worker pid) of each contract is put in started_queue as the worker starts it.
+    """
+    global worker_fact_generator, worker_souffle_clients, worker_other_clients, worker_decomp_cache, worker_started_queue
+    # Ctrl-C is handled by the coordinator, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # the summary of the results is logged by the coordinator
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    worker_fact_generator = fact_generator
+    worker_souffle_clients = souffle_clients
+    worker_other_clients = other_clients
+    worker_decomp_cache = decomp_cache
+    worker_started_queue = started_queue
+
+def analyze_contract_task(index: int, contract_filename: str) -> Optional[ContractResult]:
+    if worker_started_queue is not None:
+        worker_started_queue.put((index, os.getpid()))
+    thread_budget = worker_fact_generator.analysis_executor.thread_budget
+    if thread_budget:
+        thread_budget.contract_started()
+    try:
+        return analyze_contract(index, contract_filename, worker_fact_generator, worker_souffle_clients, worker_other_clients, worker_decomp_cache)
+    finally:
+        if thread_budget:
+            thread_budget.contract_finished()
+
+def serve_contract_task(index: int, contract_filename: str, bytecode: str) -> Optional[ContractResult]:
+    # Contracts submitted to the server were not seen by the fact generator before the workers started
+    if not worker_fact_generator.match_pattern(contract_filename):
+        raise ValueError(f"{os.path.split(contract_filename)[1]} is not handled by any fact generator")
+    # analyzed from scratch, even if submitted before
+    remove_working_dir(contract_filename)
+    with open(contract_filename, 'w') as f:
+        f.write(bytecode)
+    return analyze_contract_task(index, contract_filename)
 
 
 def get_gigahorse_analytics(out_dir: str, analytics: dict) -> None:
@@ -324,17 +772,19 @@ def get_gigahorse_analytics(out_dir: str, analytics: dict) -> None:
         if not (fname.startswith('Analytics_') or fname.startswith('Metric_')):
             continue
         stat_name = fname.split(".")[0]
-        analytics[stat_name] = sum(1 for line in open(join(out_dir, fname)))
+        with open_fact_file(fpath) as f:
+            analytics[stat_name] = sum(1 for line in f)
 
     for fname in os.listdir(out_dir):
         fpath = join(out_dir, fname)
         if not fname.startswith('Verbatim_'):
             continue
         stat_name = fname.split(".")[0]
-        analytics[stat_name] = open(join(out_dir, fname)).read()
+        with open_fact_file(fpath) as f:
+            analytics[stat_name] = f.read()
 
     try:
-        f = open(join(out_dir, 'vulnerability.csv'))
+        f = open_fact_file(join(out_dir, 'vulnerability.csv'))
     except FileNotFoundError:
         return
     for raw_line in f:
@@ -344,163 +794,366 @@ def get_gigahorse_analytics(out_dir: str, analytics: dict) -> None:
             key = f'{confidence}: {vulnerability_type}'
             analytics[key] = analytics.get(key, 0) + 1
 
-def flush_queue(run_sig: Any, result_queue: SimpleQueue, result_list: Any) -> None:
+def get_results_stream_file(results_file: str, results_format: str) -> str:
+    """
+    Returns the JSON Lines file results are appended to during the run.
     """
-    For flushing the queue periodically to a list so it doesn't fill up.
+    if results_format == 'jsonl':
+        return results_file
+    return os.path.splitext(results_file)[0] + RESULTS_STREAM_SUFFIX
 
-    Args:
-        period: flush the result_queue to result_list every period seconds
-        run_sig: terminate when the Event run_sig is cleared.
-        result_queue: the queue in which results accumulate before being flushed
-        result_list: the final list of results.
-    """
-    while run_sig.is_set():
-        time.sleep(0.1)
-        while not result_queue.empty():
-            item = result_queue.get()
-            result_list.append(item)
-
-def write_results(res_list: Any, results_file: str) -> None:
-    """
-    Filters the results in res_list, logging the appropriate messages
-    and writting them to the results_file json file
-    """
-    total = len(res_list)
-    vulnerability_counts: DefaultDict[str, int] = defaultdict(int)
-    analytics_sums: DefaultDict[str, int] = defaultdict(int)
-    meta_counts: DefaultDict[str, int] = defaultdict(int)
-    all_files = set()
-    for _, files, meta, analytics in res_list:
-        for f in files:
-            all_files.add(f)
-        for m in meta:
-            meta_counts[m] += 1
-        for k, a in analytics.items():
-            if ':' in k: # tell-tale sign for vulnerability key
-                vulnerability_counts[k] += 1
-            if isinstance(a, int):
-                analytics_sums[k] += a
-            if k in all_files:
-                all_files.remove(k)
-
-    analytics_sums_sorted = sorted(list(analytics_sums.items()), key = lambda a: a[0])
-    if analytics_sums_sorted:
-        log('\n')
-        log('-'*80)
-        log('Analytics')
-        log('-'*80)
-        for res, sums in analytics_sums_sorted:
-            log("  {}: {}".format(res, sums))
-        log('\n')
-
-    vulnerability_counts_sorted = sorted(list(vulnerability_counts.items()), key = lambda a: a[0])
-    if vulnerability_counts_sorted:
-        log('-'*80)
-        log('Summary (flagged contracts)')
-        log('-'*80)
-
-        for res, count in vulnerability_counts_sorted:
-            log("  {}: {:.2f}%".format(res, 100 * count / total))
-
-    if meta_counts:
-        log('-'*80)
-        log('Timeouts and Errors')
-        log('-'*80)
-        for k, v in meta_counts.items():
-            log(f"  {k}: {v} of {total} contracts")
-        log('\n')
-
-    log("\nWriting results to {}".format(results_file))
-    with open(results_file, 'w') as f:
-        f.write(json.dumps(list(res_list), indent=1))
-
-def batch_analysis(fact_generator: AbstractFactGenerator, souffle_clients: List[str], other_clients: List[str], contracts: List[str], num_of_jobs: int) -> Any:
-    """
-    Given a fact generator and the client lists, analyzes the contracts list, using num_of_jobs parallel jobs/processes
-    """
-    # Set up multiprocessing result list and queue.
-    manager = Manager()
-
-    # This list contains analysis results as
-    # (filename, category, meta, analytics) quadruples.
-    res_list: Any = manager.list()
-
-    # Holds results transiently before flushing to res_list
-    res_queue: SimpleQueue = SimpleQueue()
-
-    # Start the periodic flush process, only run while run_signal is set.
-    run_signal = Event()
-    run_signal.set()
-    flush_proc = Process(target=flush_queue, args=(run_signal, res_queue, res_list))
-    flush_proc.start()
-
-    workers: List[Dict[str, Any]] = []
-    avail_jobs = list(range(num_of_jobs))
-    contract_iter = enumerate(contracts)
-    contracts_exhausted = False
+def append_result(stream: TextIO, result: ContractResult) -> None:
+    """
+    Appends a single contract result to the results stream, flushing it
+    so that completed contracts survive a crash of the coordinator.
+    """
+    stream.write(json.dumps(result) + '\n')
+    stream.flush()
+
+def read_results(results_stream_file: str) -> Iterator[ContractResult]:
+    """
+    Lazily reads back the results from a JSON Lines results stream.
+    A truncated trailing line (left behind by an interrupted run) is skipped.
+    """
+    with open(results_stream_file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                name, files, meta, analytics = json.loads(line)
+            except ValueError:
+                log(f"Skipping malformed line in {results_stream_file}")
+                continue
+            yield name, files, meta, analytics
+
+def load_results(results_file: str) -> Iterator[ContractResult]:
+    """
+    Reads back a results file, in either of the supported formats (see is_json_lines).
+    """
+    if is_json_lines(results_file):
+        yield from read_results(results_file)
+    else:
+        with open(results_file) as f:
+            for name, files, meta, analytics in json.load(f):
+                yield name, files, meta, analytics
+
+def open_results_stream(results_stream_file: str, resume: bool, summary: Optional[ResultsSummary] = None) -> TextIO:
+    """
+    Opens the results stream of a run. A run resuming an interrupted one skips the contracts
+    analyzed by it, so it keeps the results it streamed (adding them to the summary, if given)
+    and appends to them.
+    """
+    if not (resume and os.path.isfile(results_stream_file) and is_json_lines(results_stream_file)):
+        return open(results_stream_file, 'w')
+
+    previous = 0
+    for _, files, meta, analytics in read_results(results_stream_file):
+        previous += 1
+        if summary:
+            summary.add(files, meta, analytics)
+    log(f"Resuming, keeping the {previous} results in {results_stream_file}")
+
+    with open(results_stream_file, 'rb') as f:
+        # the last line may have been cut short by the interruption
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(size - 1, 0))
+        truncated = size > 0 and f.read(1) != b'\n'
+    stream = open(results_stream_file, 'a')
+    if truncated:
+        stream.write('\n')
+    return stream
+
+def write_results(results_stream_file: str, results_file: str, results_format: str, summary: ResultsSummary) -> None:
+    """
+    Logs the summary of the results, aggregated during the run, and (for the 'json' format)
+    copies the results in results_stream_file to the results_file as a json array, in a single streaming pass.
+    """
+    legacy_file = open(results_file, 'w') if results_format == 'json' else None
+    if legacy_file:
+        legacy_file.write('[')
+        for i, result in enumerate(read_results(results_stream_file)):
+            legacy_file.write(',\n' if i else '\n')
+            legacy_file.write(json.dumps(result, indent=1))
+        legacy_file.write('\n]')
+        legacy_file.close()
+
+    summary.log()
+
+    log("\nResults written to {}".format(results_file if legacy_file else results_stream_file))
+
+def batch_analysis(fact_generator: AbstractFactGenerator, souffle_clients: List[str], other_clients: List[str], contracts: List[str], num_of_jobs: int, results_stream_file: str, decomp_cache: Optional[DecompilationCache] = None, duplicates: Optional[Dict[str, List[str]]] = None, order: Optional[List[int]] = None, summary: Optional[ResultsSummary] = None) -> int:
+    """
+    Given a fact generator and the client lists, analyzes the contracts list, using num_of_jobs parallel jobs/processes.
+    The worker processes are long-lived and are reused across contracts. The coordinator blocks
+    until some contract completes (instead of polling the workers) before handing out the next one.
+    Contracts are handed out in the given order (of indices in contracts), listing order by default.
+    Each result is appended to results_stream_file (and added to the summary, if given) as soon as
+    it arrives, and replicated to the duplicates of the contract (by name), if any.
+    The results of an earlier run on the same working dir are kept (see open_results_stream),
+    unless all contracts are (re)analyzed, i.e. with --restart or --rerun_clients.
+    A contract whose worker dies (e.g. killed by the OOM killer) is reported as an ERROR.
+    Sending SIGUSR1 to the coordinator logs the summary of the contracts analyzed so far.
+    Returns the number of contracts analyzed.
+    """
+    if order is None:
+        order = list(range(len(contracts)))
+
+    # Completed contracts are reported here by the pool's result handler thread, as
+    # (index, duration, result) triples. The result is None for contracts that did not need to be (re)analyzed.
+    done_queue: Queue = Queue()
+
+    # The pool replaces dead workers, but never reports the contracts they were analyzing.
+    # Workers report the contracts they start here, the coordinator watches their pids.
+    started_queue: SimpleQueue = SimpleQueue()
+    start_times: Dict[int, float] = {}
+    """Start time of the contracts handed out and not yet collected"""
+    worker_pids: Dict[int, int] = {}
+    dead_workers: Set[int] = set()
+    lost = 0
+
+    # --restart removed the working dir
+    resume = os.path.isdir(args.working_dir) and not args.rerun_clients
+    results_stream = open_results_stream(results_stream_file, resume, summary)
+    finished = 0
+    durations: Dict[int, float] = {}
+    memory_admission = MemoryAdmission(int(args.memory_budget * 1_000_000_000)) if args.memory_budget > 0 else None
+
+    def find_lost_contract() -> Optional[int]:
+        """
+        Returns a contract whose worker died. Its worker must have been found dead by an earlier
+        call too, so that a result sent right before the worker died is collected first.
+        """
+        while not started_queue.empty():
+            index, pid = started_queue.get()
+            worker_pids[index] = pid
+        alive = {p.pid for p in active_children()}
+        for index, pid in worker_pids.items():
+            if index in start_times and pid not in alive:
+                if index in dead_workers:
+                    return index
+                dead_workers.add(index)
+        return None
+
+    def collect_result(timeout: Optional[float] = None) -> bool:
+        """Waits for a contract to complete (or be lost), returns False if none did within the timeout."""
+        nonlocal finished, lost
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            poll_interval = WORKER_POLL_INTERVAL if deadline is None else max(min(WORKER_POLL_INTERVAL, deadline - time.time()), 0)
+            try:
+                index, duration, result = done_queue.get(timeout=poll_interval)
+            except Empty:
+                lost_index = find_lost_contract()
+                if lost_index is not None:
+                    lost += 1
+                    contract_name = os.path.split(contracts[lost_index])[1]
+                    log(f"Error: the worker analyzing {contract_name} died.")
+                    index, duration, result = lost_index, time.time() - start_times[lost_index], (contract_name, [], ["ERROR"], {})
+                elif deadline is not None and time.time() >= deadline:
+                    return False
+                else:
+                    continue
+            # the result of a contract already reported as lost is dropped
+            if index in start_times:
+                break
+
+        del start_times[index]
+        worker_pids.pop(index, None)
+        dead_workers.discard(index)
+        durations[index] = duration
+        if result is not None:
+            append_result(results_stream, result)
+            finished += 1
+
+            name, files, meta, analytics = result
+            if summary:
+                summary.add(files, meta, analytics)
+            if memory_admission and 'peak_memory' in analytics:
+                memory_admission.record(analytics['peak_memory'])
+
+            for duplicate_name in (duplicates or {}).get(name, []):
+                duplicate_analytics = {**analytics, 'duplicate_of': name}
+                append_result(results_stream, (duplicate_name, files, meta, duplicate_analytics))
+                if summary:
+                    summary.add(files, meta, duplicate_analytics)
+        return True
+
+    if summary:
+        previous_handler = signal.signal(signal.SIGUSR1, lambda *_: summary.log(f"Summary of the {summary.total} contracts analyzed so far:"))
 
     log("Analysing...\n")
+    pool = Pool(num_of_jobs, initializer=init_worker, initargs=(fact_generator, souffle_clients, other_clients, decomp_cache, started_queue))
     try:
-        while not contracts_exhausted:
-            # If there's both workers and contracts available, use the former to work on the latter.
-            while not contracts_exhausted and len(avail_jobs) > 0:
-                try:
-                    index, contract_name = next(contract_iter)
-                    working_dir = get_working_dir(contract_name)
-                    if os.path.isdir(working_dir) and not args.rerun_clients:
-                        # no need to create another process
-                        continue
-
-                    # reduce number of available jobs
-                    job_index = avail_jobs.pop()
-                    proc = Process(target=analyze_contract, args=(index, contract_name, res_queue, fact_generator, souffle_clients, other_clients))
-                    proc.start()
-                    start_time = time.time()
-                    workers.append({"name": contract_name,
-                                    "proc": proc,
-                                    "time": start_time,
-                                    "job_index": job_index})
-                except StopIteration:
-                    contracts_exhausted = True
-
-            # Loop until some process terminates (to retask it) or,
-            # if there are no unanalyzed contracts left, until currently-running contracts are done
-            while len(avail_jobs) == 0 or (contracts_exhausted and 0 < len(workers)):
-                to_remove = []
-                for i in range(len(workers)):
-                    start_time = workers[i]["time"]
-                    proc = workers[i]["proc"]
-                    name = workers[i]["name"]
-                    job_index = workers[i]["job_index"]
-
-                    if not proc.is_alive():
-                        to_remove.append(i)
-                        proc.join()
-                        avail_jobs.append(job_index)
-
-                # Reverse index order so as to pop elements correctly
-                for i in reversed(to_remove):
-                    workers.pop(i)
-
-                time.sleep(0.01)
-
-        # Conclude and write results to file.
-        run_signal.clear()
-        flush_proc.join(1)
-        # it's important to count the total after proc.join
-
-        log(f"\nFinished {len(res_list)} contracts...\n")
-        return res_list
+        in_flight = 0
+        for index in order:
+            contract_name = contracts[index]
+            if not args.rerun_clients and working_dir_exists(contract_name):
+                # no need to schedule it
+                continue
+
+            # Wait for a worker to become available
+            if in_flight == num_of_jobs:
+                collect_result()
+                in_flight -= 1
+
+            # Wait for memory to become available, there is always room for one contract
+            if memory_admission and in_flight > 0 and not memory_admission.can_start():
+                memory_admission.delayed += 1
+                while in_flight > 0 and not memory_admission.can_start():
+                    if collect_result(MEMORY_POLL_INTERVAL):
+                        in_flight -= 1
+
+            start_times[index] = time.time()
+            def on_done(result: Optional[ContractResult], index: int = index, start_time: float = start_times[index]) -> None:
+                done_queue.put((index, time.time() - start_time, result))
+
+            def on_error(e: BaseException, on_done: Callable = on_done, contract_name: str = contract_name) -> None:
+                # Only reached if the worker itself fails, analyze_contract handles analysis errors
+                log(f"Error: {e}")
+                on_done((os.path.split(contract_name)[1], [], ["ERROR"], {}))
+
+            pool.apply_async(analyze_contract_task, (index, contract_name), callback=on_done, error_callback=on_error)
+            in_flight += 1
+
+        # Wait until currently-running contracts are done
+        while in_flight > 0:
+            collect_result()
+            in_flight -= 1
+
+        if lost:
+            # the pool waits for the results of the lost contracts when closed
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+        results_stream.close()
+        if summary:
+            signal.signal(signal.SIGUSR1, previous_handler)
+
+        if decomp_cache:
+            decomp_cache.evict()
+
+        work_archive = get_work_archive()
+        if work_archive:
+            work_archive.compact_shards()
+
+        log(f"\nFinished {finished} contracts...\n")
+        if (report := schedule_report(durations, order, num_of_jobs)):
+            log(report)
+        if memory_admission and memory_admission.delayed:
+            log(f"Delayed {memory_admission.delayed} contracts due to the memory budget.")
+        return finished
 
     except Exception as e:
         import traceback
 
         traceback.print_exc()
-        flush_proc.terminate()
+        pool.terminate()
 
         sys.exit(1)
 
 
+def run_server(socket_path: str, fact_generator: AbstractFactGenerator, souffle_clients: List[str], other_clients: List[str], num_of_jobs: int, decomp_cache: Optional[DecompilationCache] = None) -> None:
+    """
+    Keeps a pool of num_of_jobs warm workers around and analyzes the contracts submitted over
+    the Unix socket at socket_path, until interrupted.
+
+    Each request is a json object on its own line, with the "bytecode" of the contract
+    and optionally its "name" (file name, e.g. "0x1234.hex"). The response is a json line
+    with the (filename, files, meta, analytics) result of the contract, or an object with an "error".
+    A contract submitted again under the same name is analyzed from scratch. Names must be handled
+    by the fact generator (e.g. end in .hex), and not start with a dot or be named after SERVER_REQUESTS_DIR.
+    A {"summary": true} request is answered with the summary of the results so far.
+    """
+    requests_dir = join(os.path.abspath(args.working_dir), SERVER_REQUESTS_DIR)
+    os.makedirs(requests_dir, exist_ok=True)
+
+    pool = Pool(num_of_jobs, initializer=init_worker, initargs=(fact_generator, souffle_clients, other_clients, decomp_cache))
+
+    # Serializes requests for contract names with the same stem, as they share a working dir
+    name_locks: DefaultDict[str, threading.Lock] = defaultdict(threading.Lock)
+    name_locks_lock = threading.Lock()
+    request_count = 0
+    summary = ResultsSummary()
+    summary_lock = threading.Lock()
+
+    def analyze_request(request: Dict[str, Any]) -> Optional[ContractResult]:
+        nonlocal request_count
+        bytecode = normalize_bytecode(request['bytecode'])
+        bytes.fromhex(bytecode) # validate input
+
+        name = os.path.basename(request.get('name') or f"{hashlib.sha256(bytecode.encode('utf-8')).hexdigest()[:32]}.hex")
+        # the stem of the name is the contract's working dir, which is removed before the analysis
+        stem = name.split('.')[0]
+        if not stem or stem == SERVER_REQUESTS_DIR:
+            raise ValueError(f"Invalid contract name: {name!r}")
+        contract_filename = join(requests_dir, name)
+
+        with name_locks_lock:
+            name_lock = name_locks[stem]
+            request_count += 1
+            index = request_count
+
+        with name_lock:
+            result = pool.apply(serve_contract_task, (index, contract_filename, bytecode))
+
+        if result is not None:
+            _, files, meta, analytics = result
+            with summary_lock:
+                summary.add(files, meta, analytics)
+        return result
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if request.get('summary'):
+                        with summary_lock:
+                            response: Any = summary.to_dict()
+                    else:
+                        response = analyze_request(request)
+                except Exception as e:
+                    response = {'error': f"{type(e).__name__}: {e}"}
+                self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+    server.daemon_threads = True
+    log(f"Listening for contracts on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("Shutting down...")
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        pool.terminate()
+
+def await_compilation(compile_processes: List[Process], souffle_files: List[str], compiled_programs: Dict[str, Any]) -> None:
+    """
+    Runs in a thread of the coordinator with --analyze_while_compiling. Sets the event of
+    each souffle program as soon as it is compiled, so that workers switch to its executable.
+    Programs that fail to compile keep being run in interpreted mode.
+    """
+    pending = {p.sentinel: (p, file) for p, file in zip(compile_processes, souffle_files)}
+    while pending:
+        for sentinel in wait(list(pending)):
+            # wait returns the ready objects among the ones given, process sentinels are ints
+            p, file = pending.pop(cast(int, sentinel))
+            p.join()
+            if p.exitcode or not os.path.isfile(get_souffle_executable_path(args.cache_dir, file)):
+                log(f"[WARNING]: Compilation of {file} failed, running it in interpreted mode.")
+            else:
+                log(f"Switching to the compiled executable of {file}")
+                compiled_programs[file].set()
+
+    evict_compile_cache(args.cache_dir, int(args.compile_cache_size * 1_000_000_000))
+
 def run_gigahorse(args, fact_generator: AbstractFactGenerator) -> None:
     """
     Run gigahorse, passing the cmd line args and fact generator type as arguments
@@ -508,10 +1161,20 @@ def run_gigahorse(args, fact_generator: AbstractFactGenerator) -> None:
     log_level = logging.WARNING if args.quiet else logging.INFO + 1
     logging.basicConfig(format='%(message)s', level=log_level)
 
-    analysis_executor = AnalysisExecutor(args.timeout_secs, args.interpreted, args.minimum_client_time, args.debug, args.souffle_bin, args.cache_dir, get_souffle_macros())
+    analysis_executor = AnalysisExecutor(args.timeout_secs, args.interpreted, args.minimum_client_time, args.debug, args.souffle_bin, args.cache_dir, get_souffle_macros(), args.client_jobs)
+
+    if args.thread_budget:
+        analysis_executor.thread_budget = ThreadBudget(args.thread_budget, args.client_jobs)
 
     fact_generator.analysis_executor = analysis_executor
 
+    if args.adaptive_fallback:
+        if args.previous_results:
+            fact_generator.fallback_predictor = FallbackPredictor(load_results(args.previous_results))
+            log(f"Predicting scalable fallback use from {args.previous_results}: {fact_generator.fallback_predictor}")
+        else:
+            log("[WARNING]: --adaptive_fallback requires --previous_results, ignoring it.")
+
     clients_split = [a.strip() for a in args.client.split(',')]
     souffle_clients = [a for a in clients_split if a.endswith('.dl')]
     other_clients = [a for a in clients_split if not (a.endswith('.dl') or a == '')]
@@ -528,7 +1191,7 @@ def run_gigahorse(args, fact_generator: AbstractFactGenerator) -> None:
 
         running_processes = []
         for file in souffle_files:
-            proc = Process(target = compile_datalog, args=(file, args.souffle_bin, args.cache_dir, args.reuse_datalog_bin, get_souffle_macros()))
+            proc = Process(target = compile_datalog, args=(file, args.souffle_bin, args.cache_dir, args.reuse_datalog_bin, get_souffle_macros(), args.batch_small_contracts is not None))
             proc.start()
             running_processes.append(proc)
 
@@ -536,7 +1199,10 @@ def run_gigahorse(args, fact_generator: AbstractFactGenerator) -> None:
         log("Removing working directory {}".format(args.working_dir))
         shutil.rmtree(args.working_dir, ignore_errors = True)
 
-    if not args.interpreted:
+    if not args.interpreted and args.analyze_while_compiling:
+        analysis_executor.compiled_programs = {file: Event() for file in souffle_files}
+        threading.Thread(target=await_compilation, args=(running_processes, souffle_files, analysis_executor.compiled_programs), daemon=True).start()
+    elif not args.interpreted:
         for p in running_processes:
             p.join()
             if args.debug and p.exitcode:
@@ -546,6 +1212,17 @@ def run_gigahorse(args, fact_generator: AbstractFactGenerator) -> None:
         for file in souffle_files:
             open(get_souffle_executable_path(args.cache_dir, file), 'r') # check program exists
 
+        evict_compile_cache(args.cache_dir, int(args.compile_cache_size * 1_000_000_000))
+
+    decomp_cache = get_decomp_cache(fact_generator)
+
+    if args.rerun_clients:
+        analysis_executor.client_hashes = get_client_hashes(souffle_clients, other_clients)
+
+    if args.server:
+        run_server(args.server, fact_generator, souffle_clients, other_clients, args.jobs, decomp_cache)
+        return
+
     # Extract contract filenames.
     log("Processing contract names...")
 
@@ -563,9 +1240,25 @@ def run_gigahorse(args, fact_generator: AbstractFactGenerator) -> None:
 
     contracts = contracts[args.skip:]
 
-    log(f"Discovered {len(contracts)} contracts. Setting up workers.")
-    res_list= batch_analysis(fact_generator, souffle_clients, other_clients, contracts, args.jobs)
-    write_results(res_list, args.results_file)
+    log(f"Discovered {len(contracts)} contracts.")
+
+    duplicates = None
+    if args.dedup_contracts:
+        contracts, duplicates = group_duplicate_contracts(contracts, args.dedup_ignore_metadata)
+        log(f"Found {len(contracts)} unique contracts.")
+
+    order = get_schedule(contracts)
+
+    log("Setting up workers.")
+    results_stream_file = get_results_stream_file(args.results_file, args.results_format)
+    summary = ResultsSummary()
+    batch_analysis(fact_generator, souffle_clients, other_clients, contracts, args.jobs, results_stream_file, decomp_cache, duplicates, order, summary)
+    write_results(results_stream_file, args.results_file, args.results_format, summary)
+
+    if args.analyze_while_compiling and not args.interpreted and any(p.is_alive() for p in running_processes):
+        log("Waiting for the souffle programs still being compiled, to reuse them in later runs.")
+        for p in running_processes:
+            p.join()
 
 if __name__ == "__main__":
     # Decompiler tuning
@@ -595,6 +1288,9 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
+    if not args.filepath and not args.server:
+        parser.error("no contracts given")
+
     tac_gen_config_json = args.tac_gen_config
     with open(tac_gen_config_json, 'r') as config:
         tac_gen_config = json.loads(config.read())
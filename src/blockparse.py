@@ -31,7 +31,8 @@
 
 import abc
 import logging
-from typing import List, Union, Iterable, Any
+from array import array
+from typing import List, Union, Iterable, Iterator, Any, Optional, Tuple
 
 import src.basicblock as basicblock
 import src.opcodes as opcodes
@@ -215,3 +216,126 @@ class EVMBytecodeParser(BlockParser):
 
         # build basic blocks from the sequence of opcodes
         return basicblock.blocks_from_ops(self._ops)
+
+
+# Lookup tables, by byte value, used by the FastEVMBytecodeParser
+OPCODE_TABLE = [opcodes.BYTECODES[b] if b in opcodes.BYTECODES else opcodes.missing_opcode(b) for b in range(256)]
+PUSH_LEN_TABLE = [op.push_len() for op in OPCODE_TABLE]
+ALTERS_FLOW_TABLE = [op.alters_flow() for op in OPCODE_TABLE]
+
+
+class EVMInstructions:
+    """
+    Compact representation of decoded EVM bytecode: the pc and opcode byte of each
+    instruction in parallel arrays, with basic blocks as ranges of instruction indices.
+    PUSH values are not decoded upfront, they are read from the bytecode on demand.
+    """
+
+    def __init__(self, bytecode: bytes, pcs: array, codes: bytearray, blocks: List[Tuple[int, int]]):
+        """
+        Args:
+          bytecode: the raw bytecode
+          pcs: the pc of each instruction
+          codes: the opcode byte of each instruction
+          blocks: (start, end) index ranges of the instructions of each block, end exclusive
+        """
+        self.bytecode = bytecode
+        self.pcs = pcs
+        self.codes = codes
+        self.blocks = blocks
+
+    def __len__(self) -> int:
+        return len(self.pcs)
+
+    def opcode(self, index: int) -> opcodes.OpCode:
+        return OPCODE_TABLE[self.codes[index]]
+
+    def value(self, index: int) -> Optional[int]:
+        """
+        The constant argument of the instruction: the pushed value for PUSH
+        instructions (truncated if the bytecode ends before it), the byte itself
+        for unknown opcodes, None otherwise.
+        """
+        code = self.codes[index]
+        push_len = PUSH_LEN_TABLE[code]
+        if push_len:
+            pc = self.pcs[index]
+            return int.from_bytes(self.bytecode[pc + 1: pc + 1 + push_len], "big")
+        if OPCODE_TABLE[code].is_missing():
+            return code
+        return None
+
+    def __iter__(self) -> Iterator[Tuple[int, opcodes.OpCode, Optional[int]]]:
+        """Iterates over the (pc, opcode, value) triples of all instructions, in pc order."""
+        bytecode = self.bytecode
+        for pc, code in zip(self.pcs, self.codes):
+            push_len = PUSH_LEN_TABLE[code]
+            op = OPCODE_TABLE[code]
+            if push_len:
+                yield pc, op, int.from_bytes(bytecode[pc + 1: pc + 1 + push_len], "big")
+            else:
+                yield pc, op, code if op.is_missing() else None
+
+
+class FastEVMBytecodeParser:
+    def __init__(self, bytecode: Union[str, bytes]):
+        """
+        Decodes EVM bytecode in a single pass, into EVMInstructions.
+        Produces the same instructions and blocks as the EVMBytecodeParser,
+        without creating objects per instruction and block.
+
+        Args:
+          bytecode: EVM bytecode, either as a hexadecimal string or a bytes
+            object. If given as a hex string, it may optionally start with 0x.
+        """
+        if isinstance(bytecode, str):
+            bytecode = bytes.fromhex(bytecode.replace("0x", ""))
+        else:
+            bytecode = bytes(bytecode)
+
+        self._raw = bytecode
+
+    def parse(self) -> EVMInstructions:
+        raw = self._raw
+        size = len(raw)
+        push_lens = PUSH_LEN_TABLE
+        alters_flow = ALTERS_FLOW_TABLE
+        jumpdest = opcodes.JUMPDEST.code
+
+        pcs = array('L')
+        codes = bytearray()
+        blocks = []
+        block_start = 0
+
+        pc = 0
+        index = 0
+        while pc < size:
+            code = raw[pc]
+            pcs.append(pc)
+            codes.append(code)
+
+            if OPCODE_TABLE[code].is_missing():
+                if STRICT:
+                    logging.warning("(strict) Invalid opcode at PC = %#02x", pc)
+                    raise LookupError("No opcode with value '0x{:02X}'.".format(code))
+                logging.debug("Invalid opcode at PC = %#02x", pc)
+
+            pc += 1 + push_lens[code]
+
+            # Same block boundaries as basicblock.blocks_from_ops
+            if alters_flow[code]:
+                blocks.append((block_start, index + 1))
+                block_start = index + 1
+            elif code == jumpdest and index > block_start:
+                blocks.append((block_start, index))
+                block_start = index
+                if pc >= size:
+                    # blocks_from_ops drops a block made of a trailing JUMPDEST, keep the output identical
+                    pcs.pop()
+                    codes.pop()
+            elif pc >= size:
+                blocks.append((block_start, index + 1))
+
+            index += 1
+
+        return EVMInstructions(raw, pcs, codes, blocks)
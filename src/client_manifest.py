@@ -0,0 +1,86 @@
+"""client_manifest.py: per-contract record of the clients run and their inputs and outputs, used to rerun only the clients that changed"""
+
+import hashlib
+import json
+import os
+from os.path import join
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+CLIENT_MANIFEST_FILE = 'client_manifest.json'
+"""File in a contract's output dir holding its client manifest."""
+
+
+def stat_files(out_dir: str) -> Dict[str, List[int]]:
+    """
+    Returns the (size, mtime in ns) of the files in out_dir (following symlinks), by name.
+    """
+    stamps = {}
+    for entry in os.scandir(out_dir):
+        if entry.name == CLIENT_MANIFEST_FILE:
+            continue
+        try:
+            if entry.is_dir():
+                continue
+            stat = entry.stat()
+        except OSError:
+            # dangling symlink
+            continue
+        stamps[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def changed_files(before: Dict[str, List[int]], after: Dict[str, List[int]]) -> List[str]:
+    return sorted(name for name, stamp in after.items() if before.get(name) != stamp)
+
+
+class ClientManifest:
+    """
+    Records, for each client run on a contract, the hash of the client (its executable
+    or script, see AnalysisExecutor.client_hashes), a fingerprint of the inputs it saw
+    and the output files it produced.
+
+    The inputs of a client are all the files of the output dir (the decompiler output
+    and the outputs of the clients it may depend on), except the outputs of the
+    other clients. They are fingerprinted by their size and modification time,
+    as hashing their contents would cost about as much as rerunning most clients.
+    """
+
+    def __init__(self, out_dir: str):
+        self.path = join(out_dir, CLIENT_MANIFEST_FILE)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def outputs(self, client: str) -> List[str]:
+        return self.entries.get(client, {}).get('outputs', [])
+
+    def excluded_files(self, dependencies: Iterable[str]) -> Set[str]:
+        """The outputs of all recorded clients, except the given ones."""
+        dependencies = set(dependencies)
+        return {fname for client, entry in self.entries.items() if client not in dependencies for fname in entry['outputs']}
+
+    @staticmethod
+    def fingerprint(stamps: Dict[str, List[int]], excluded: Set[str]) -> str:
+        hasher = hashlib.sha256()
+        for name in sorted(stamps):
+            if name not in excluded:
+                hasher.update(f'{name}\t{stamps[name][0]}\t{stamps[name][1]}\n'.encode('utf-8'))
+        return hasher.hexdigest()
+
+    def is_unchanged(self, client: str, client_hash: Optional[str], inputs: str) -> bool:
+        entry = self.entries.get(client)
+        return entry is not None and client_hash is not None and entry['hash'] == client_hash and entry['inputs'] == inputs
+
+    def record(self, client: str, client_hash: Optional[str], outputs: List[str]) -> None:
+        """Records a client run. Clients without a hash (e.g. after failing) are always rerun."""
+        self.entries[client] = {'hash': client_hash, 'inputs': None, 'outputs': outputs}
+
+    def update_inputs(self, client: str, inputs: str) -> None:
+        self.entries[client]['inputs'] = inputs
+
+    def save(self) -> None:
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f)
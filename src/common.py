@@ -1,5 +1,10 @@
-from os.path import abspath, dirname, join, exists
+from contextlib import contextmanager
+from os.path import abspath, dirname, join, exists, getsize
+from typing import Iterator, Optional, TextIO, Tuple
+import fcntl
+import gzip
 import logging
+import os
 
 GIGAHORSE_DIR = join(dirname(abspath(__file__)), '..')
 """The path of the gigahorse-toolchain clone."""
@@ -12,6 +17,73 @@ SOUFFLE_COMPILED_SUFFIX = '_compiled'
 log = lambda msg: logging.log(logging.INFO + 1, msg)
 
 
+@contextmanager
+def file_lock(path: str, blocking: bool = True, shared: bool = False) -> Iterator[bool]:
+    """
+    Holds an exclusive (or shared) lock on path (created if needed), across processes.
+    Yields whether the lock was acquired, which is always the case when blocking.
+    Lock files may be removed by the holder of their lock (e.g. along with the cache entry they protect).
+    """
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    while True:
+        with open(path, 'a') as f:
+            try:
+                fcntl.flock(f, operation if blocking else operation | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                # removed while we waited for it, lock the file now at path instead
+                if not (os.path.exists(path) and os.path.samestat(os.fstat(f.fileno()), os.stat(path))):
+                    continue
+                yield True
+                return
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def is_json_lines(results_file: str) -> bool:
+    """
+    Tells the two formats of results files apart by their contents rather than their name
+    (--results_format jsonl writes to results.json by default): a json array of results
+    starts with two '[', a JSON Lines file with a result, i.e. '[' and its filename.
+    """
+    with open(results_file) as f:
+        head = ''
+        while len(head) < 2 and (chunk := f.read(4096)):
+            head += ''.join(chunk.split())
+    return head[1:2] != '[' and head != '[]'
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_fact_file(path: str) -> TextIO:
+    """
+    Opens a decompiler output for reading, whether plain or gzip-compressed (see clientlib/fact_io.dl).
+    Python clients use their own copy, in clientlib/facts_to_cfg.py.
+    """
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    return gzip.open(path, 'rt') if compressed else open(path)
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """The size and modification time of path, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def fact_file_is_empty(path: str) -> bool:
+    if getsize(path) == 0:
+        return True
+    with open_fact_file(path) as f:
+        return not f.read(1)
+
+
 def __get_sig_file(simple_filename: str) -> str:
     preferred_dest = join(join(dirname(abspath(__file__)), '../../common-facts'), simple_filename)
     fallback_dest = join(join(dirname(abspath(__file__)), '..'), simple_filename)
@@ -0,0 +1,141 @@
+"""compile_cache.py: cache of compiled souffle executables, shared by concurrent gigahorse runs"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from os.path import join
+from typing import Dict, List, Optional
+
+from .common import file_lock, file_stamp, log
+from .decomp_cache import hash_file
+
+COMPILE_CACHE_DIR = 'compiled'
+"""Subdirectory of the cache dir holding the compiled executables, named after their keys."""
+
+COMPILE_CACHE_LOCK = '.lock'
+"""Lock file in the compile cache dir, held while evicting."""
+
+BUILD_MANIFEST_SUFFIX = '.build.json'
+"""Suffix of the build manifests in the compile cache dir, see read_build_manifest."""
+
+souffle_versions: Dict[str, str] = {}
+
+
+def get_souffle_version(souffle_bin: str) -> str:
+    if souffle_bin not in souffle_versions:
+        process = subprocess.run([souffle_bin, '--version'], universal_newlines=True, capture_output=True)
+        souffle_versions[souffle_bin] = process.stdout.strip()
+    return souffle_versions[souffle_bin]
+
+
+def compile_cache_key(source: str, souffle_bin: str, dependencies: List[str], flags: List[str]) -> str:
+    """
+    Args:
+      source: the preprocessed datalog source
+      souffle_bin: the souffle binary compiling it, identified by its version
+      dependencies: paths of files (e.g. the functor library) the executable is built against, identified by their contents
+      flags: compilation flags, other than the input and output paths
+    """
+    hasher = hashlib.sha256()
+    for part in [source, get_souffle_version(souffle_bin)] + [hash_file(dep) for dep in dependencies] + flags:
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+def link_executable(cache_path: str, executable_path: str) -> None:
+    """
+    Makes executable_path a hard link to the cached executable, replacing it atomically,
+    so that processes still running the previous executable are not affected.
+    Falls back to copying if the cache is on a different filesystem.
+    """
+    if not (os.path.exists(executable_path) and os.path.samefile(cache_path, executable_path)):
+        tmp_path = f'{executable_path}.tmp{os.getpid()}'
+        try:
+            os.link(cache_path, tmp_path)
+        except OSError:
+            shutil.copy2(cache_path, tmp_path)
+        os.replace(tmp_path, executable_path)
+
+    # the entry's mtime is used as its last use time for eviction
+    os.utime(cache_path)
+
+
+def evict_compile_cache(cache_dir: str, max_size: int) -> None:
+    """
+    Removes the least recently used executables (and their locks) until the compile cache fits in max_size.
+    Executables still linked from the cache dir (i.e. the current version of some program)
+    and the ones being compiled or linked (whose lock is held) are kept.
+    """
+    compiled_dir = join(cache_dir, COMPILE_CACHE_DIR)
+    if not os.path.isdir(compiled_dir):
+        return
+
+    with file_lock(join(compiled_dir, COMPILE_CACHE_LOCK)):
+        entries = []
+        total_size = 0
+        for entry in os.scandir(compiled_dir):
+            if entry.name.endswith('.lock') and entry.name != COMPILE_CACHE_LOCK and not os.path.exists(entry.path[:-len('.lock')]):
+                # left behind by a failed compilation
+                with file_lock(entry.path, blocking=False) as locked:
+                    if locked and not os.path.exists(entry.path[:-len('.lock')]):
+                        os.remove(entry.path)
+                continue
+            if entry.name.startswith('.') or entry.name.endswith(('.lock', BUILD_MANIFEST_SUFFIX)) or '.tmp' in entry.name or not entry.is_file():
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, stat.st_nlink, entry.path))
+            total_size += stat.st_size
+
+        evicted = 0
+        for _, size, links, path in sorted(entries):
+            if total_size <= max_size:
+                break
+            if links > 1:
+                continue
+            with file_lock(path + '.lock', blocking=False) as locked:
+                if not locked:
+                    continue
+                os.remove(path)
+                os.remove(path + '.lock')
+            total_size -= size
+            evicted += 1
+
+        if evicted:
+            log(f"Evicted {evicted} executables from the compile cache")
+
+
+def get_build_manifest_path(cache_dir: str, spec: str, flags: List[str]) -> str:
+    hasher = hashlib.sha256(os.path.abspath(spec).encode('utf-8'))
+    for flag in flags:
+        hasher.update(b'\0')
+        hasher.update(flag.encode('utf-8'))
+    return join(cache_dir, COMPILE_CACHE_DIR, f'{os.path.basename(spec)}-{hasher.hexdigest()[:16]}{BUILD_MANIFEST_SUFFIX}')
+
+
+def read_build_manifest(manifest_path: str) -> Optional[str]:
+    """
+    Returns the compile cache key recorded in a build manifest, if none of the files
+    it was computed from (the transitively included datalog files, the souffle binary,
+    the functor library) changed since, by size and modification time. None otherwise.
+    """
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    # the stamps are stored as JSON lists
+    if any(file_stamp(path) != (stamp and tuple(stamp)) for path, stamp in manifest['files'].items()):
+        return None
+    return manifest['key']
+
+
+def write_build_manifest(manifest_path: str, key: str, files: List[str]) -> None:
+    manifest = {'key': key, 'files': {path: file_stamp(path) for path in files}}
+    tmp_path = f'{manifest_path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
@@ -0,0 +1,180 @@
+"""decomp_cache.py: content-addressed cache of decompiler outputs"""
+
+import hashlib
+import json
+import os
+import shutil
+from os.path import join
+from typing import Any, Dict, List, Optional
+
+from .common import file_lock, log
+from .exporter import normalize_bytecode
+
+CACHE_INFO_FILE = 'cache_info.json'
+"""Per-entry file holding the decompiler config and size of the cached output."""
+
+
+def hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def is_reusable(analytics: Dict[str, Any]) -> bool:
+    """
+    Whether the decompiler output of a contract, given its analytics so far, can be cached.
+    The output of timed out steps depends on the machine and its load, and the one of the
+    predicted scalable fallback on --adaptive_fallback and --previous_results.
+    """
+    return not (analytics.get('decomp_timeouts') or analytics.get('inline_timeouts') or analytics.get('predicted_fallback'))
+
+
+def get_dir_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            fpath = join(root, fname)
+            if not os.path.islink(fpath):
+                size += os.path.getsize(fpath)
+    return size
+
+
+class DecompilationCache:
+    """
+    Content-addressed cache of decompiled contracts, shared by all the contracts
+    of a run (and by subsequent runs using the same cache directory).
+
+    Entries are keyed by the hash of the bytecode (and solc metadata, if any),
+    combined with a hash of the decompiler configuration: the decompiler executables,
+    the souffle macros, the context depth etc. An entry is a copy of a contract's
+    working directory right after decompilation (and inlining), before any client is run.
+    Entries are copied in and out rather than hard-linked, as clients are free
+    to overwrite the decompiler outputs in the working directory.
+
+    Entries are restored under a shared lock (the .lock file next to them), and evicted
+    under an exclusive one, so that concurrent runs sharing the cache do not evict an entry
+    while it is being copied out.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int, config: List[str]):
+        """
+        Args:
+          cache_dir: the root cache directory, entries are placed under its 'decompiled' subdirectory
+          max_size: size (in bytes) above which least recently used entries get evicted
+          config: strings identifying the decompiler configuration, part of every key
+        """
+        self.cache_dir = join(cache_dir, 'decompiled')
+        self.max_size = max_size
+
+        hasher = hashlib.sha256()
+        for c in config:
+            hasher.update(c.encode('utf-8'))
+            hasher.update(b'\0')
+        self.config_hash = hasher.hexdigest()
+
+    def key(self, bytecode: str, metadata: str = '') -> str:
+        hasher = hashlib.sha256()
+        hasher.update(self.config_hash.encode('utf-8'))
+        hasher.update(normalize_bytecode(bytecode).encode('utf-8'))
+        hasher.update(metadata.encode('utf-8'))
+        return hasher.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return join(self.cache_dir, key[:2], key)
+
+    def restore(self, key: str, work_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        Populates work_dir with the cached decompiler output for key.
+        Returns the entry's info dict on a hit, None on a miss.
+        """
+        entry = self.entry_path(key)
+        if not os.path.isdir(entry):
+            return None
+
+        with file_lock(entry + '.lock', shared=True):
+            try:
+                with open(join(entry, CACHE_INFO_FILE)) as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                # evicted in the meantime
+                return None
+
+            shutil.copytree(entry, work_dir, symlinks=True, dirs_exist_ok=True)
+            # the entry's mtime is used as its last access time for eviction
+            os.utime(entry)
+
+        os.remove(join(work_dir, CACHE_INFO_FILE))
+        return info
+
+    def store(self, key: str, work_dir: str, decompiler_config: str, analytics: Dict[str, Any]) -> None:
+        """
+        Adds the contents of work_dir to the cache under key, unless the output is not reusable (see is_reusable).
+        Entries are staged in a temporary directory and renamed in place,
+        so concurrent workers never observe a partially written entry.
+        """
+        entry = self.entry_path(key)
+        if not is_reusable(analytics) or os.path.isdir(entry):
+            return
+
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        staging = f'{entry}.tmp{os.getpid()}'
+        try:
+            shutil.copytree(work_dir, staging, symlinks=True)
+            with open(join(staging, CACHE_INFO_FILE), 'w') as f:
+                json.dump({'decompiler_config': decompiler_config, 'size': get_dir_size(staging)}, f)
+            os.rename(staging, entry)
+        except OSError:
+            # most likely another worker stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache fits in max_size.
+        Entries being restored by concurrent runs are kept.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        entries = []
+        total_size = 0
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = join(self.cache_dir, prefix)
+            for key in os.listdir(prefix_dir):
+                entry = join(prefix_dir, key)
+                if '.tmp' in key:
+                    # possibly being staged by a concurrent run
+                    continue
+                if key.endswith('.lock'):
+                    # left behind by a restore racing with the eviction of its entry
+                    if not os.path.isdir(entry[:-len('.lock')]):
+                        with file_lock(entry, blocking=False) as locked:
+                            if locked:
+                                os.remove(entry)
+                    continue
+                try:
+                    with open(join(entry, CACHE_INFO_FILE)) as f:
+                        size = json.load(f)['size']
+                except (OSError, ValueError, KeyError):
+                    # corrupt entry
+                    shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                entries.append((os.path.getmtime(entry), size, entry))
+                total_size += size
+
+        evicted = 0
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            with file_lock(entry + '.lock', blocking=False) as locked:
+                if not locked:
+                    # being restored
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+                os.remove(entry + '.lock')
+            total_size -= size
+            evicted += 1
+
+        if evicted:
+            log(f"Evicted {evicted} entries from the decompilation cache")
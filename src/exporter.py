@@ -5,10 +5,11 @@ import csv
 import os
 import src.opcodes as opcodes
 import src.basicblock as basicblock
+import src.blockparse as blockparse
 from src.common import public_function_signature_filename, event_signature_filename, error_signature_filename
 
 
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Optional, Union, Iterator
 
 opcode_output = {'alters_flow':bool, 'halts':bool, 'is_arithmetic':bool,
                  'is_call':bool, 'is_dup':bool, 'is_invalid':bool,
@@ -19,6 +20,42 @@ opcode_output = {'alters_flow':bool, 'halts':bool, 'is_arithmetic':bool,
                  'gas': int, 'ord':int
 }    
 
+# 0x64 + "solc" + 0x43 which is followed by the solc version
+# only exists in solidity bytecode compiled using solc >= 0.5.9 when it is not explicitly removed
+SOLIDITY_METADATA_PREFIX = b"\x64solc\x43".hex()
+# 0xa165 + "bzzr0" is followed by the swarn hash of the metadata file (useless to us)
+# Was introduced in solc 0.4.7 and changed in 0.5.9
+SOLIDITY_METADATA_PREFIX_OLD = b"\xa1\x65bzzr0".hex()
+# 0xa165 + "vyper" + 0x83 which is followed by the vyper version
+# works for vyper versions >= 0.3.4 (followed by the bytecode length for versions >= 0.3.5)
+VYPER_METADATA_PREFIX = b"\xa1\x65vyper\x83".hex()
+
+def normalize_bytecode(bytecode_hex: str) -> str:
+    bytecode_hex = bytecode_hex.strip().lower()
+    return bytecode_hex[2:] if bytecode_hex.startswith('0x') else bytecode_hex
+
+def strip_metadata(bytecode_hex: str) -> str:
+    """
+    Removes the CBOR-encoded compiler metadata appended to the bytecode by solc/vyper, if any.
+    The metadata is followed by its length (2 bytes), apart from vyper 0.3.4 where it
+    ends right after the version.
+    """
+    try:
+        metadata_start = len(bytecode_hex) - 4 - 2 * int(bytecode_hex[-4:], 16)
+    except ValueError:
+        return bytecode_hex
+
+    if metadata_start >= 0:
+        metadata = bytecode_hex[metadata_start:-4]
+        if any(prefix in metadata for prefix in (SOLIDITY_METADATA_PREFIX, SOLIDITY_METADATA_PREFIX_OLD, VYPER_METADATA_PREFIX)):
+            return bytecode_hex[:metadata_start]
+
+    vyper_index = bytecode_hex.rfind(VYPER_METADATA_PREFIX)
+    if vyper_index >= 0 and len(bytecode_hex) - vyper_index == len(VYPER_METADATA_PREFIX) + 6:
+        return bytecode_hex[:vyper_index]
+
+    return bytecode_hex
+
 def generate_interface():
     f = open('logic/decompiler_input_statements.dl', 'w')
     f.write('// Fact loader. This file was generated by bin/generatefacts, do not edit\n\n')
@@ -103,13 +140,14 @@ class InstructionTsvExporter(TsvExporter):
     Prints a textual representation of the given CFG to stdout.
 
     Args:
-      blocks: low-level evm block representation to be output
+      blocks: low-level evm block representation to be output, either basic blocks
+        or the compact instructions produced by the FastEVMBytecodeParser
       ordered: if True (default), print BasicBlocks in order of entry
       bytecode_hex: bytecode in hexadecimal form, used to export the compiler metadata
       metadata: dict containing metadata output by the solidity compiler
     """
 
-    def __init__(self, output_dir: str, blocks: List[basicblock.EVMBasicBlock], ordered: bool = True,
+    def __init__(self, output_dir: str, blocks: Union[List[basicblock.EVMBasicBlock], blockparse.EVMInstructions], ordered: bool = True,
                  bytecode_hex: Optional[str] = None, metadata: Optional[Dict[Any, Any]] = None):
         super().__init__(output_dir)
         self.blocks = blocks
@@ -141,6 +179,17 @@ class InstructionTsvExporter(TsvExporter):
         self.function_debug_data = process_function_debug_data(metadata.get('function_debug_info', {})) if metadata is not None else []
         self.immutable_references = process_immutable_refs(metadata.get('immutable_references', {})) if metadata is not None else []
 
+    def iter_ops(self) -> Iterator[Tuple[int, opcodes.OpCode, Optional[int]]]:
+        """
+        Iterates over the (pc, opcode, value) triples of the instructions of all blocks.
+        """
+        if isinstance(self.blocks, blockparse.EVMInstructions):
+            yield from self.blocks
+        else:
+            for block in self.blocks:
+                for op in block.evm_ops:
+                    yield op.pc, op.opcode, op.value
+
     def export(self):
         """
         Print basic block info to tsv.
@@ -169,28 +218,18 @@ class InstructionTsvExporter(TsvExporter):
                 assert '\n' not in self.bytecode_hex
                 f.write(self.bytecode_hex)
 
-            # 0x64 + "solc" + 0x43 which is followed by the solc version
-            # only exists in solidity bytecode compiled using solc >= 0.5.9 when it is not explicitly removed
-            solidity_metadata_prefix = b"\x64solc\x43".hex()
-            # 0xa165 + "bzzr0" is followed by the swarn hash of the metadata file (useless to us)
-            # Was introduced in solc 0.4.7 and changed in 0.5.9
-            solidity_metadata_prefix_old = b"\xa1\x65bzzr0".hex()
-            # 0xa165 + "vyper" + 0x83 which is followed by the vyper version
-            # works for vyper versions >= 0.3.4 (followed by the bytecode length for versions >= 0.3.5)
-            vyper_metadata_prefix = b"\xa1\x65vyper\x83".hex()
-
             language = "unknown"
             compiler_version = "unknown"
 
-            if solidity_metadata_prefix in self.bytecode_hex:
+            if SOLIDITY_METADATA_PREFIX in self.bytecode_hex:
                 language = "solidity"
-                compiler_version = get_version_str(solidity_metadata_prefix)
-            elif solidity_metadata_prefix_old in self.bytecode_hex:
+                compiler_version = get_version_str(SOLIDITY_METADATA_PREFIX)
+            elif SOLIDITY_METADATA_PREFIX_OLD in self.bytecode_hex:
                 language = "solidity"
                 compiler_version = "0.4.7<=v<0.5.9"
-            elif vyper_metadata_prefix in self.bytecode_hex:
+            elif VYPER_METADATA_PREFIX in self.bytecode_hex:
                 language = "vyper"
-                compiler_version = get_version_str(vyper_metadata_prefix)
+                compiler_version = get_version_str(VYPER_METADATA_PREFIX)
 
             with open(self.output_dir + "/compiler_info.csv", "w") as f:
                 f.write(f"{language}\t{compiler_version}")
@@ -202,12 +241,11 @@ class InstructionTsvExporter(TsvExporter):
         instructions = []
         instructions_order = []
         push_value = []
-        for block in self.blocks:
-            for op in block.evm_ops:
-                instructions_order.append(int(op.pc))
-                instructions.append((hex(op.pc), op.opcode.name))
-                if op.opcode.is_push():
-                    push_value.append((hex(op.pc), hex(op.value)))
+        for pc, opcode, value in self.iter_ops():
+            instructions_order.append(int(pc))
+            instructions.append((hex(pc), opcode.name))
+            if opcode.is_push():
+                push_value.append((hex(pc), hex(value)))
 
         instructions_order = list(map(hex, sorted(instructions_order)))
         self.generate('Statement_Next.facts', zip(instructions_order, instructions_order[1:]))
@@ -0,0 +1,124 @@
+"""results_summary.py: summary of the results of a batch, updated as each contract completes"""
+
+import math
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, List, Optional
+
+from .common import log
+
+TIME_PERCENTILES = [50, 90, 99]
+"""Percentiles of the analysis times reported in the summary."""
+
+
+class TimeHistogram:
+    """
+    Histogram of durations, in geometrically growing buckets (each 25% wider than the previous),
+    so that percentiles are known within 25% using constant memory, whatever the number of contracts.
+    """
+
+    MIN_TIME = 0.01
+    """Upper bound of the first bucket, in secs."""
+
+    RATIO = 1.25
+
+    def __init__(self) -> None:
+        self.counts: DefaultDict[int, int] = defaultdict(int)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, time: float) -> None:
+        bucket = max(math.ceil(math.log(time / TimeHistogram.MIN_TIME, TimeHistogram.RATIO)), 0) if time > TimeHistogram.MIN_TIME else 0
+        self.counts[bucket] += 1
+        self.total += 1
+        self.sum += time
+        self.max = max(self.max, time)
+
+    def percentile(self, p: float) -> float:
+        """Returns (the upper bound of the bucket of) the p-th percentile of the durations added."""
+        rank = math.ceil(self.total * p / 100)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(TimeHistogram.MIN_TIME * TimeHistogram.RATIO ** bucket, self.max)
+        return self.max
+
+
+class ResultsSummary:
+    """
+    Aggregates the (filename, files, meta, analytics) results of a batch as they arrive:
+    the number of contracts, the sums of the integer analytics, the distribution of
+    the analysis times, the share of contracts flagged by each vulnerability and
+    the number of timeouts and errors. Can be queried at any point of the run.
+    """
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.vulnerability_counts: DefaultDict[str, int] = defaultdict(int)
+        self.analytics_sums: DefaultDict[str, int] = defaultdict(int)
+        self.meta_counts: DefaultDict[str, int] = defaultdict(int)
+        self.times: DefaultDict[str, TimeHistogram] = defaultdict(TimeHistogram)
+
+    def add(self, files: List[str], meta: List[str], analytics: Dict[str, Any]) -> None:
+        self.total += 1
+        for m in meta:
+            self.meta_counts[m] += 1
+        for k, a in analytics.items():
+            if ':' in k: # tell-tale sign for vulnerability key
+                self.vulnerability_counts[k] += 1
+            if isinstance(a, int):
+                self.analytics_sums[k] += a
+            elif isinstance(a, float) and k.endswith('_time'):
+                self.times[k].add(a)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'contracts': self.total,
+            'analytics': dict(self.analytics_sums),
+            'times': {k: {
+                'total': h.sum,
+                'max': h.max,
+                **{f'p{p}': h.percentile(p) for p in TIME_PERCENTILES}
+            } for k, h in self.times.items()},
+            'flagged': {k: count / self.total for k, count in self.vulnerability_counts.items()},
+            'meta': dict(self.meta_counts)
+        }
+
+    def log(self, title: Optional[str] = None) -> None:
+        if title:
+            log(title)
+
+        if self.analytics_sums:
+            log('\n')
+            log('-'*80)
+            log('Analytics')
+            log('-'*80)
+            for res in sorted(self.analytics_sums):
+                log("  {}: {}".format(res, self.analytics_sums[res]))
+            log('\n')
+
+        if self.times:
+            log('-'*80)
+            log(f"Times (secs): total, {', '.join(f'{p}th percentile' for p in TIME_PERCENTILES)}, max")
+            log('-'*80)
+            for k in sorted(self.times):
+                h = self.times[k]
+                log(f"  {k}: {h.sum:.2f}, {', '.join(f'{h.percentile(p):.2f}' for p in TIME_PERCENTILES)}, {h.max:.2f}")
+            log('\n')
+
+        if self.vulnerability_counts:
+            log('-'*80)
+            log('Summary (flagged contracts)')
+            log('-'*80)
+
+            for res in sorted(self.vulnerability_counts):
+                log("  {}: {:.2f}%".format(res, 100 * self.vulnerability_counts[res] / self.total))
+
+        if self.meta_counts:
+            log('-'*80)
+            log('Timeouts and Errors')
+            log('-'*80)
+            for k, v in self.meta_counts.items():
+                log(f"  {k}: {v} of {self.total} contracts")
+            log('\n')
@@ -2,26 +2,52 @@ import os
 from os.path import join
 import subprocess
 import pathlib
-import hashlib
 import resource
+import signal
+import threading
 import time
 import shutil
 import json
 import re
+import tempfile
+import functools
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from multiprocessing.synchronize import Event
 
-from typing import Tuple, List, Any, Optional, Dict
+from typing import Tuple, List, Any, Optional, Dict, Callable, FrozenSet, Set
 
 from abc import ABC, abstractmethod
 
-from .common import GIGAHORSE_DIR, SOUFFLE_COMPILED_SUFFIX, log
+from .common import GIGAHORSE_DIR, SOUFFLE_COMPILED_SUFFIX, file_lock, log, open_fact_file
 from . import exporter
 from . import blockparse
+from .scheduling import FallbackPredictor, ThreadBudget, bytecode_features
+from .client_manifest import ClientManifest, stat_files, changed_files
+from .compile_cache import COMPILE_CACHE_DIR, compile_cache_key, link_executable, get_build_manifest_path, read_build_manifest, write_build_manifest
 
 devnull = subprocess.DEVNULL
 
 DEFAULT_MEMORY_LIMIT = 50 * 1_000_000_000
 """Hard capped memory limit for analyses processes (50 GB)"""
 
+SOUFFLE_BATCH_SUFFIX = '_batch'
+
+CLIENT_OUTPUT_DIR = 'clients'
+"""Subdirectory of the output dir holding the outputs of each client, when clients are run concurrently"""
+
+usage_lock = threading.Lock()
+
+SOUFFLE_BATCH_PROGRAM = 'gigahorse_batch_program'
+"""Name under which batch executables register their souffle program"""
+
+BATCH_PROGRAM_MAX_RUNS = 1000
+"""Contracts a batch executable analyzes before being restarted, as its symbol and record tables are never cleared"""
+
+BATCH_PROGRAM_MAX_RSS = 2 * 1_000_000_000
+"""Resident memory (2 GB) above which a batch executable is restarted after its current contract"""
+
+SOUFFLE_BATCH_DRIVER = join(GIGAHORSE_DIR, 'src', 'souffle_batch_driver.cpp')
+
 
 souffle_env = os.environ.copy()
 functor_path = join(GIGAHORSE_DIR, 'souffle-addon')
@@ -45,13 +71,173 @@ class TimeoutException(Exception):
 def set_memory_limit(memory_limit: int):
     resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
 
+def prepare_child_process(memory_limit: int):
+    set_memory_limit(memory_limit)
+    # Worker processes ignore SIGINT (leaving shutdown to the coordinator), analyses should still be interruptible
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
 def get_souffle_executable_path(cache_dir: str, dl_filename: str) -> str:
     executable_filename = os.path.basename(dl_filename) + SOUFFLE_COMPILED_SUFFIX
     executable_path = join(cache_dir, executable_filename)
     return executable_path
 
+def get_souffle_batch_executable_path(cache_dir: str, dl_filename: str) -> str:
+    return get_souffle_executable_path(cache_dir, dl_filename) + SOUFFLE_BATCH_SUFFIX
+
+def read_process_usage(pid: int) -> Optional[Dict[str, float]]:
+    """
+    Reads the cumulative resource usage of a running process from /proc,
+    in the format of AnalysisExecutor.stage_usage. Returns None where that is not available.
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+        with open(f'/proc/{pid}/status') as f:
+            status = f.read()
+    except OSError:
+        return None
+
+    # fields following the (parenthesized) command name, starting from the state (3rd field)
+    fields = stat[stat.rindex(')') + 2:].split()
+    ticks = os.sysconf('SC_CLK_TCK')
+    peak_rss = re.search(r'VmHWM:\s*(\d+)', status)
+    return {
+        'user_time': int(fields[11]) / ticks,
+        'sys_time': int(fields[12]) / ticks,
+        'peak_rss_kb': int(peak_rss.group(1)) if peak_rss else 0,
+        'minor_faults': int(fields[7]),
+        'major_faults': int(fields[9])
+    }
+
+
+def read_process_rss(pid: int) -> Optional[int]:
+    """The current resident memory (in bytes) of a running process, None where that is not available."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            rss = re.search(r'VmRSS:\s*(\d+)', f.read())
+    except OSError:
+        return None
+    return int(rss.group(1)) * 1024 if rss else None
+
+
+def get_datalog_io(source: str) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """
+    Returns the names of the files read (by .input directives) and written (by .output directives)
+    by the preprocessed datalog source, using souffle's defaults (<relation>.facts and <relation>.csv)
+    for directives without a filename.
+    """
+    files: Dict[str, Set[str]] = {'input': set(), 'output': set()}
+    for directive, relations, params in re.findall(r'^\s*\.(input|output)\s+([\w.]+(?:\s*,\s*[\w.]+)*)\s*(?:\(([^)]*)\))?', source, re.M):
+        filename = re.search(r'filename\s*=\s*"([^"]*)"', params)
+        io = re.search(r'IO\s*=\s*"?(\w+)', params)
+        if filename:
+            files[directive].add(os.path.basename(filename.group(1)))
+        elif not (io and io.group(1).startswith('stdout')):
+            suffix = '.facts' if directive == 'input' else '.csv'
+            files[directive].update(relation.strip() + suffix for relation in relations.split(','))
+    return frozenset(files['input']), frozenset(files['output'])
+
+
+class PersistentSouffleProgram:
+    """
+    A batch executable (see compile_batch_datalog) kept running by a worker process,
+    analyzing the contracts handed to it one after the other, so that small contracts
+    do not pay the start-up cost of the program each time. It is restarted after
+    timing out or failing, and recycled after max_runs contracts or once its resident
+    memory exceeds max_rss, as only its relations are cleared between contracts:
+    the symbols and records of all the contracts it analyzed stay in memory.
+    """
+
+    def __init__(self, executable: str, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 max_runs: int = BATCH_PROGRAM_MAX_RUNS, max_rss: int = BATCH_PROGRAM_MAX_RSS):
+        self.executable = executable
+        self.memory_limit = memory_limit
+        self.max_runs = max_runs
+        self.max_rss = max_rss
+        self.process: Optional[subprocess.Popen] = None
+        self.runs = 0
+        """Contracts analyzed by the current process"""
+
+    def start(self) -> subprocess.Popen:
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen([self.executable], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=devnull,
+                                            env=souffle_env, universal_newlines=True,
+                                            preexec_fn=lambda: prepare_child_process(self.memory_limit))
+            self.runs = 0
+        return self.process
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def run(self, in_dir: str, out_dir: str, timeout: float, threads: int = 1) -> Tuple[float, bool, Optional[Dict[str, float]]]:
+        """
+        Runs the program on the facts of in_dir, writing its outputs to out_dir, using the given number of threads.
+        Returns the time it took (-1 if it timed out), whether it succeeded,
+        and the resource usage of the run.
+        """
+        if timeout < 0:
+            return -1, False, None
+
+        start_time = time.time()
+        process = self.start()
+        assert process.stdin is not None and process.stdout is not None
+
+        # the peak RSS is reset per run, the rest of the usage is reported as a difference
+        try:
+            with open(f'/proc/{process.pid}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+        usage_before = read_process_usage(process.pid)
+
+        timed_out = threading.Event()
+        answered = False
+        answer_lock = threading.Lock()
+        def kill_on_timeout():
+            with answer_lock:
+                if not answered:
+                    timed_out.set()
+                    process.kill()
+
+        timer = threading.Timer(timeout, kill_on_timeout)
+        timer.start()
+        try:
+            process.stdin.write(f'{in_dir}\t{out_dir}\t{threads}\n')
+            process.stdin.flush()
+            response = process.stdout.readline().strip()
+        except BrokenPipeError:
+            response = ''
+        except BaseException:
+            self.stop()
+            raise
+        finally:
+            # not killed once it answered, it is still needed for its usage and the next contracts
+            with answer_lock:
+                answered = True
+            timer.cancel()
+
+        usage = read_process_usage(process.pid)
+        if usage is not None and usage_before is not None:
+            for key in ['user_time', 'sys_time', 'minor_faults', 'major_faults']:
+                usage[key] -= usage_before[key]
+
+        self.runs += 1
+        if response != 'done':
+            # killed, crashed or failed: start from a fresh process next time
+            self.stop()
+        elif self.runs >= self.max_runs or (read_process_rss(process.pid) or 0) > self.max_rss:
+            self.stop()
+
+        if timed_out.is_set():
+            return -1, False, usage
+
+        return time.time() - start_time, response == 'done', usage
+
 class AnalysisExecutor:
-    def __init__(self, timeout: int, interpreted: bool, minimum_client_time: int, debug: bool, souffle_bin: str, cache_dir: str, souffle_macros: str) -> None:
+    def __init__(self, timeout: int, interpreted: bool, minimum_client_time: int, debug: bool, souffle_bin: str, cache_dir: str, souffle_macros: str, client_jobs: int = 1) -> None:
         self.timeout = timeout
         self.interpreted = interpreted
         self.minimum_client_time = minimum_client_time
@@ -59,6 +245,71 @@ class AnalysisExecutor:
         self.souffle_bin = souffle_bin
         self.cache_dir = cache_dir
         self.souffle_macros = souffle_macros
+        self.client_jobs = client_jobs
+
+        self.peak_rss = 0
+        """Peak resident memory (in KB) of the processes run since the last reset_usage()"""
+
+        self.stage_usage: Dict[str, Dict[str, float]] = {}
+        """Resource usage of each process (stage) run since the last reset_usage(), by stage name"""
+
+        self.use_batch_programs = False
+        """Whether compiled programs are run by the persistent batch executables of the worker (for small contracts)"""
+
+        self.batch_programs: Dict[str, PersistentSouffleProgram] = {}
+
+        self.client_hashes: Dict[str, str] = {}
+        """Hash identifying the current version of each client, used by run_clients_incremental"""
+
+        self.thread_budget: Optional[ThreadBudget] = None
+        """If set, Souffle processes are given the threads left unused by the other workers"""
+
+        self.compiled_programs: Optional[Dict[str, Event]] = None
+        """If set, programs are run in interpreted mode until their event is set, once their executable is compiled"""
+
+        self.interpreted_programs: List[str] = []
+        """Programs run in interpreted mode since the last reset_usage(), while waiting for their executable"""
+
+        self.client_io: Dict[str, Optional[Tuple[FrozenSet[str], FrozenSet[str]]]] = {}
+        """Files read and written by each souffle client (see get_datalog_io), None if unknown"""
+
+    def reset_usage(self) -> None:
+        self.peak_rss = 0
+        self.stage_usage = {}
+        self.interpreted_programs = []
+
+    def is_compiled(self, souffle_client: str) -> bool:
+        if self.interpreted:
+            return False
+        return self.compiled_programs is None or self.compiled_programs[souffle_client].is_set()
+
+    def record_usage(self, stage: str, rusage: Optional[resource.struct_rusage]) -> None:
+        if rusage is None:
+            return
+
+        self.record_stage_usage(stage, {
+            'user_time': rusage.ru_utime,
+            'sys_time': rusage.ru_stime,
+            'peak_rss_kb': rusage.ru_maxrss,
+            'minor_faults': rusage.ru_minflt,
+            'major_faults': rusage.ru_majflt
+        })
+
+    def record_stage_usage(self, stage: str, usage: Optional[Dict[str, float]]) -> None:
+        if usage is None:
+            return
+
+        # clients may run concurrently (see run_parallel_souffle_clients)
+        with usage_lock:
+            self.peak_rss = max(self.peak_rss, int(usage['peak_rss_kb']))
+
+            # stages that run more than once (e.g. inliner rounds) are numbered
+            stage_name, run = stage, 1
+            while stage_name in self.stage_usage:
+                run += 1
+                stage_name = f"{stage}#{run}"
+
+            self.stage_usage[stage_name] = usage
 
     def calc_timeout(self, start_time: float, half: bool = False) -> float:
             timeout_left = self.timeout - time.time() + start_time
@@ -68,16 +319,24 @@ class AnalysisExecutor:
             return max(timeout_left, self.minimum_client_time)
 
     def run_souffle_client(self, souffle_client: str, in_dir: str, out_dir: str, start_time: float, half: bool) -> Tuple[List[str], List[str]]:
+        compiled = self.is_compiled(souffle_client)
+        if self.use_batch_programs and compiled:
+            batch_executable = get_souffle_batch_executable_path(self.cache_dir, souffle_client)
+            if os.path.isfile(batch_executable):
+                return self.run_batch_souffle_client(souffle_client, batch_executable, in_dir, out_dir, start_time, half)
+
         errors = []
         timeouts = []
         err_filename = join(out_dir, os.path.basename(souffle_client) + '.err')
-        if not self.interpreted:
+        if compiled:
             err_file: Any = devnull
             analysis_args = [
                 get_souffle_executable_path(self.cache_dir, souffle_client),
                 f"--facts={in_dir}", f"--output={out_dir}"
             ]
         else:
+            if not self.interpreted:
+                self.interpreted_programs.append(os.path.basename(souffle_client))
             err_file = open(err_filename, 'w') if self.debug else devnull
             analysis_args = [
                 self.souffle_bin,
@@ -86,7 +345,16 @@ class AnalysisExecutor:
                 "-M", self.souffle_macros
             ]
 
-        if run_process(analysis_args, self.calc_timeout(start_time, half), stderr=err_file) < 0:
+        threads = self.thread_budget.acquire() if self.thread_budget else 1
+        if threads > 1:
+            analysis_args.append(f"--jobs={threads}")
+        try:
+            runtime, rusage = run_process_with_usage(analysis_args, self.calc_timeout(start_time, half), stderr=err_file)
+        finally:
+            if self.thread_budget:
+                self.thread_budget.release(threads)
+        self.record_usage(os.path.basename(souffle_client), rusage)
+        if runtime < 0:
             timeouts.append(souffle_client)
         if self.debug and err_file != devnull:
             souffle_err = open(err_filename).read()
@@ -97,6 +365,25 @@ class AnalysisExecutor:
                 log(souffle_err)
         return errors, timeouts
 
+    def run_batch_souffle_client(self, souffle_client: str, batch_executable: str, in_dir: str, out_dir: str, start_time: float, half: bool) -> Tuple[List[str], List[str]]:
+        errors = []
+        timeouts = []
+        if souffle_client not in self.batch_programs:
+            self.batch_programs[souffle_client] = PersistentSouffleProgram(batch_executable)
+
+        threads = self.thread_budget.acquire() if self.thread_budget else 1
+        try:
+            runtime, ok, usage = self.batch_programs[souffle_client].run(in_dir, out_dir, self.calc_timeout(start_time, half), threads)
+        finally:
+            if self.thread_budget:
+                self.thread_budget.release(threads)
+        self.record_stage_usage(os.path.basename(souffle_client), usage)
+        if runtime < 0:
+            timeouts.append(souffle_client)
+        elif not ok and self.debug:
+            errors.append(os.path.basename(souffle_client))
+        return errors, timeouts
+
     def run_script_client(self, script_client: str, in_dir: str, out_dir: str, start_time: float):
         errors = []
         timeouts = []
@@ -105,13 +392,14 @@ class AnalysisExecutor:
         client_name = client_split[0].split('/')[-1]
         err_filename = join(out_dir, client_name+'.err')
 
-        runtime = run_process(
+        runtime, rusage = run_process_with_usage(
             client_split,
             self.calc_timeout(start_time),
             devnull,
             open(err_filename, 'w'),
             cwd=in_dir
         )
+        self.record_usage(client_name, rusage)
         if len(open(err_filename).read()) > 0:
             errors.append(client_name)
         if runtime < 0:
@@ -119,20 +407,166 @@ class AnalysisExecutor:
         return errors, timeouts
 
 
-    def run_clients(self, souffle_clients: List[str], other_clients: List[str], in_dir: str, out_dir: str, start_time: float, half: bool = False) -> Tuple[List[str], List[str]]:
+    def run_clients(self, souffle_clients: List[str], other_clients: List[str], in_dir: str, out_dir: str, start_time: float, half: bool = False,
+                    client_times: Optional[Dict[str, float]] = None) -> Tuple[List[str], List[str]]:
+        """
+        Runs the souffle clients and then the script clients, returning the clients that timed out and the ones that failed.
+        If client_times is given, the time each client took is recorded in it, by client name.
+
+        With client_jobs > 1, the souffle clients that do not depend on each other are run concurrently,
+        each writing to its own subdirectory of out_dir (see run_parallel_souffle_clients).
+        Script clients may read the outputs of any other client, they are run one after the other at the end.
+        """
         errors = []
         timeouts = []
-        for souffle_client in souffle_clients:
-            e, t = self.run_souffle_client(souffle_client, in_dir, out_dir, start_time, half)
+        def timed(client_name: str, run: Callable[[], Tuple[List[str], List[str]]]) -> None:
+            client_start = time.time()
+            e, t = run()
+            if client_times is not None:
+                client_times[client_name] = time.time() - client_start
             errors.extend(e)
             timeouts.extend(t)
 
+        if self.client_jobs > 1 and len(souffle_clients) > 1:
+            self.run_parallel_souffle_clients(souffle_clients, in_dir, out_dir, start_time, half, timed)
+        else:
+            for souffle_client in souffle_clients:
+                timed(os.path.basename(souffle_client), lambda: self.run_souffle_client(souffle_client, in_dir, out_dir, start_time, half))
+
         for other_client in other_clients:
-            e,t = self.run_script_client(other_client, in_dir, out_dir, start_time)
-            errors.extend(e)
-            timeouts.extend(t)
+            timed(os.path.basename(other_client.split(' ')[0]), lambda: self.run_script_client(other_client, in_dir, out_dir, start_time))
         return timeouts, errors
 
+    def run_clients_incremental(self, souffle_clients: List[str], other_clients: List[str], out_dir: str, start_time: float,
+                                client_times: Optional[Dict[str, float]] = None, reuse: bool = False) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Runs the clients on the decompiler output in out_dir like run_clients, keeping a ClientManifest
+        of the runs in out_dir. With reuse, clients whose hash (see client_hashes) and inputs are unchanged
+        since they last ran, and that do not depend on a client being rerun, are skipped, keeping their earlier outputs.
+        Returns the clients that timed out, the ones that failed, and the ones skipped.
+        """
+        manifest = ClientManifest(out_dir)
+        clients = souffle_clients + other_clients
+        parallel = self.client_jobs > 1 and len(souffle_clients) > 1
+
+        souffle_dependencies = self.souffle_client_dependencies(souffle_clients) if parallel else []
+        def dependencies(i: int) -> List[str]:
+            # concurrent souffle clients only see the outputs of the ones they depend on
+            if parallel and i < len(souffle_clients):
+                return [souffle_clients[j] for j in souffle_dependencies[i]]
+            return clients[:i]
+
+        stamps = stat_files(out_dir)
+        rerun: List[str] = []
+        for i, client in enumerate(clients):
+            inputs = manifest.fingerprint(stamps, manifest.excluded_files(dependencies(i)))
+            unchanged = reuse and manifest.is_unchanged(client, self.client_hashes.get(client), inputs)
+            # clients writing the same files must still run in order
+            clobbered = any(set(manifest.outputs(client)) & set(manifest.outputs(c)) for c in rerun)
+            if not unchanged or clobbered or any(c in rerun for c in dependencies(i)):
+                rerun.append(client)
+
+        timeouts: List[str] = []
+        errors: List[str] = []
+        def run(souffle: List[str], other: List[str]) -> None:
+            t, e = self.run_clients(souffle, other, out_dir, out_dir, start_time, client_times=client_times)
+            timeouts.extend(t)
+            errors.extend(e)
+
+        souffle_rerun = [c for c in souffle_clients if c in rerun]
+        if parallel and len(souffle_rerun) > 1:
+            run(souffle_rerun, [])
+            for client in souffle_rerun:
+                failed = client in timeouts or os.path.basename(client) in errors
+                outputs = sorted(os.listdir(join(out_dir, CLIENT_OUTPUT_DIR, os.path.basename(client))))
+                manifest.record(client, None if failed else self.client_hashes.get(client), outputs)
+            sequential = [c for c in other_clients if c in rerun]
+        else:
+            sequential = [c for c in clients if c in rerun]
+
+        for client in sequential:
+            before = stat_files(out_dir)
+            failures = len(timeouts) + len(errors)
+            if client in souffle_clients:
+                run([client], [])
+            else:
+                run([], [client])
+            failed = len(timeouts) + len(errors) > failures
+            manifest.record(client, None if failed else self.client_hashes.get(client), changed_files(before, stat_files(out_dir)))
+
+        stamps = stat_files(out_dir)
+        for i, client in enumerate(clients):
+            if client in manifest.entries:
+                manifest.update_inputs(client, manifest.fingerprint(stamps, manifest.excluded_files(dependencies(i))))
+        manifest.save()
+
+        return timeouts, errors, [c for c in clients if c not in rerun]
+
+    def get_client_io(self, souffle_client: str) -> Optional[Tuple[FrozenSet[str], FrozenSet[str]]]:
+        if souffle_client not in self.client_io:
+            try:
+                self.client_io[souffle_client] = get_datalog_io(preprocess_datalog(souffle_client, self.souffle_macros))
+            except AssertionError:
+                self.client_io[souffle_client] = None
+        return self.client_io[souffle_client]
+
+    def souffle_client_dependencies(self, souffle_clients: List[str]) -> List[List[int]]:
+        """
+        Returns, for each souffle client, the (indices of the) earlier clients it has to run after:
+        the ones writing files it reads, and the ones reading files it writes, as found in their
+        .input and .output directives. Clients whose files are unknown depend on all earlier clients.
+        Clients writing the same files may run at once, their outputs are linked in client order.
+        """
+        io = [self.get_client_io(client) for client in souffle_clients]
+        dependencies = []
+        for j, io_j in enumerate(io):
+            dependencies.append([i for i, io_i in enumerate(io[:j])
+                                 if io_i is None or io_j is None or io_i[1] & io_j[0] or io_i[0] & io_j[1]])
+        return dependencies
+
+    def run_parallel_souffle_clients(self, souffle_clients: List[str], in_dir: str, out_dir: str, start_time: float, half: bool,
+                                     timed: Callable[[str, Callable[[], Tuple[List[str], List[str]]]], None]) -> None:
+        """
+        Runs up to client_jobs souffle clients at once, each writing to its own
+        CLIENT_OUTPUT_DIR subdirectory of out_dir, so that they cannot clobber each other's outputs.
+        A client is started once the clients it depends on (see souffle_client_dependencies) are done.
+        The outputs of each client are linked into out_dir as soon as it is done, unless a later
+        client already wrote the same file, as if the clients had been run one after the other.
+        """
+        client_dirs = []
+        for souffle_client in souffle_clients:
+            client_dir = join(out_dir, CLIENT_OUTPUT_DIR, os.path.basename(souffle_client))
+            os.makedirs(client_dir, exist_ok=True)
+            client_dirs.append(client_dir)
+
+        owners: Dict[str, int] = {}
+        def link_outputs(i: int) -> None:
+            for fname in os.listdir(client_dirs[i]):
+                if owners.get(fname, -1) > i:
+                    continue
+                owners[fname] = i
+                link = join(out_dir, fname)
+                if os.path.lexists(link):
+                    os.remove(link)
+                os.symlink(os.path.relpath(join(client_dirs[i], fname), out_dir), link)
+
+        dependencies = self.souffle_client_dependencies(souffle_clients)
+        pending = set(range(len(souffle_clients)))
+        running: Dict[Future, int] = {}
+        with ThreadPoolExecutor(max_workers=self.client_jobs) as executor:
+            while pending or running:
+                for j in sorted(pending):
+                    if not any(i in pending or i in running.values() for i in dependencies[j]):
+                        pending.remove(j)
+                        running[executor.submit(timed, os.path.basename(souffle_clients[j]),
+                                                functools.partial(self.run_souffle_client, souffle_clients[j], in_dir, client_dirs[j], start_time, half))] = j
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    future.result()
+                    link_outputs(i)
+
 def run_process(process_args, timeout: float, stdout=devnull, stderr=devnull, cwd: str='.', memory_limit=DEFAULT_MEMORY_LIMIT) -> float:
     ''' Runs process described by args, for a specific time period
     as specified by the timeout.
@@ -140,51 +574,196 @@ def run_process(process_args, timeout: float, stdout=devnull, stderr=devnull, cw
     Returns the time it took to run the process and -1 if the process
     times out
     '''
+    runtime, _ = run_process_with_usage(process_args, timeout, stdout, stderr, cwd, memory_limit)
+    return runtime
+
+
+def run_process_with_usage(process_args, timeout: float, stdout=devnull, stderr=devnull, cwd: str='.', memory_limit=DEFAULT_MEMORY_LIMIT) -> Tuple[float, Optional[resource.struct_rusage]]:
+    ''' Same as run_process, additionally returning the resource usage
+    of the process (None if it was never started).
+    '''
     if timeout < 0:
         # This can theoretically happen
-        return -1
+        return -1, None
 
     start_time = time.time()
 
-    try:
-        subprocess.run(process_args, timeout=timeout, stdout=stdout, stderr=stderr, cwd=cwd, env=souffle_env, preexec_fn=lambda: set_memory_limit(memory_limit))
-    except subprocess.TimeoutExpired:
-        return -1
-
-    return time.time() - start_time
+    process = subprocess.Popen(process_args, stdout=stdout, stderr=stderr, cwd=cwd, env=souffle_env, preexec_fn=lambda: prepare_child_process(memory_limit))
 
+    timed_out = threading.Event()
+    exited = False
+    exit_lock = threading.Lock()
+    def kill_on_timeout():
+        with exit_lock:
+            if not exited:
+                timed_out.set()
+                process.kill()
 
-def compile_datalog(spec: str, souffle_bin: str, cache_dir: str, reuse_datalog_bin: bool, souffle_macros: str) -> None:
-    pathlib.Path(cache_dir).mkdir(exist_ok=True)
-    executable_path = get_souffle_executable_path(cache_dir, spec)
-
-    if reuse_datalog_bin and os.path.isfile(executable_path):
-        return
-
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    try:
+        # Wait for the process to exit without reaping it, so that its pid cannot be reused until
+        # the timer can no longer kill it. We then reap it ourselves, as wait4 also reports its resource usage.
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        with exit_lock:
+            exited = True
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        timer.cancel()
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+    if timed_out.is_set():
+        return -1, rusage
+
+    return time.time() - start_time, rusage
+
+
+def preprocess_datalog(spec: str, souffle_macros: str, included_files: Optional[List[str]] = None) -> str:
+    """
+    Returns the preprocessed source of spec. If included_files is given,
+    the paths of all the files the source was read from are added to it.
+    """
     cpp_macros = []
     for macro_def in souffle_macros.split(' '):
         cpp_macros.append('-D')
         cpp_macros.append(macro_def)
 
     preproc_command = ['cpp', '-P', spec] + cpp_macros
-    preproc_process = subprocess.run(preproc_command, universal_newlines=True, capture_output=True)
-    assert not(preproc_process.returncode), f"Preprocessing for {spec} failed. Stopping."
-
-    hasher = hashlib.md5()
-    hasher.update(preproc_process.stdout.encode('utf-8'))
-    md5_hash = hasher.hexdigest()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dependencies_file = join(tmp_dir, 'dependencies.d')
+        if included_files is not None:
+            preproc_command += ['-MD', '-MF', dependencies_file]
+        preproc_process = subprocess.run(preproc_command, universal_newlines=True, capture_output=True)
+        assert not(preproc_process.returncode), f"Preprocessing for {spec} failed. Stopping."
+
+        if included_files is not None:
+            # make rule: "<target>: <dependencies>", with escaped newlines
+            with open(dependencies_file) as f:
+                dependencies = f.read().replace('\\\n', ' ')
+            included_files += [os.path.abspath(path) for path in dependencies.split(':', 1)[1].split()]
+
+    return preproc_process.stdout
+
+
+def find_souffle_compile(souffle_bin: str) -> Optional[str]:
+    """
+    Returns the script souffle uses to compile the C++ code it generates (with the compiler,
+    flags and libraries souffle was configured with), installed next to the souffle binary.
+    """
+    souffle_path = shutil.which(souffle_bin)
+    if souffle_path is None:
+        return None
+    # souffle-compile before Souffle 2.3
+    for name in ['souffle-compile.py', 'souffle-compile']:
+        for bin_dir in dict.fromkeys([os.path.dirname(souffle_path), os.path.dirname(os.path.realpath(souffle_path))]):
+            if os.access(join(bin_dir, name), os.X_OK):
+                return join(bin_dir, name)
+    return None
+
+
+def compile_batch_datalog(spec: str, souffle_bin: str, souffle_macros: str, output_path: str) -> None:
+    """
+    Builds an executable that keeps the program of spec loaded, running it on several
+    contracts one after the other (see souffle_batch_driver.cpp and PersistentSouffleProgram).
+    The driver is compiled along with the C++ code generated for spec by souffle-compile,
+    as souffle does when compiling a program.
+    """
+    souffle_compile = find_souffle_compile(souffle_bin)
+    assert souffle_compile is not None, f"souffle-compile not found next to {souffle_bin}."
+
+    build_dir = output_path + '_build'
+    os.makedirs(build_dir, exist_ok=True)
+    try:
+        program_cpp = join(build_dir, SOUFFLE_BATCH_PROGRAM + '.cpp')
+        generation_command = [souffle_bin, '-M', souffle_macros, '-g', program_cpp, spec, '-L', functor_path]
+        process = subprocess.run(generation_command, universal_newlines=True, env = souffle_env)
+        assert not(process.returncode), f"C++ generation for {spec} failed."
+
+        # the program without its main, followed by the driver
+        driver_cpp = join(build_dir, SOUFFLE_BATCH_PROGRAM + '_driver.cpp')
+        with open(driver_cpp, 'w') as f:
+            f.write('#define __EMBEDDED_SOUFFLE__\n')
+            f.write(f'#define GIGAHORSE_BATCH_PROGRAM "{SOUFFLE_BATCH_PROGRAM}"\n')
+            f.write(f'#include "{program_cpp}"\n')
+            f.write(f'#include "{SOUFFLE_BATCH_DRIVER}"\n')
+
+        # builds the executable named after the source, as for souffle -o
+        compilation_command = [souffle_compile, f'-L{functor_path}', '-lfunctors', driver_cpp]
+        process = subprocess.run(compilation_command, universal_newlines=True, env = souffle_env)
+        executable = os.path.splitext(driver_cpp)[0]
+        assert not(process.returncode) and os.path.isfile(executable), f"Batch executable compilation for {spec} failed."
+        os.replace(executable, output_path)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def get_compile_cache_key(spec: str, souffle_bin: str, cache_dir: str, souffle_macros: str) -> str:
+    """
+    Returns the key of the compile cache entry holding the executable of spec.
+    """
+    compiled_dir = join(cache_dir, COMPILE_CACHE_DIR)
+    os.makedirs(compiled_dir, exist_ok=True)
+
+    # the executable depends on the source, the souffle version, the functor library and the compilation flags
+    functor_lib = join(functor_path, 'libfunctors.so')
+    flags = ['-M', souffle_macros, '-L', functor_path]
+
+    # avoid preprocessing and hashing when none of the inputs of the previous build changed
+    manifest_path = get_build_manifest_path(cache_dir, spec, [souffle_bin] + flags)
+    key = read_build_manifest(manifest_path)
+    if key is None or not os.path.exists(join(compiled_dir, key)):
+        included_files: List[str] = []
+        source = preprocess_datalog(spec, souffle_macros, included_files)
+        key = compile_cache_key(source, souffle_bin, [functor_lib], flags)
+        souffle_path = shutil.which(souffle_bin)
+        write_build_manifest(manifest_path, key, included_files + [functor_lib] + ([os.path.realpath(souffle_path)] if souffle_path else []))
+    return key
+
+
+def compile_datalog(spec: str, souffle_bin: str, cache_dir: str, reuse_datalog_bin: bool, souffle_macros: str, batch: bool = False) -> None:
+    pathlib.Path(cache_dir).mkdir(exist_ok=True)
+    executable_path = get_souffle_executable_path(cache_dir, spec)
+    batch_executable_path = get_souffle_batch_executable_path(cache_dir, spec)
 
-    cache_path = join(cache_dir, md5_hash)
+    if reuse_datalog_bin and os.path.isfile(executable_path) and (not batch or os.path.isfile(batch_executable_path)):
+        return
 
-    if os.path.exists(cache_path):
-        log(f"Found cached executable for {spec}")
-    else:
-        log(f"Compiling {spec} to C++ program and executable")
-        compilation_command = [souffle_bin, '-M', souffle_macros, '-o', cache_path, spec, '-L', functor_path]
-        process = subprocess.run(compilation_command, universal_newlines=True, env = souffle_env)
-        assert not(process.returncode), f"Compilation for {spec} failed. Stopping."
+    cache_path = join(cache_dir, COMPILE_CACHE_DIR, get_compile_cache_key(spec, souffle_bin, cache_dir, souffle_macros))
 
-    shutil.copy2(cache_path, executable_path)
+    # concurrent runs sharing the cache dir compile each program once
+    with file_lock(cache_path + '.lock'):
+        if os.path.exists(cache_path):
+            log(f"Found cached executable for {spec}")
+        else:
+            log(f"Compiling {spec} to C++ program and executable")
+            tmp_path = f'{cache_path}.tmp{os.getpid()}'
+            compilation_command = [souffle_bin, '-M', souffle_macros, '-o', tmp_path, spec, '-L', functor_path]
+            process = subprocess.run(compilation_command, universal_newlines=True, env = souffle_env)
+            if os.path.exists(tmp_path + '.cpp'):
+                os.remove(tmp_path + '.cpp')
+            assert not(process.returncode), f"Compilation for {spec} failed. Stopping."
+            os.replace(tmp_path, cache_path)
+
+        link_executable(cache_path, executable_path)
+
+    if batch:
+        batch_cache_path = cache_path + SOUFFLE_BATCH_SUFFIX
+        with file_lock(batch_cache_path + '.lock'):
+            if not os.path.exists(batch_cache_path):
+                log(f"Compiling {spec} to batch executable")
+                try:
+                    compile_batch_datalog(spec, souffle_bin, souffle_macros, f'{batch_cache_path}.tmp{os.getpid()}')
+                    os.replace(f'{batch_cache_path}.tmp{os.getpid()}', batch_cache_path)
+                except AssertionError as e:
+                    # contracts are then analyzed by the regular executable
+                    log(f"{e} Not batching contracts for {spec}.")
+                    if os.path.exists(batch_executable_path):
+                        os.remove(batch_executable_path)
+                    return
+            link_executable(batch_cache_path, batch_executable_path)
 
 
 def write_context_depth_file(filename: str, max_context_depth: Optional[int] = None) -> None:
@@ -196,12 +775,14 @@ def write_context_depth_file(filename: str, max_context_depth: Optional[int] = N
 
 def imprecise_decomp_out(out_dir: str) -> bool:
     """Used to check if decompilation output is imprecise, currently only checks Analytics_JumpToMany"""
-    imprecision_metric = len(open(join(out_dir, 'Analytics_JumpToMany.csv'), 'r').readlines())
+    with open_fact_file(join(out_dir, 'Analytics_JumpToMany.csv')) as f:
+        imprecision_metric = len(f.readlines())
     return imprecision_metric > 0
 
 
 class AbstractFactGenerator(ABC):
     _analysis_executor: AnalysisExecutor
+    _fallback_predictor: Optional[FallbackPredictor] = None
     pattern: re.Pattern
 
     def __init__(self, args, analysis_executor: AnalysisExecutor):
@@ -215,8 +796,21 @@ class AbstractFactGenerator(ABC):
     def analysis_executor(self, analysis_executor: AnalysisExecutor):
         self._analysis_executor = analysis_executor
 
+    @property
+    def fallback_predictor(self) -> Optional[FallbackPredictor]:
+        return self._fallback_predictor
+
+    @fallback_predictor.setter
+    def fallback_predictor(self, fallback_predictor: Optional[FallbackPredictor]):
+        self._fallback_predictor = fallback_predictor
+
     @abstractmethod
-    def generate_facts(self, contract_filename: str, work_dir: str, out_dir: str) -> Tuple[float, float, str]:
+    def generate_facts(self, contract_filename: str, work_dir: str, out_dir: str, analytics: Optional[Dict[str, Any]] = None) -> Tuple[float, float, str]:
+        """
+        Generates the facts for contract_filename, returning the time spent
+        before decompilation, the time spent decompiling and the decompiler config used.
+        Generators may record additional per-contract analytics in analytics.
+        """
         pass
 
     @abstractmethod
@@ -252,11 +846,21 @@ class MixedFactGenerator(AbstractFactGenerator):
         for fact_gen in self.fact_generators.values():
             fact_gen.analysis_executor = analysis_executor
 
-    def generate_facts(self, contract_filename: str, work_dir: str, out_dir: str) -> Tuple[float, float, str]:
+    @property
+    def fallback_predictor(self) -> Optional[FallbackPredictor]:
+        return self._fallback_predictor
+
+    @fallback_predictor.setter
+    def fallback_predictor(self, fallback_predictor: Optional[FallbackPredictor]):
+        self._fallback_predictor = fallback_predictor
+        for fact_gen in self.fact_generators.values():
+            fact_gen.fallback_predictor = fallback_predictor
+
+    def generate_facts(self, contract_filename: str, work_dir: str, out_dir: str, analytics: Optional[Dict[str, Any]] = None) -> Tuple[float, float, str]:
         generator = self.contract_filename_to_gen[contract_filename]
         del self.contract_filename_to_gen[contract_filename]
         self.out_dir_to_gen[out_dir] = generator
-        return generator.generate_facts(contract_filename, work_dir, out_dir)
+        return generator.generate_facts(contract_filename, work_dir, out_dir, analytics)
 
     def get_datalog_files(self) -> List[str]:
         datalog_files = []
@@ -303,7 +907,7 @@ class DecompilerFactGenerator(AbstractFactGenerator):
         if args.disable_precise_fallback:
             log("The use of the --disable_precise_fallback is deprecated. Its functionality is disabled.")
 
-    def generate_facts(self, contract_filename: str, work_dir: str, out_dir: str) -> Tuple[float, float, str]:
+    def generate_facts(self, contract_filename: str, work_dir: str, out_dir: str, analytics: Optional[Dict[str, Any]] = None) -> Tuple[float, float, str]:
         with open(contract_filename) as file:
             bytecode = file.read().strip()
 
@@ -313,17 +917,18 @@ class DecompilerFactGenerator(AbstractFactGenerator):
                 metadata = {}
 
         disassemble_start = time.time()
-        blocks = blockparse.EVMBytecodeParser(bytecode).parse()
-        exporter.InstructionTsvExporter(work_dir, blocks, True, bytecode, metadata).export()
+        instructions = blockparse.FastEVMBytecodeParser(bytecode).parse()
+        exporter.InstructionTsvExporter(work_dir, instructions, True, bytecode, metadata).export()
 
-        os.symlink(join(work_dir, 'bytecode.hex'), join(out_dir, 'bytecode.hex'))
+        # relative links, so that the working dir can be copied around (e.g. by the decompilation cache)
+        os.symlink(os.path.relpath(join(work_dir, 'bytecode.hex'), out_dir), join(out_dir, 'bytecode.hex'))
 
         open(join(out_dir, 'proto_vulnerability.csv'), 'w').close()
         open(join(out_dir, 'vulnerability.csv'), 'w').close()
 
         if os.path.exists(join(work_dir, 'compiler_info.csv')):
             # Create a symlink with a name starting with 'Verbatim_' to be added to results json
-            os.symlink(join(work_dir, 'compiler_info.csv'), join(out_dir, 'Verbatim_compiler_info.csv'))
+            os.symlink(os.path.relpath(join(work_dir, 'compiler_info.csv'), out_dir), join(out_dir, 'Verbatim_compiler_info.csv'))
 
         timeouts, _ = self.analysis_executor.run_clients(self.souffle_pre_clients, self.other_pre_clients, work_dir, work_dir, disassemble_start)
         if timeouts:
@@ -332,9 +937,18 @@ class DecompilerFactGenerator(AbstractFactGenerator):
 
         write_context_depth_file(os.path.join(work_dir, 'MaxContextDepth.csv'), self.context_depth)
 
+        features = bytecode_features(instructions)
+        predicted_fallback = not self.disable_scalable_fallback and self.fallback_predictor is not None and \
+            self.fallback_predictor.predict(os.path.split(contract_filename)[1], features)
+        if analytics is not None:
+            analytics.update((k, v) for k, v in features.items() if k != 'bytecode_size')
+            analytics['predicted_fallback'] = int(predicted_fallback)
+
         decomp_start = time.time()
 
-        decompiler_config = self.run_decomp(contract_filename, work_dir, out_dir, disassemble_start)
+        decompiler_config, decomp_timeouts = self.run_decomp(contract_filename, work_dir, out_dir, disassemble_start, predicted_fallback)
+        if analytics is not None:
+            analytics['decomp_timeouts'] = len(decomp_timeouts)
 
         return decomp_start - disassemble_start, time.time() - decomp_start, decompiler_config
 
@@ -345,16 +959,23 @@ class DecompilerFactGenerator(AbstractFactGenerator):
 
         return datalog_files
 
-    def run_decomp(self, contract_filename: str, in_dir: str, out_dir: str, start_time: float) -> str:
+    def run_decomp(self, contract_filename: str, in_dir: str, out_dir: str, start_time: float, skip_default: bool = False) -> Tuple[str, List[str]]:
+        """
+        Decompiles using the default config, falling back to the scalable config if that fails.
+        With skip_default, the scalable config is used right away, with the whole timeout.
+        Returns the config used, along with the decompiler programs that timed out before it.
+        """
         config = "default"
-        def_timeouts, _ = self.analysis_executor.run_clients([DecompilerFactGenerator.decompiler_dl], [], in_dir, out_dir, start_time, not self.disable_scalable_fallback)
+        def_timeouts: List[str] = []
+        if not skip_default:
+            def_timeouts, _ = self.analysis_executor.run_clients([DecompilerFactGenerator.decompiler_dl], [], in_dir, out_dir, start_time, not self.disable_scalable_fallback)
 
-        if def_timeouts or not self.decomp_out_produced(out_dir):
+        if skip_default or def_timeouts or not self.decomp_out_produced(out_dir):
             if self.disable_scalable_fallback:
                 raise TimeoutException()
             else:
                 # Default using scalable fallback config
-                log(f"Using scalable fallback decompilation configuration for {os.path.split(contract_filename)[1]}")
+                log(f"Using {'predicted ' if skip_default else ''}scalable fallback decompilation configuration for {os.path.split(contract_filename)[1]}")
                 write_context_depth_file(os.path.join(in_dir, 'MaxContextDepth.csv'), 10)
 
                 sca_timeouts, _ = self.analysis_executor.run_clients([DecompilerFactGenerator.fallback_scalable_decompiler_dl], [], in_dir, out_dir, start_time)
@@ -363,7 +984,7 @@ class DecompilerFactGenerator(AbstractFactGenerator):
                 else:
                     raise TimeoutException()
 
-        return config
+        return config, def_timeouts
 
     def match_pattern(self, contract_filename: str) -> bool:
         return self.pattern.match(contract_filename) is not None
@@ -380,7 +1001,7 @@ class CustomFactGenerator(AbstractFactGenerator):
         self.pattern = re.compile(pattern)
         self.fact_generator_scripts = custom_fact_gen_scripts
 
-    def generate_facts(self, contract_filename: str, work_dir: str, out_dir: str) -> Tuple[float, float, str]:
+    def generate_facts(self, contract_filename: str, work_dir: str, out_dir: str, analytics: Optional[Dict[str, Any]] = None) -> Tuple[float, float, str]:
         errors = []
         timeouts = []
         fact_gen_time_start = time.time()
@@ -394,6 +1015,8 @@ class CustomFactGenerator(AbstractFactGenerator):
                 e,t = self.analysis_executor.run_script_client(arguments, work_dir, out_dir, fact_gen_time_start)
                 errors.extend(e)
                 timeouts.extend(t)
+        if analytics is not None:
+            analytics['decomp_timeouts'] = len(timeouts)
         return time.time() - fact_gen_time_start, 0.0, ""
 
     def get_datalog_files(self) -> List[str]:
@@ -0,0 +1,304 @@
+"""scheduling.py: cost prediction, ordering and admission control for the contracts of a batch"""
+
+import hashlib
+import heapq
+import multiprocessing
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import blockparse
+from . import opcodes
+from .exporter import normalize_bytecode, strip_metadata
+
+SCHEDULING_POLICIES = ['listing', 'largest_first', 'predicted_cost']
+"""
+listing: directory listing order
+largest_first: largest bytecode first
+predicted_cost: most expensive first, based on the analysis times of a previous run
+"""
+
+
+def group_duplicate_contracts(contracts: List[str], ignore_metadata: bool) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Groups contracts with identical (normalized) bytecode and solc metadata file.
+    Returns the contracts to analyze, one per group, along with the names of the
+    other group members for each of them, to which its results are replicated.
+    """
+    representatives: Dict[bytes, str] = {}
+    duplicates: Dict[str, List[str]] = {}
+    unique_contracts = []
+
+    for contract_filename in contracts:
+        with open(contract_filename) as f:
+            bytecode = normalize_bytecode(f.read())
+        if ignore_metadata:
+            bytecode = strip_metadata(bytecode)
+
+        hasher = hashlib.sha256(bytecode.encode('utf-8'))
+        if os.path.exists(metadata_file := f"{contract_filename[:-4]}_metadata.json"):
+            with open(metadata_file, 'rb') as f:
+                hasher.update(f.read())
+        key = hasher.digest()
+
+        if key in representatives:
+            representative_name = os.path.split(representatives[key])[1]
+            duplicates[representative_name].append(os.path.split(contract_filename)[1])
+        else:
+            representatives[key] = contract_filename
+            duplicates[os.path.split(contract_filename)[1]] = []
+            unique_contracts.append(contract_filename)
+
+    return unique_contracts, {k: v for k, v in duplicates.items() if v}
+
+
+def predict_costs(names: List[str], sizes: List[int], history: Dict[str, float], history_sizes: Dict[str, int]) -> List[float]:
+    """
+    Predicts the analysis time of each contract. Contracts analyzed in the previous run
+    take the time they took then, the rest are estimated from their size, using
+    the average time per byte of the previous run.
+
+    Args:
+      names: contract names
+      sizes: bytecode sizes of the contracts
+      history: analysis time of the contracts of a previous run, by name
+      history_sizes: bytecode size of the contracts of a previous run, by name
+    """
+    total_size = sum(history_sizes.values())
+    total_time = sum(history[name] for name in history_sizes)
+    time_per_byte = total_time / total_size if total_size else 1.0
+
+    return [history[name] if name in history else size * time_per_byte for name, size in zip(names, sizes)]
+
+
+def order_by_cost(costs: List[float]) -> List[int]:
+    """Returns the indices of the given costs, most expensive first."""
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+def simulate_schedule(durations: List[float], num_of_jobs: int) -> Tuple[float, float]:
+    """
+    Simulates handing out tasks in the given order to the first available out
+    of num_of_jobs workers. Returns the makespan and the total idle worker time,
+    i.e. the time workers spent waiting for the last tasks to finish.
+    """
+    workers = [0.0] * num_of_jobs
+    for duration in durations:
+        heapq.heappush(workers, heapq.heappop(workers) + duration)
+
+    makespan = max(workers) if durations else 0.0
+    return makespan, makespan * num_of_jobs - sum(durations)
+
+
+def schedule_report(durations: Dict[int, float], order: List[int], num_of_jobs: int) -> Optional[str]:
+    """
+    Reports the idle worker time of the schedule that ran (tasks given in order),
+    compared to the time the same tasks would have left workers idle if they
+    were handed out in listing order.
+
+    Args:
+      durations: the measured duration of each analyzed task, by listing index
+      order: the listing indices of the tasks in the order they were scheduled
+    """
+    if not durations:
+        return None
+
+    makespan, idle = simulate_schedule([durations[i] for i in order if i in durations], num_of_jobs)
+    report = f"Idle worker time: {idle:.2f} secs (makespan {makespan:.2f} secs)."
+
+    if order != sorted(order):
+        listing_makespan, listing_idle = simulate_schedule([durations[i] for i in sorted(durations)], num_of_jobs)
+        report += f" Listing order: {listing_idle:.2f} secs (makespan {listing_makespan:.2f} secs), saved {listing_idle - idle:.2f} secs."
+
+    return report
+
+
+DECOMPILATION_FEATURES = ['bytecode_size', 'jump_count', 'jumpi_count', 'jumpdest_count']
+"""Cheap bytecode features used to predict the cost of decompilation."""
+
+
+def bytecode_features(instructions: blockparse.EVMInstructions) -> Dict[str, int]:
+    codes = instructions.codes
+    push_lens = blockparse.PUSH_LEN_TABLE
+    return {
+        'bytecode_size': len(codes) + sum(push_lens[code] for code in codes),
+        'jump_count': codes.count(opcodes.JUMP.code),
+        'jumpi_count': codes.count(opcodes.JUMPI.code),
+        'jumpdest_count': codes.count(opcodes.JUMPDEST.code),
+    }
+
+
+def learn_threshold(samples: List[Tuple[Dict[str, Any], bool]]) -> Tuple[Optional[str], int]:
+    """
+    Learns the feature and threshold that best separate the samples that needed
+    the scalable fallback (feature >= threshold) from the ones that did not.
+    The chosen cut maximizes the number of contracts correctly sent to the fallback
+    minus the number of contracts sent to it needlessly.
+    Returns (None, 0) if no cut is beneficial.
+    """
+    best_feature: Optional[str] = None
+    best_threshold = 0
+    best_gain = 0
+    for feature in DECOMPILATION_FEATURES:
+        values = sorted(((analytics[feature], needed) for analytics, needed in samples if feature in analytics), reverse=True)
+        gain = 0
+        for i, (value, needed) in enumerate(values):
+            gain += 1 if needed else -1
+            # only cut between distinct values
+            if i + 1 < len(values) and values[i + 1][0] == value:
+                continue
+            if gain > best_gain:
+                best_feature, best_threshold, best_gain = feature, value, gain
+    return best_feature, best_threshold
+
+
+class FallbackPredictor:
+    """
+    Predicts whether decompiling a contract with the default config is likely to time out,
+    so that the scalable fallback config can be used right away, with the whole time budget.
+
+    Learned from the results of a previous run: contracts that needed the fallback (or timed out)
+    are sent to it directly, the rest depending on a threshold on one of their bytecode features.
+    """
+
+    def __init__(self, results: Iterable[Tuple[str, List[str], List[str], Dict[str, Any]]]):
+        self.needed_fallback: Dict[str, bool] = {}
+        samples = []
+        for name, _, meta, analytics in results:
+            if 'TIMEOUT' in meta:
+                self.needed_fallback[name] = True
+            elif analytics.get('decompiler_config') in ('default', 'scalable'):
+                needed = analytics['decompiler_config'] == 'scalable'
+                self.needed_fallback[name] = needed
+                # contracts sent to the fallback by an earlier prediction don't tell us whether they needed it
+                if not analytics.get('predicted_fallback'):
+                    samples.append((analytics, needed))
+
+        self.feature, self.threshold = learn_threshold(samples)
+
+    def predict(self, contract_name: str, features: Dict[str, int]) -> bool:
+        if contract_name in self.needed_fallback:
+            return self.needed_fallback[contract_name]
+        return self.feature is not None and features[self.feature] >= self.threshold
+
+    def __str__(self) -> str:
+        rule = f"{self.feature} >= {self.threshold}" if self.feature else "no threshold"
+        return f"{sum(self.needed_fallback.values())} of {len(self.needed_fallback)} known contracts, {rule}"
+
+
+def get_physical_memory() -> int:
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def get_process_tree_rss(pids: Iterable[int]) -> int:
+    """
+    Returns the total resident memory (in bytes) of the given processes and their descendants,
+    found through /proc/<pid>/task/<tid>/children. Processes that exited in the meantime,
+    or whose memory cannot be read, count as 0.
+    """
+    total = 0
+    seen = set()
+    worklist = list(pids)
+    while worklist:
+        pid = worklist.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total += int(f.read().split()[1])
+            # children are listed by the thread that started them
+            for tid in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{tid}/children') as f:
+                    worklist.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError, IndexError):
+            continue
+
+    return total * os.sysconf('SC_PAGE_SIZE')
+
+
+class MemoryAdmission:
+    """
+    Admission control for the contracts of a batch, based on a global memory budget.
+    A new contract is only started if the memory currently used by the worker
+    processes (and their analyses), plus the memory a contract is expected to need
+    (the average peak memory of the contracts analyzed so far), fits in the budget.
+    """
+
+    def __init__(self, budget: int):
+        """
+        Args:
+          budget: memory budget in bytes
+        """
+        self.budget = budget
+        self.peak_memory_sum = 0
+        self.contracts = 0
+        self.delayed = 0
+
+    def record(self, peak_memory: int) -> None:
+        self.peak_memory_sum += peak_memory
+        self.contracts += 1
+
+    def expected_memory(self) -> int:
+        return self.peak_memory_sum // self.contracts if self.contracts else 0
+
+    def can_start(self) -> bool:
+        workers = [process.pid for process in multiprocessing.active_children() if process.pid is not None]
+        return get_process_tree_rss(workers) + self.expected_memory() <= self.budget
+
+
+class ThreadBudget:
+    """
+    Shares a number of threads among the Souffle processes of the contracts being analyzed at once.
+    Each running Souffle process takes a thread, processes wait for one to be free. The threads left
+    unused (typically at the tail of a batch, once fewer contracts than workers remain) are handed out
+    to the Souffle processes started next, in equal shares among the processes the contracts being
+    analyzed may run at once, so that the last contracts finish sooner. Threads are only handed out
+    while unused, so the total never exceeds total_threads.
+    Shared by all the worker processes of a pool.
+    """
+
+    def __init__(self, total_threads: int, processes_per_contract: int = 1):
+        """
+        Args:
+          total_threads: the number of threads to share
+          processes_per_contract: the number of Souffle processes a contract may run at once (see --client_jobs)
+        """
+        self.total_threads = max(total_threads, 1)
+        self.processes_per_contract = processes_per_contract
+        self._threads_freed = multiprocessing.Condition()
+        self._active = multiprocessing.RawValue('i', 0)
+        """Contracts being analyzed"""
+        self._running = multiprocessing.RawValue('i', 0)
+        """Souffle processes running, each using a thread"""
+        self._extra = multiprocessing.RawValue('i', 0)
+        """Threads handed out on top of the one of each process"""
+
+    def contract_started(self) -> None:
+        with self._threads_freed:
+            self._active.value += 1
+
+    def contract_finished(self) -> None:
+        with self._threads_freed:
+            self._active.value -= 1
+
+    def acquire(self) -> int:
+        """
+        Waits for a thread to be free, and returns the number of threads the process about to be
+        started should use: that one, plus its share of the threads left unused.
+        Must be given back using release().
+        """
+        with self._threads_freed:
+            self._threads_freed.wait_for(lambda: self._running.value + self._extra.value < self.total_threads)
+            unused = self.total_threads - self._running.value - self._extra.value
+            # shared with the processes that may still start
+            starting = max(self._active.value * self.processes_per_contract - self._running.value, 1)
+            extra = max(unused // starting - 1, 0)
+            self._running.value += 1
+            self._extra.value += extra
+            return 1 + extra
+
+    def release(self, threads: int) -> None:
+        with self._threads_freed:
+            self._running.value -= 1
+            self._extra.value -= threads - 1
+            self._threads_freed.notify_all()
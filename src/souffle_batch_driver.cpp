@@ -0,0 +1,56 @@
+// souffle_batch_driver.cpp: keeps a compiled Souffle program loaded, running it
+// on several contracts one after the other, to avoid paying the start-up cost
+// of the program for each (small) contract.
+//
+// Compiled together with the C++ code souffle generates for a Datalog program
+// (see compile_batch_datalog in runners.py), which is registered under the name
+// GIGAHORSE_BATCH_PROGRAM.
+//
+// Reads one "<fact dir>\t<output dir>\t<threads>" line per contract from stdin and
+// answers with a "done" (or "error") line on stdout once the outputs are written.
+
+#include <exception>
+#include <iostream>
+#include <memory>
+#include <string>
+
+#include "souffle/SouffleInterface.h"
+
+int main() {
+    std::unique_ptr<souffle::SouffleProgram> program(souffle::ProgramFactory::newInstance(GIGAHORSE_BATCH_PROGRAM));
+    if (!program) {
+        std::cerr << "Cannot instantiate program " << GIGAHORSE_BATCH_PROGRAM << std::endl;
+        return 1;
+    }
+
+    std::string line;
+    while (std::getline(std::cin, line)) {
+        std::size_t tab = line.find('\t');
+        std::size_t threads_tab = line.find('\t', tab + 1);
+        if (tab == std::string::npos || threads_tab == std::string::npos) {
+            std::cout << "error" << std::endl;
+            continue;
+        }
+
+        bool ok = true;
+        try {
+            program->setNumThreads(std::stoul(line.substr(threads_tab + 1)));
+            program->loadAll(line.substr(0, tab));
+            program->run();
+            program->printAll(line.substr(tab + 1, threads_tab - tab - 1));
+        } catch (std::exception &e) {
+            std::cerr << e.what() << std::endl;
+            ok = false;
+        }
+
+        // start the next contract from empty relations. The symbol and record tables
+        // keep growing, the executable is restarted periodically (see PersistentSouffleProgram)
+        program->purgeInputRelations();
+        program->purgeInternalRelations();
+        program->purgeOutputRelations();
+
+        std::cout << (ok ? "done" : "error") << std::endl;
+    }
+
+    return 0;
+}
@@ -0,0 +1,211 @@
+"""work_archive.py: compaction of the working directories of analyzed contracts into compressed archives"""
+
+import fnmatch
+import hashlib
+import io
+import os
+import shutil
+import tarfile
+import warnings
+import zipfile
+from os.path import join
+from typing import BinaryIO, List, Optional
+
+from .common import file_lock, log
+
+ARCHIVE_MODES = ['contract', 'shard']
+
+ARCHIVE_SUFFIX = '.tar.gz'
+"""Suffix of the archive of a contract's working directory (next to it, or as a member of its shard file)."""
+
+SHARD_SUFFIX = '.zip'
+"""Suffix of the shard files, zip files holding the archives of all the contracts of a hash prefix."""
+
+DEFAULT_ARCHIVE_KEEP = 'out/*,!out/relation_cache/*,!out/cfg_cache/*'
+"""Files kept in the archives by default: the outputs, needed by --rerun_clients, without the caches of Python clients."""
+
+MTIME_NS_HEADER = 'GIGAHORSE.mtime_ns'
+"""pax header holding the exact modification time of an archived file, see unpack."""
+
+
+def shard_prefix(name: str) -> str:
+    """Hash prefix grouping contracts, spreading them evenly over 256 shards."""
+    return hashlib.sha256(name.encode('utf-8')).hexdigest()[:2]
+
+
+def select_files(work_dir: str, patterns: List[str]) -> List[str]:
+    """
+    Returns the paths (relative to work_dir) of the files of work_dir matching any of the patterns
+    (and none of those starting with '!'), along with the files of work_dir the kept symlinks point to.
+    """
+    keep = [p for p in patterns if not p.startswith('!')]
+    drop = [p[1:] for p in patterns if p.startswith('!')]
+    real_work_dir = os.path.realpath(work_dir)
+
+    selected = set()
+    for root, _, files in os.walk(work_dir):
+        for fname in files:
+            path = join(root, fname)
+            rel_path = os.path.relpath(path, work_dir)
+            if not any(fnmatch.fnmatch(rel_path, p) for p in keep) or any(fnmatch.fnmatch(rel_path, p) for p in drop):
+                continue
+            selected.add(rel_path)
+            if os.path.islink(path):
+                target = os.path.realpath(path)
+                if os.path.isfile(target) and target.startswith(real_work_dir + os.sep):
+                    selected.add(os.path.relpath(target, real_work_dir))
+    return sorted(selected)
+
+
+def pack(work_dir: str, patterns: List[str], fileobj: BinaryIO) -> None:
+    with tarfile.open(fileobj=fileobj, mode='w:gz', format=tarfile.PAX_FORMAT) as tar:
+        for rel_path in select_files(work_dir, patterns):
+            path = join(work_dir, rel_path)
+            info = tar.gettarinfo(path, rel_path)
+            if info.isfile():
+                info.pax_headers = {**info.pax_headers, MTIME_NS_HEADER: str(os.stat(path).st_mtime_ns)}
+                with open(path, 'rb') as f:
+                    tar.addfile(info, f)
+            else:
+                tar.addfile(info)
+
+
+def unpack(fileobj: BinaryIO, work_dir: str) -> None:
+    """
+    Extracts an archive into work_dir. Restores the modification times of the files to the nanosecond,
+    as the client manifests (see client_manifest.py) fingerprint the inputs of clients by them.
+    """
+    with tarfile.open(fileobj=fileobj, mode='r:gz') as tar:
+        # our own archives, which may hold absolute symlinks (e.g. to the signature facts)
+        if hasattr(tarfile, 'fully_trusted_filter'):
+            tar.extraction_filter = tarfile.fully_trusted_filter
+        members = tar.getmembers()
+        tar.extractall(work_dir, members)
+        for info in members:
+            if info.isfile() and MTIME_NS_HEADER in info.pax_headers:
+                mtime_ns = int(info.pax_headers[MTIME_NS_HEADER])
+                os.utime(join(work_dir, info.name), ns=(mtime_ns, mtime_ns))
+
+
+class WorkArchive:
+    """
+    Archives the working directories of analyzed contracts, keeping only the files
+    matching the given patterns, and restores them on demand (e.g. for --rerun_clients).
+
+    In 'contract' mode, each directory becomes a gzip-compressed tar file next to it.
+    In 'shard' mode, the archives are instead added to the zip file of their hash prefix,
+    under the working dir, so that it does not grow by one entry per contract.
+    Shard files are only ever appended to: an archive added again supersedes the previous one,
+    an empty archive marks a removed contract, until the shard is compacted.
+    """
+
+    def __init__(self, working_dir: str, mode: str, patterns: List[str]):
+        self.working_dir = os.path.abspath(working_dir)
+        self.mode = mode
+        self.patterns = patterns
+
+    def shard_path(self, contract_dir: str) -> str:
+        return join(self.working_dir, shard_prefix(os.path.basename(contract_dir)) + SHARD_SUFFIX)
+
+    def read_shard_member(self, contract_dir: str) -> Optional[bytes]:
+        shard_path = self.shard_path(contract_dir)
+        if not os.path.isfile(shard_path):
+            return None
+        with file_lock(shard_path + '.lock'):
+            with zipfile.ZipFile(shard_path) as shard:
+                try:
+                    # the last archive added under the name
+                    data = shard.read(os.path.basename(contract_dir) + ARCHIVE_SUFFIX)
+                except KeyError:
+                    return None
+        return data or None
+
+    def write_shard_member(self, contract_dir: str, data: bytes) -> None:
+        shard_path = self.shard_path(contract_dir)
+        with file_lock(shard_path + '.lock'):
+            with warnings.catch_warnings():
+                # superseding a previous archive of the contract
+                warnings.simplefilter('ignore', UserWarning)
+                with zipfile.ZipFile(shard_path, 'a') as shard:
+                    shard.writestr(os.path.basename(contract_dir) + ARCHIVE_SUFFIX, data, zipfile.ZIP_STORED)
+
+    def exists(self, contract_dir: str) -> bool:
+        if self.mode == 'contract':
+            return os.path.isfile(contract_dir + ARCHIVE_SUFFIX)
+        shard_path = self.shard_path(contract_dir)
+        if not os.path.isfile(shard_path):
+            return False
+        with file_lock(shard_path + '.lock'):
+            with zipfile.ZipFile(shard_path) as shard:
+                try:
+                    # the last archive added under the name, without reading it
+                    return shard.getinfo(os.path.basename(contract_dir) + ARCHIVE_SUFFIX).file_size > 0
+                except KeyError:
+                    return False
+
+    def store(self, contract_dir: str, work_dir: str) -> None:
+        """Archives work_dir as the working directory contract_dir, and removes work_dir."""
+        if self.mode == 'contract':
+            os.makedirs(os.path.dirname(contract_dir), exist_ok=True)
+            tmp_path = f'{contract_dir}{ARCHIVE_SUFFIX}.tmp{os.getpid()}'
+            with open(tmp_path, 'wb') as f:
+                pack(work_dir, self.patterns, f)
+            os.replace(tmp_path, contract_dir + ARCHIVE_SUFFIX)
+        else:
+            buffer = io.BytesIO()
+            pack(work_dir, self.patterns, buffer)
+            self.write_shard_member(contract_dir, buffer.getvalue())
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    def restore(self, contract_dir: str, work_dir: str) -> bool:
+        """Unpacks the archive of the working directory contract_dir into work_dir. Returns whether there was one."""
+        if self.mode == 'contract':
+            try:
+                with open(contract_dir + ARCHIVE_SUFFIX, 'rb') as f:
+                    unpack(f, work_dir)
+            except FileNotFoundError:
+                return False
+            return True
+
+        data = self.read_shard_member(contract_dir)
+        if data is None:
+            return False
+        unpack(io.BytesIO(data), work_dir)
+        return True
+
+    def remove(self, contract_dir: str) -> None:
+        if self.mode == 'contract':
+            if os.path.exists(contract_dir + ARCHIVE_SUFFIX):
+                os.remove(contract_dir + ARCHIVE_SUFFIX)
+        elif self.exists(contract_dir):
+            self.write_shard_member(contract_dir, b'')
+
+    def compact_shards(self) -> None:
+        """
+        Rewrites the shard files holding superseded or removed archives without them.
+        Meant to be called by the coordinator, while no worker is using the shards.
+        """
+        if self.mode != 'shard' or not os.path.isdir(self.working_dir):
+            return
+
+        compacted = 0
+        for fname in os.listdir(self.working_dir):
+            if not fname.endswith(SHARD_SUFFIX):
+                continue
+            shard_path = join(self.working_dir, fname)
+            with file_lock(shard_path + '.lock'):
+                with zipfile.ZipFile(shard_path) as shard:
+                    infos = shard.infolist()
+                    latest = {info.filename: info for info in infos}
+                    if len(latest) == len(infos) and all(info.file_size for info in infos):
+                        continue
+                    tmp_path = f'{shard_path}.tmp{os.getpid()}'
+                    with zipfile.ZipFile(tmp_path, 'w') as compacted_shard:
+                        for name, info in latest.items():
+                            if info.file_size:
+                                compacted_shard.writestr(info, shard.read(info))
+                os.replace(tmp_path, shard_path)
+            compacted += 1
+
+        if compacted:
+            log(f"Compacted {compacted} shard files")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Builds a batch executable (see compile_batch_datalog in src/runners.py) and runs it on several fact dirs, needs Souffle"""
+
+import os
+import shutil
+
+import pytest
+
+if shutil.which('souffle') is None:
+    pytest.skip("Souffle is not installed", allow_module_level=True)
+
+from src.common import GZIP_MAGIC, open_fact_file
+from src.runners import PersistentSouffleProgram, compile_batch_datalog
+
+PROGRAM = '''
+.decl Edge(x: number, y: number)
+.input Edge
+
+.decl Path(x: number, y: number)
+.output Path
+Path(x, y) :- Edge(x, y).
+Path(x, z) :- Path(x, y), Edge(y, z).
+
+.decl Reachable(x: number)
+.output Reachable(compress=true)
+Reachable(y) :- Path(0, y).
+'''
+
+
+def write_facts(facts_dir, edges) -> str:
+    os.makedirs(facts_dir)
+    (facts_dir / 'Edge.facts').write_text(''.join(f'{x}\t{y}\n' for x, y in edges))
+    return str(facts_dir)
+
+
+def read_relation(path) -> set:
+    with open_fact_file(str(path)) as f:
+        return {tuple(map(int, line.split('\t'))) for line in f.read().splitlines()}
+
+
+def test_batch_program(tmp_path):
+    spec = tmp_path / 'paths.dl'
+    spec.write_text(PROGRAM)
+    executable = str(tmp_path / 'paths_batch')
+    compile_batch_datalog(str(spec), 'souffle', 'BATCH_TEST=1', executable)
+    assert os.access(executable, os.X_OK)
+
+    program = PersistentSouffleProgram(executable)
+    try:
+        for i, (edges, paths) in enumerate([
+            ([(0, 1), (1, 2)], {(0, 1), (1, 2), (0, 2)}),
+            # the relations of the previous contract are not kept
+            ([(0, 3), (5, 0)], {(0, 3), (5, 0), (5, 3)}),
+        ]):
+            in_dir = write_facts(tmp_path / f'facts{i}', edges)
+            out_dir = tmp_path / f'out{i}'
+            os.makedirs(out_dir)
+
+            runtime, ok, usage = program.run(in_dir, str(out_dir), 60, threads=2)
+            assert ok and runtime >= 0 and usage is not None
+            assert read_relation(out_dir / 'Path.csv') == paths
+            assert read_relation(out_dir / 'Reachable.csv') == {(y,) for x, y in paths if x == 0}
+            # built with zlib, as souffle builds programs
+            with open(out_dir / 'Reachable.csv', 'rb') as f:
+                assert f.read(2) == GZIP_MAGIC
+        assert program.runs == 2
+    finally:
+        program.stop()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Checks that the FastEVMBytecodeParser decodes bytecode, and the facts exported from it, exactly as the EVMBytecodeParser does"""
+
+import glob
+import os
+import random
+from os.path import abspath, dirname, join
+from typing import List, Tuple
+
+import pytest
+
+from src import blockparse, exporter
+
+GIGAHORSE_TOOLCHAIN_ROOT = dirname(abspath(__file__))
+
+EXPORTED_FACTS = ['Statement_Opcode.facts', 'PushValue.facts', 'Statement_Next.facts', 'contract.dasm']
+
+
+def sample_bytecodes() -> List[Tuple[str, str]]:
+    samples = []
+    for path in sorted(glob.glob(join(GIGAHORSE_TOOLCHAIN_ROOT, 'tests', '**', '*.hex'), recursive=True)) + \
+                sorted(glob.glob(join(GIGAHORSE_TOOLCHAIN_ROOT, 'examples', '*.hex'))):
+        with open(path) as f:
+            samples.append((os.path.relpath(path, GIGAHORSE_TOOLCHAIN_ROOT), f.read().strip()))
+
+    rng = random.Random(0)
+    for i in range(20):
+        # random bytes hit unknown opcodes, and PUSH arguments truncated by the end of the bytecode
+        samples.append((f'random-{i}', bytes(rng.randrange(256) for _ in range(rng.randrange(1, 600))).hex()))
+    samples.append(('empty', ''))
+    samples.append(('truncated-push32', '0x7f0102'))
+    return samples
+
+
+SAMPLES = sample_bytecodes()
+
+
+@pytest.mark.parametrize("name,bytecode", SAMPLES, ids=[name for name, _ in SAMPLES])
+def test_same_instructions_and_blocks(name: str, bytecode: str):
+    blocks = blockparse.EVMBytecodeParser(bytecode).parse()
+    instructions = blockparse.FastEVMBytecodeParser(bytecode).parse()
+
+    expected = [(op.pc, op.opcode.name, op.value) for block in blocks for op in block.evm_ops]
+    assert [(pc, op.name, value) for pc, op, value in instructions] == expected
+    assert [(instructions.opcode(i).name, instructions.value(i)) for i in range(len(instructions))] == [(op, value) for _, op, value in expected]
+
+    assert [(instructions.pcs[start], instructions.pcs[end - 1]) for start, end in instructions.blocks] == \
+        [(block.evm_ops[0].pc, block.evm_ops[-1].pc) for block in blocks if block.evm_ops]
+
+
+@pytest.mark.parametrize("name,bytecode", SAMPLES, ids=[name for name, _ in SAMPLES])
+def test_same_exported_facts(name: str, bytecode: str, tmp_path):
+    outputs = {}
+    for parser in (blockparse.EVMBytecodeParser, blockparse.FastEVMBytecodeParser):
+        out_dir = str(tmp_path / parser.__name__)
+        exporter.InstructionTsvExporter(out_dir, parser(bytecode).parse(), True, bytecode, {}).export()
+        outputs[parser] = {}
+        for fname in EXPORTED_FACTS:
+            with open(join(out_dir, fname)) as f:
+                outputs[parser][fname] = f.read()
+
+    assert outputs[blockparse.FastEVMBytecodeParser] == outputs[blockparse.EVMBytecodeParser]
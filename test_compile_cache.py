@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Unit tests of the cache of compiled souffle executables (src/compile_cache.py)"""
+
+import json
+import os
+import stat
+import threading
+import time
+
+from src.common import file_lock
+from src.compile_cache import (COMPILE_CACHE_DIR, COMPILE_CACHE_LOCK, compile_cache_key, evict_compile_cache, get_build_manifest_path,
+                               link_executable, read_build_manifest, write_build_manifest)
+
+SOURCE = '.decl A(x: number)\nA(1).\n.output A\n'
+
+
+def fake_souffle(path, version: str) -> str:
+    path.write_text(f'#!/bin/sh\necho "{version}"\n')
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_key(tmp_path):
+    souffle = fake_souffle(tmp_path / 'souffle', 'Souffle: 2.4')
+    functors = tmp_path / 'libfunctors.so'
+    functors.write_bytes(b'functors')
+    key = compile_cache_key(SOURCE, souffle, [str(functors)], ['-M', 'MACRO=1'])
+
+    assert compile_cache_key(SOURCE, souffle, [str(functors)], ['-M', 'MACRO=1']) == key
+    # any input changes the key
+    assert compile_cache_key(SOURCE + '\n', souffle, [str(functors)], ['-M', 'MACRO=1']) != key
+    assert compile_cache_key(SOURCE, fake_souffle(tmp_path / 'souffle-2.3', 'Souffle: 2.3'), [str(functors)], ['-M', 'MACRO=1']) != key
+    assert compile_cache_key(SOURCE, souffle, [str(functors)], ['-M', 'MACRO=2']) != key
+    assert compile_cache_key(SOURCE, souffle, [], ['-M', 'MACRO=1']) != key
+    functors.write_bytes(b'other functors')
+    assert compile_cache_key(SOURCE, souffle, [str(functors)], ['-M', 'MACRO=1']) != key
+    # flags are not merely concatenated
+    assert compile_cache_key(SOURCE, souffle, [], ['-M', 'MACRO=1']) != compile_cache_key(SOURCE, souffle, [], ['-MMACRO=1'])
+
+
+def test_build_manifest_path(tmp_path):
+    path = get_build_manifest_path(str(tmp_path), 'logic/main.dl', ['souffle', '-M', 'A=1'])
+    assert os.path.dirname(path) == str(tmp_path / COMPILE_CACHE_DIR)
+    assert os.path.basename(path).startswith('main.dl-')
+    assert get_build_manifest_path(str(tmp_path), 'logic/main.dl', ['souffle', '-M', 'A=1']) == path
+    assert get_build_manifest_path(str(tmp_path), 'logic/main.dl', ['souffle', '-M', 'A=2']) != path
+    assert get_build_manifest_path(str(tmp_path), 'clients/main.dl', ['souffle', '-M', 'A=1']) != path
+
+
+def test_build_manifest(tmp_path):
+    os.makedirs(tmp_path / COMPILE_CACHE_DIR)
+    manifest_path = get_build_manifest_path(str(tmp_path), 'main.dl', [])
+    assert read_build_manifest(manifest_path) is None
+
+    files = [tmp_path / 'main.dl', tmp_path / 'include.dl']
+    for path in files:
+        path.write_text(SOURCE)
+    missing = tmp_path / 'missing.dl'
+    write_build_manifest(manifest_path, 'key', [str(path) for path in files + [missing]])
+    assert read_build_manifest(manifest_path) == 'key'
+
+    # a file modified, even if of the same size
+    os.utime(files[1], ns=(0, 0))
+    assert read_build_manifest(manifest_path) is None
+
+    write_build_manifest(manifest_path, 'key2', [str(path) for path in files + [missing]])
+    assert read_build_manifest(manifest_path) == 'key2'
+    # a file that did not exist then
+    missing.write_text(SOURCE)
+    assert read_build_manifest(manifest_path) is None
+
+    write_build_manifest(manifest_path, 'key3', [str(path) for path in files])
+    os.remove(files[0])
+    assert read_build_manifest(manifest_path) is None
+
+    with open(manifest_path, 'w') as f:
+        f.write('{"key": ')
+    assert read_build_manifest(manifest_path) is None
+
+
+def test_link_executable(tmp_path):
+    cache_path = tmp_path / 'entry'
+    cache_path.write_text('executable')
+    os.utime(cache_path, (0, 0))
+
+    link_executable(str(cache_path), str(tmp_path / 'main_compiled'))
+    assert os.path.samefile(cache_path, tmp_path / 'main_compiled')
+    # marked as used
+    assert os.path.getmtime(cache_path) > 0
+
+    (tmp_path / 'other').write_text('other executable')
+    link_executable(str(tmp_path / 'other'), str(tmp_path / 'main_compiled'))
+    assert (tmp_path / 'main_compiled').read_text() == 'other executable'
+    assert cache_path.read_text() == 'executable'
+
+
+def make_entries(tmp_path, count: int) -> list:
+    compiled_dir = tmp_path / COMPILE_CACHE_DIR
+    os.makedirs(compiled_dir)
+    entries = []
+    for i in range(count):
+        entry = compiled_dir / f'key{i}'
+        entry.write_bytes(b'x' * 1000)
+        with file_lock(str(entry) + '.lock'):
+            pass
+        os.utime(entry, (i, i))
+        entries.append(entry)
+    (compiled_dir / 'main.dl-0123.build.json').write_text(json.dumps({'key': 'key0', 'files': {}}))
+    return entries
+
+
+def test_eviction_order(tmp_path):
+    entries = make_entries(tmp_path, 4)
+
+    evict_compile_cache(str(tmp_path), 3500)
+    assert [entry.exists() for entry in entries] == [False, True, True, True]
+    evict_compile_cache(str(tmp_path), 2000)
+    assert [entry.exists() for entry in entries] == [False, False, True, True]
+    # along with their locks
+    assert [os.path.exists(str(entry) + '.lock') for entry in entries] == [False, False, True, True]
+
+    evict_compile_cache(str(tmp_path), 0)
+    assert sorted(os.listdir(tmp_path / COMPILE_CACHE_DIR)) == [COMPILE_CACHE_LOCK, 'main.dl-0123.build.json']
+
+
+def test_linked_and_locked_entries_kept(tmp_path):
+    entries = make_entries(tmp_path, 3)
+    # the current executable of some program
+    link_executable(str(entries[0]), str(tmp_path / 'main_compiled'))
+    os.utime(entries[0], (0, 0))
+
+    # as held while compiling or linking, in another run
+    with file_lock(str(entries[1]) + '.lock'):
+        evict_compile_cache(str(tmp_path), 0)
+        assert [entry.exists() for entry in entries] == [True, True, False]
+
+    os.remove(tmp_path / 'main_compiled')
+    evict_compile_cache(str(tmp_path), 0)
+    assert not any(entry.exists() or os.path.exists(str(entry) + '.lock') for entry in entries)
+
+
+def test_orphan_locks_removed(tmp_path):
+    compiled_dir = tmp_path / COMPILE_CACHE_DIR
+    make_entries(tmp_path, 1)
+    # left behind by failed compilations
+    for name in ['failed.lock', 'being_compiled.lock']:
+        (compiled_dir / name).write_text('')
+
+    with file_lock(str(compiled_dir / 'being_compiled.lock')):
+        evict_compile_cache(str(tmp_path), 1 << 30)
+    assert sorted(os.listdir(compiled_dir)) == [COMPILE_CACHE_LOCK, 'being_compiled.lock', 'key0', 'key0.lock', 'main.dl-0123.build.json']
+
+
+def test_lock_of_removed_file(tmp_path):
+    """A lock waited for while its file is removed by its holder is taken on a new file"""
+    path = str(tmp_path / 'entry.lock')
+    waiting_started = threading.Event()
+    exists_when_locked = []
+
+    def wait_for_lock() -> None:
+        waiting_started.set()
+        with file_lock(path):
+            exists_when_locked.append(os.path.exists(path))
+
+    with file_lock(path):
+        waiting = threading.Thread(target=wait_for_lock)
+        waiting.start()
+        waiting_started.wait()
+        time.sleep(0.1)
+        os.remove(path)
+    waiting.join(5)
+    assert exists_when_locked == [True]
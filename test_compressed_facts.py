@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Checks that the Python readers of the decompiler outputs load gzip-compressed facts (see --compress_facts) as the plain ones"""
+
+import gzip
+import os
+import shutil
+from os.path import join
+
+import pytest
+
+from clientlib import facts_to_cfg
+from clientlib.relations import Database
+from src.common import fact_file_is_empty
+from facts_fixtures import SEEDS, dump_cfg, write_random_facts
+
+
+def write_facts(facts_dir: str, seed: int, compressed: bool) -> None:
+    os.makedirs(facts_dir)
+    write_random_facts(facts_dir, seed)
+    if compressed:
+        for fname in os.listdir(facts_dir):
+            path = join(facts_dir, fname)
+            with open(path, 'rb') as f_in, gzip.open(path + '.gz', 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.replace(path + '.gz', path)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_same_facts(seed: int, tmp_path, monkeypatch):
+    plain_dir, compressed_dir = str(tmp_path / 'plain'), str(tmp_path / 'compressed')
+    write_facts(plain_dir, seed, False)
+    write_facts(compressed_dir, seed, True)
+
+    for fname in facts_to_cfg.CFG_INPUT_FILES:
+        assert facts_to_cfg.load_csv(join(compressed_dir, fname)) == facts_to_cfg.load_csv(join(plain_dir, fname))
+
+        name = os.path.splitext(fname)[0]
+        assert list(Database(compressed_dir)[name]) == list(Database(plain_dir)[name])
+
+    cfgs = []
+    for facts_dir in (plain_dir, compressed_dir):
+        monkeypatch.chdir(facts_dir)
+        cfgs.append(dump_cfg(facts_to_cfg.construct_cfg()))
+    assert cfgs[1] == cfgs[0]
+
+
+def test_fact_file_is_empty(tmp_path):
+    for name, contents in [('empty', b''), ('nonempty', b'0x1\t0x2\n')]:
+        with open(tmp_path / f'{name}.csv', 'wb') as f:
+            f.write(contents)
+        with gzip.open(tmp_path / f'{name}.csv.gz', 'wb') as f:
+            f.write(contents)
+
+    assert fact_file_is_empty(str(tmp_path / 'empty.csv'))
+    # not of size 0
+    assert fact_file_is_empty(str(tmp_path / 'empty.csv.gz'))
+    assert not fact_file_is_empty(str(tmp_path / 'nonempty.csv'))
+    assert not fact_file_is_empty(str(tmp_path / 'nonempty.csv.gz'))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Unit tests of the decompilation cache (src/decomp_cache.py)"""
+
+import os
+
+import pytest
+
+from src.common import file_lock
+from src.decomp_cache import CACHE_INFO_FILE, DecompilationCache, is_reusable
+
+CONFIG = ['main.dl-hash', 'context_depth=None']
+
+BYTECODE = '0x6080604052'
+
+
+def make_work_dir(path, contents: str) -> str:
+    os.makedirs(path / 'out')
+    (path / 'contract.hex').write_text(BYTECODE)
+    (path / 'out' / 'TAC_Op.csv').write_text(contents)
+    return str(path)
+
+
+def read_work_dir(path) -> dict:
+    return {os.path.relpath(os.path.join(root, fname), path): open(os.path.join(root, fname)).read()
+            for root, _, files in os.walk(path) for fname in files}
+
+
+def test_key_stability(tmp_path):
+    cache = DecompilationCache(str(tmp_path), 0, CONFIG)
+    # keys are shared by runs, and by versions of gigahorse
+    assert cache.key(BYTECODE, '{"a": 1}') == '1a97805de330f0b259c8734ca61b04358ff4e34e5cfdb97440a3056ced3d4f52'
+    assert cache.key(' 0X6080604052\n') == cache.key('6080604052') == DecompilationCache(str(tmp_path), 0, list(CONFIG)).key(BYTECODE)
+
+    assert cache.key(BYTECODE, '{"a": 1}') != cache.key(BYTECODE)
+    assert cache.key('0x6080604053') != cache.key(BYTECODE)
+    assert DecompilationCache(str(tmp_path), 0, CONFIG + ['disable_inline=True']).key(BYTECODE) != cache.key(BYTECODE)
+    # configs are not merely concatenated
+    assert DecompilationCache(str(tmp_path), 0, ['ab', 'c']).key(BYTECODE) != DecompilationCache(str(tmp_path), 0, ['a', 'bc']).key(BYTECODE)
+
+
+def test_hit_and_miss(tmp_path):
+    cache = DecompilationCache(str(tmp_path / 'cache'), 1 << 30, CONFIG)
+    key = cache.key(BYTECODE)
+    work_dir = make_work_dir(tmp_path / 'work', 'S1\tADD\n')
+
+    assert cache.restore(key, str(tmp_path / 'miss')) is None
+    assert not os.path.exists(tmp_path / 'miss')
+
+    cache.store(key, work_dir, 'default', {})
+    restored = tmp_path / 'restored'
+    info = cache.restore(key, str(restored))
+    assert info is not None and info['decompiler_config'] == 'default'
+    assert read_work_dir(restored) == read_work_dir(work_dir)
+    assert CACHE_INFO_FILE not in os.listdir(restored)
+
+    # entries are not overwritten
+    cache.store(key, make_work_dir(tmp_path / 'work2', 'S1\tSUB\n'), 'scalable', {})
+    assert cache.restore(key, str(tmp_path / 'restored2'))['decompiler_config'] == 'default'
+    assert read_work_dir(tmp_path / 'restored2') == read_work_dir(work_dir)
+
+
+@pytest.mark.parametrize("analytics", [{'decomp_timeouts': 1}, {'inline_timeouts': 1}, {'predicted_fallback': 1}])
+def test_timeouts_not_cached(analytics, tmp_path):
+    cache = DecompilationCache(str(tmp_path / 'cache'), 1 << 30, CONFIG)
+    key = cache.key(BYTECODE)
+    assert not is_reusable(analytics)
+
+    cache.store(key, make_work_dir(tmp_path / 'work', 'S1\tADD\n'), 'default', analytics)
+    assert cache.restore(key, str(tmp_path / 'restored')) is None
+
+
+def test_reusable():
+    assert is_reusable({})
+    assert is_reusable({'decomp_timeouts': 0, 'inline_timeouts': 0, 'predicted_fallback': 0})
+
+
+def test_eviction_order(tmp_path):
+    cache = DecompilationCache(str(tmp_path / 'cache'), 1 << 30, CONFIG)
+    keys = [cache.key(f'0x60{i:02x}') for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.store(key, make_work_dir(tmp_path / f'work{i}', 'x' * 1000), 'default', {})
+        os.utime(cache.entry_path(key), (i, i))
+    entry_size = 1000 + len(BYTECODE)
+
+    # restoring an entry makes it the most recently used
+    cache.restore(keys[0], str(tmp_path / 'restored'))
+
+    cache.max_size = 2 * entry_size + 500
+    cache.evict()
+    assert [cache.restore(key, str(tmp_path / f'check{i}')) is not None for i, key in enumerate(keys)] == [True, False, False, True]
+    # along with their locks
+    assert not any(os.path.exists(cache.entry_path(keys[i]) + '.lock') for i in (1, 2))
+
+    cache.max_size = 0
+    cache.evict()
+    assert not any(os.path.exists(cache.entry_path(key)) for key in keys)
+
+
+def test_entry_being_restored_not_evicted(tmp_path):
+    cache = DecompilationCache(str(tmp_path / 'cache'), 0, CONFIG)
+    key = cache.key(BYTECODE)
+    cache.store(key, make_work_dir(tmp_path / 'work', 'S1\tADD\n'), 'default', {})
+
+    # as held by restore, in another run
+    with file_lock(cache.entry_path(key) + '.lock', shared=True):
+        cache.evict()
+        assert os.path.isdir(cache.entry_path(key))
+
+    cache.evict()
+    assert not os.path.exists(cache.entry_path(key))
+    assert not os.path.exists(cache.entry_path(key) + '.lock')
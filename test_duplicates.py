@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Unit tests of bytecode normalization, metadata stripping (src/exporter.py) and the grouping of duplicate contracts (src/scheduling.py)"""
+
+import os
+
+import pytest
+
+from src.exporter import normalize_bytecode, strip_metadata
+from src.scheduling import group_duplicate_contracts
+
+CODE = '6080604052348015600f57600080fd5b50'
+
+# a2 {"ipfs": <34 bytes>, "solc": <0.8.17>}, solc >= 0.5.9
+SOLC_TRAILER = 'a2' + b'\x64ipfs'.hex() + '5822' + '12' * 34 + b'\x64solc\x43'.hex() + '000811' + '0033'
+# a1 {"bzzr0": <32 bytes>}, solc 0.4.7 to 0.5.8
+BZZR0_TRAILER = b'\xa1\x65bzzr0'.hex() + '5820' + '34' * 32 + '0029'
+# a1 {"vyper": [0, 3, 7]}, vyper >= 0.3.5
+VYPER_TRAILER = b'\xa1\x65vyper\x83'.hex() + '000307' + '000b'
+# vyper 0.3.4, without the length
+VYPER_034_TRAILER = b'\xa1\x65vyper\x83'.hex() + '000304'
+
+
+def test_normalize_bytecode():
+    assert normalize_bytecode(f'0x{CODE.upper()}\n') == CODE
+    assert normalize_bytecode(f' 0X{CODE}') == CODE
+    assert normalize_bytecode(CODE) == CODE
+
+
+@pytest.mark.parametrize("trailer", [SOLC_TRAILER, BZZR0_TRAILER, VYPER_TRAILER, VYPER_034_TRAILER])
+def test_strip_metadata(trailer: str):
+    assert strip_metadata(CODE + trailer) == CODE
+
+
+@pytest.mark.parametrize("bytecode", [
+    CODE,
+    '',
+    '00',
+    # the last two bytes look like a length, but no metadata precedes them
+    CODE + '0004',
+    # a solidity trailer missing its start, its length is longer than the bytecode
+    SOLC_TRAILER[20:],
+    # or missing its length
+    CODE + SOLC_TRAILER[:-4],
+    # or a prefix in the middle of the bytecode
+    CODE + VYPER_034_TRAILER + CODE,
+])
+def test_strip_metadata_no_trailer(bytecode: str):
+    assert strip_metadata(bytecode) == bytecode
+
+
+def write_contracts(contracts_dir, contracts: dict) -> list:
+    os.makedirs(contracts_dir)
+    for name, bytecode in contracts.items():
+        (contracts_dir / name).write_text(bytecode)
+    return [str(contracts_dir / name) for name in contracts if name.endswith('.hex')]
+
+
+def test_group_duplicate_contracts(tmp_path):
+    contracts = write_contracts(tmp_path / 'contracts', {
+        'a.hex': '0x' + CODE + SOLC_TRAILER,
+        'b.hex': CODE.upper() + SOLC_TRAILER + '\n',
+        # same code, other metadata
+        'c.hex': CODE + BZZR0_TRAILER,
+        'd.hex': CODE + SOLC_TRAILER,
+        'd_metadata.json': '{"name": "D"}',
+        'e.hex': '60016002',
+        'f.hex': CODE + SOLC_TRAILER,
+    })
+
+    unique_contracts, duplicates = group_duplicate_contracts(contracts, False)
+    assert unique_contracts == [contracts[i] for i in (0, 2, 3, 4)]
+    assert duplicates == {'a.hex': ['b.hex', 'f.hex']}
+
+    unique_contracts, duplicates = group_duplicate_contracts(contracts, True)
+    assert unique_contracts == [contracts[i] for i in (0, 3, 4)]
+    # contracts with a different solc metadata file are kept apart
+    assert duplicates == {'a.hex': ['b.hex', 'c.hex', 'f.hex']}
+
+
+def test_group_no_duplicates(tmp_path):
+    contracts = write_contracts(tmp_path / 'contracts', {'a.hex': CODE, 'b.hex': '60016002'})
+    assert group_duplicate_contracts(contracts, True) == (contracts, {})
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Checks the CFG construct_cfg builds from the decompiler facts, through the IndexedCFG, and its cache"""
+
+import importlib.util
+import os
+from os.path import abspath, dirname, join
+from typing import Any
+
+import pytest
+
+from clientlib import facts_to_cfg
+from facts_fixtures import EXAMPLE_FACTS, SEEDS, dump_cfg, write_facts, write_random_facts
+
+GIGAHORSE_TOOLCHAIN_ROOT = dirname(abspath(__file__))
+
+EXAMPLE_CFG = (
+    {
+        # statements ordered by their sort key, ties in TAC_Block order, and their variables by position
+        '0x0': ([('0x0', 'CALLDATALOAD', [], ['0x100']), ('0x2', 'EQ', ['0x109', '0x100'], ['0x104']), ('0x4', 'JUMPI', ['0x104'], [])], [], ['0x1a', '0x2b']),
+        '0x1a': ([('0x1a', 'ADD', ['0x100', '0x100'], ['0x105']), ('0x1b_1', 'CALLER', [], ['0x106']), ('0x1b_0', 'MUL', ['0x105'], ['0x107'])], ['0x0'], ['0x2b']),
+        # predecessors in the order they first appear as sources
+        '0x2b': ([('S0x2b', 'STOP', [], [])], ['0x1a', '0x0'], []),
+        '0x40': ([('0x40', 'SSTORE', ['0x101', '0x102'], [])], ['0x52'], ['0x52']),
+        '0x52': ([('0x52', 'JUMP', [], [])], ['0x40'], ['0x40']),
+        '0x60': ([('0x60', 'ADD', ['0x103', '0x103'], ['0x108']), ('0x61', 'RETURNPRIVATE', ['0x108'], [])], [], []),
+    },
+    # in the order of their entries
+    [
+        ('0x20', 'helper', ['0x103'], False, '0x60'),
+        ('0x0', 'fallback()', [], True, '0x0'),
+        ('0x10', 'transfer(address,uint256)', ['0x101', '0x102'], True, '0x40'),
+    ]
+)
+
+
+def test_example_cfg(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_facts(str(tmp_path), EXAMPLE_FACTS)
+
+    assert dump_cfg(facts_to_cfg.construct_cfg()) == EXAMPLE_CFG
+    assert os.path.isfile(facts_to_cfg.CFG_CACHE_FILE)
+    # from the cache
+    assert dump_cfg(facts_to_cfg.construct_cfg()) == EXAMPLE_CFG
+
+
+def test_missing_op(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_facts(str(tmp_path), {**EXAMPLE_FACTS, 'TAC_Op.csv': [row for row in EXAMPLE_FACTS['TAC_Op.csv'] if row[0] != '0x1a']})
+    with pytest.raises(KeyError):
+        facts_to_cfg.construct_cfg()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_cached_cfg(seed: int, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_random_facts(str(tmp_path), seed)
+    expected = dump_cfg(facts_to_cfg.construct_cfg())
+    assert os.path.isfile(facts_to_cfg.CFG_CACHE_FILE)
+
+    def build() -> None:
+        raise AssertionError('cache not used')
+    monkeypatch.setattr(facts_to_cfg.IndexedCFG, 'build', staticmethod(build))
+    assert dump_cfg(facts_to_cfg.construct_cfg()) == expected
+
+
+def test_stale_cache_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_random_facts(str(tmp_path), 0)
+    facts_to_cfg.construct_cfg()
+
+    write_facts(str(tmp_path), EXAMPLE_FACTS)
+    assert dump_cfg(facts_to_cfg.construct_cfg()) == EXAMPLE_CFG
+
+
+def test_cache_shared_across_module_names(tmp_path, monkeypatch):
+    """Script clients import the module as facts_to_cfg or clientlib.facts_to_cfg"""
+    monkeypatch.chdir(tmp_path)
+    write_random_facts(str(tmp_path), 0)
+
+    spec = importlib.util.spec_from_file_location('facts_to_cfg', join(GIGAHORSE_TOOLCHAIN_ROOT, 'clientlib', 'facts_to_cfg.py'))
+    assert spec is not None and spec.loader is not None
+    other_module: Any = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(other_module)
+    expected = dump_cfg(other_module.construct_cfg())
+
+    def build() -> None:
+        raise AssertionError('cache not used')
+    monkeypatch.setattr(facts_to_cfg.IndexedCFG, 'build', staticmethod(build))
+    assert dump_cfg(facts_to_cfg.construct_cfg()) == expected
+
+
+def test_cache_not_listed_as_relation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_random_facts(str(tmp_path), 0)
+    before = set(os.listdir(tmp_path))
+    facts_to_cfg.construct_cfg()
+
+    assert set(os.listdir(tmp_path)) - before == {facts_to_cfg.CFG_CACHE_DIR}
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Unit tests of the summary of the results of a batch (src/results_summary.py)"""
+
+import logging
+import random
+
+import pytest
+
+from src.results_summary import TIME_PERCENTILES, ResultsSummary, TimeHistogram
+
+
+def test_percentiles_within_bucket_ratio():
+    rng = random.Random(0)
+    times = [rng.lognormvariate(0, 2) for _ in range(10000)]
+    histogram = TimeHistogram()
+    for time in times:
+        histogram.add(time)
+    times.sort()
+
+    assert histogram.total == len(times)
+    assert histogram.sum == pytest.approx(sum(times))
+    assert histogram.max == times[-1]
+    for p in TIME_PERCENTILES + [1, 100]:
+        exact = times[-(-len(times) * p // 100) - 1]
+        assert exact <= histogram.percentile(p) <= exact * TimeHistogram.RATIO
+
+
+def test_percentiles_small():
+    histogram = TimeHistogram()
+    assert histogram.percentile(50) == 0.0
+
+    for time in [0.0, 0.001, 2.0, 3.0]:
+        histogram.add(time)
+    # the first bucket holds all the times up to MIN_TIME
+    assert histogram.percentile(50) == TimeHistogram.MIN_TIME
+    assert 2.0 <= histogram.percentile(75) <= 2.0 * TimeHistogram.RATIO
+    # never more than the max
+    assert histogram.percentile(100) == 3.0
+
+
+def make_summary() -> ResultsSummary:
+    summary = ResultsSummary()
+    summary.add(['a.hex'], [], {'blocks': 10, 'decomp_time': 1.5, 'Reentrancy:high': 1, 'decompiler_config': 'default'})
+    summary.add(['b.hex'], ['TIMEOUT'], {'blocks': 5, 'decomp_time': 60.0})
+    summary.add(['c.hex'], ['ERROR', 'TIMEOUT'], {'Reentrancy:high': 1, 'Overflow:low': 0, 'client_time': 0.25})
+    summary.add(['d.hex'], [], {})
+    return summary
+
+
+def test_summary():
+    summary = make_summary()
+    assert summary.total == 4
+
+    result = summary.to_dict()
+    assert result['contracts'] == 4
+    # the integer analytics are summed, including the vulnerabilities
+    assert result['analytics'] == {'blocks': 15, 'Reentrancy:high': 2, 'Overflow:low': 0}
+    # contracts with the key are flagged, whatever its value
+    assert result['flagged'] == {'Reentrancy:high': 0.5, 'Overflow:low': 0.25}
+    assert result['meta'] == {'TIMEOUT': 2, 'ERROR': 1}
+
+    assert set(result['times']) == {'decomp_time', 'client_time'}
+    assert result['times']['decomp_time']['total'] == 61.5
+    assert result['times']['decomp_time']['max'] == 60.0
+    assert result['times']['decomp_time']['p99'] == 60.0
+    assert 1.5 <= result['times']['decomp_time']['p50'] <= 1.5 * TimeHistogram.RATIO
+    assert result['times']['client_time'] == {'total': 0.25, 'max': 0.25, 'p50': 0.25, 'p90': 0.25, 'p99': 0.25}
+
+
+def test_empty_summary():
+    assert ResultsSummary().to_dict() == {'contracts': 0, 'analytics': {}, 'times': {}, 'flagged': {}, 'meta': {}}
+
+
+def test_summary_log(caplog):
+    caplog.set_level(logging.INFO + 1)
+    make_summary().log("Summary of the 4 contracts analyzed so far:")
+
+    lines = [record.getMessage() for record in caplog.records]
+    assert lines[0] == "Summary of the 4 contracts analyzed so far:"
+    assert "  blocks: 15" in lines
+    assert "  decomp_time: 61.50, 1.69, 60.00, 60.00, 60.00" in lines
+    assert "  Reentrancy:high: 50.00%" in lines
+    assert "  TIMEOUT: 2 of 4 contracts" in lines
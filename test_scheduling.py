@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Unit tests of the cost prediction, ordering, fallback prediction and thread budget of the contracts of a batch (src/scheduling.py)"""
+
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+from typing import List
+
+import pytest
+
+from src.blockparse import FastEVMBytecodeParser
+from src.scheduling import FallbackPredictor, bytecode_features, get_process_tree_rss, learn_threshold, order_by_cost, predict_costs, schedule_report, simulate_schedule, ThreadBudget
+
+
+def test_predict_costs():
+    history = {'a.hex': 10.0, 'b.hex': 2.0, 'timed_out.hex': 60.0}
+    # contracts whose size is not known do not contribute to the time per byte
+    history_sizes = {'a.hex': 100, 'b.hex': 100}
+
+    costs = predict_costs(['a.hex', 'new.hex', 'b.hex', 'timed_out.hex'], [100, 50, 300, 1], history, history_sizes)
+    assert costs == pytest.approx([10.0, 50 * 0.06, 2.0, 60.0])
+
+
+def test_predict_costs_no_history():
+    assert predict_costs(['a.hex', 'b.hex'], [100, 50], {}, {}) == [100.0, 50.0]
+
+
+def test_order_by_cost():
+    assert order_by_cost([1.0, 5.0, 3.0, 5.0]) == [1, 3, 2, 0]
+    assert order_by_cost([]) == []
+
+
+def test_simulate_schedule():
+    assert simulate_schedule([4, 1, 1, 1, 1], 2) == (4, 0)
+    # the longest task last
+    assert simulate_schedule([1, 1, 1, 1, 4], 2) == (6, 4)
+    assert simulate_schedule([3], 4) == (3, 9)
+    assert simulate_schedule([], 2) == (0, 0)
+
+
+def test_schedule_report():
+    durations = {0: 1.0, 1: 1.0, 2: 1.0, 3: 1.0, 4: 4.0}
+
+    assert schedule_report(durations, [4, 0, 1, 2, 3], 2) == (
+        "Idle worker time: 0.00 secs (makespan 4.00 secs)."
+        " Listing order: 4.00 secs (makespan 6.00 secs), saved 4.00 secs."
+    )
+    # not compared to itself
+    assert schedule_report(durations, [0, 1, 2, 3, 4], 2) == "Idle worker time: 4.00 secs (makespan 6.00 secs)."
+
+
+def test_schedule_report_unfinished():
+    # contracts not analyzed (e.g. already analyzed by a previous run) have no duration
+    assert schedule_report({1: 2.0, 3: 2.0}, [3, 2, 1, 0], 2) == (
+        "Idle worker time: 0.00 secs (makespan 2.00 secs)."
+        " Listing order: 0.00 secs (makespan 2.00 secs), saved 0.00 secs."
+    )
+    assert schedule_report({}, [1, 0], 2) is None
+
+
+def test_bytecode_features():
+    # PUSH1 0x80 PUSH1 0x40 MSTORE JUMPDEST PUSH1 0x0 JUMP JUMPDEST PUSH1 0x1 JUMPI STOP
+    instructions = FastEVMBytecodeParser('0x60806040525b6000565b60015700').parse()
+    assert bytecode_features(instructions) == {'bytecode_size': 14, 'jump_count': 1, 'jumpi_count': 1, 'jumpdest_count': 2}
+
+
+def sample(needed: bool, bytecode_size: int, jump_count: int):
+    return {'bytecode_size': bytecode_size, 'jump_count': jump_count}, needed
+
+
+def test_learn_threshold():
+    samples = [sample(True, 100, 1), sample(True, 90, 50), sample(False, 80, 40), sample(False, 50, 30), sample(False, 40, 20)]
+    assert learn_threshold(samples) == ('bytecode_size', 90)
+
+    # a misclassified contract is worth it if it gets two more right
+    samples = [sample(True, 100, 0), sample(False, 95, 0), sample(True, 90, 0), sample(True, 85, 0), sample(False, 10, 0)]
+    assert learn_threshold(samples) == ('bytecode_size', 85)
+
+
+def test_learn_threshold_ties():
+    # no cut between contracts of the same size
+    samples = [sample(True, 100, 0), sample(False, 100, 0), sample(True, 90, 0), sample(False, 80, 0)]
+    assert learn_threshold(samples) == ('bytecode_size', 90)
+
+
+def test_learn_threshold_not_beneficial():
+    assert learn_threshold([]) == (None, 0)
+    assert learn_threshold([sample(False, 100, 10), sample(False, 50, 5)]) == (None, 0)
+    assert learn_threshold([sample(False, 100, 10), sample(True, 50, 5)]) == (None, 0)
+    # samples without the features (e.g. from an older run)
+    assert learn_threshold([({}, True)]) == (None, 0)
+
+
+def test_fallback_predictor():
+    predictor = FallbackPredictor([
+        ('timeout.hex', [], ['TIMEOUT'], {}),
+        ('scalable.hex', [], [], {'decompiler_config': 'scalable', 'bytecode_size': 1000}),
+        ('default.hex', [], [], {'decompiler_config': 'default', 'bytecode_size': 100}),
+        # not a sample, was not decompiled with the default config
+        ('predicted.hex', [], [], {'decompiler_config': 'scalable', 'predicted_fallback': 1, 'bytecode_size': 10}),
+        ('error.hex', [], ['ERROR'], {}),
+    ])
+    assert (predictor.feature, predictor.threshold) == ('bytecode_size', 1000)
+    assert str(predictor) == "3 of 4 known contracts, bytecode_size >= 1000"
+
+    small, large = {'bytecode_size': 10}, {'bytecode_size': 5000}
+    # known contracts take the config they needed
+    assert predictor.predict('timeout.hex', small)
+    assert predictor.predict('predicted.hex', small)
+    assert not predictor.predict('default.hex', large)
+    assert predictor.predict('new.hex', {'bytecode_size': 1000})
+    assert not predictor.predict('new.hex', {'bytecode_size': 999})
+    assert not predictor.predict('error.hex', small)
+
+
+def test_fallback_predictor_no_threshold():
+    predictor = FallbackPredictor([('default.hex', [], [], {'decompiler_config': 'default', 'bytecode_size': 100})])
+    assert str(predictor) == "0 of 1 known contracts, no threshold"
+    assert not predictor.predict('new.hex', {'bytecode_size': 1 << 20})
+
+
+def test_thread_budget_shares():
+    budget = ThreadBudget(8)
+    for _ in range(4):
+        budget.contract_started()
+    # a process per contract, each entitled to 2 threads
+    assert [budget.acquire() for _ in range(4)] == [2, 2, 2, 2]
+
+    for _ in range(2):
+        budget.release(2)
+        budget.contract_finished()
+    # at the tail of the batch, the unused threads go to the processes of the last contracts
+    budget.release(2)
+    assert budget.acquire() == 6
+    # shared again once a contract starts
+    budget.contract_started()
+    budget.release(6)
+    assert budget.acquire() == 3
+
+
+def test_thread_budget_client_jobs():
+    budget = ThreadBudget(8, processes_per_contract=4)
+    budget.contract_started()
+    # threads are kept for the other clients of the contract
+    assert [budget.acquire() for _ in range(4)] == [2, 2, 2, 2]
+
+
+def test_thread_budget_never_exceeded():
+    rng = random.Random(0)
+    budget = ThreadBudget(6, processes_per_contract=2)
+    running: List[int] = []
+    active = 0
+    for _ in range(10000):
+        action = rng.randrange(4)
+        if action == 0 and active < 8:
+            budget.contract_started()
+            active += 1
+        elif action == 1 and active:
+            budget.contract_finished()
+            active -= 1
+        elif action == 2 and sum(running) < 6:
+            running.append(budget.acquire())
+        elif action == 3 and running:
+            budget.release(running.pop(rng.randrange(len(running))))
+        assert sum(running) <= 6
+
+
+def test_thread_budget_waits_for_thread():
+    budget = ThreadBudget(2)
+    budget.contract_started()
+    budget.contract_started()
+    held = [budget.acquire(), budget.acquire()]
+
+    threads = []
+    waiting = threading.Thread(target=lambda: threads.append(budget.acquire()))
+    waiting.start()
+    waiting.join(0.2)
+    assert waiting.is_alive()
+
+    budget.release(held.pop())
+    waiting.join(5)
+    assert threads == [1]
+
+
+def test_process_tree_rss():
+    allocate = f'{sys.executable} -c "import time; x = bytes(1) * 100_000_000; print(flush=True); time.sleep(60)"'
+    # not the direct child
+    process = subprocess.Popen(['sh', '-c', f'{allocate}; true'], stdout=subprocess.PIPE, start_new_session=True)
+    try:
+        assert process.stdout is not None
+        process.stdout.readline()
+        assert get_process_tree_rss([process.pid]) >= 100_000_000
+        # counted once
+        assert get_process_tree_rss([process.pid, process.pid]) < 2 * 100_000_000
+    finally:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    assert get_process_tree_rss([process.pid]) == 0
+    assert get_process_tree_rss([]) == 0
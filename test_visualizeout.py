@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Checks the contract.tac clients/visualizeout.py writes, in batch mode too"""
+
+import os
+import subprocess
+import sys
+from os.path import abspath, dirname, join
+
+from clients import visualizeout
+from facts_fixtures import EXAMPLE_FACTS, SEEDS, write_facts, write_random_facts
+
+GIGAHORSE_TOOLCHAIN_ROOT = dirname(abspath(__file__))
+
+VISUALIZEOUT = join(GIGAHORSE_TOOLCHAIN_ROOT, 'clients', 'visualizeout.py')
+
+SEPARATOR = '    ================================='
+
+EXAMPLE_TAC = '\n'.join([
+    # functions sorted by id
+    'function fallback()() public {',
+    '    Begin block 0x0',
+    '    prev=[], succ=[0x1a, 0x2b]',
+    SEPARATOR,
+    '    0x0: v100 = CALLDATALOAD ',
+    '    0x2: v104 = EQ v109(0xa9059cbb), v100',
+    '    0x4: JUMPI v104',
+    '',
+    # depth-first, each block before its successors
+    '    Begin block 0x1a',
+    '    prev=[0x0], succ=[0x2b]',
+    SEPARATOR,
+    '    0x1a: v105 = ADD v100, v100',
+    '    0x1b_1: v106 = CALLER ',
+    '    0x1b_0: v107 = MUL v105',
+    '',
+    '    Begin block 0x2b',
+    '    prev=[0x1a, 0x0], succ=[]',
+    SEPARATOR,
+    '    S0x2b: STOP ',
+    '',
+    '}',
+    '',
+    'function transfer(address,uint256)(0x101, 0x102) public {',
+    '    Begin block 0x40',
+    '    prev=[0x52], succ=[0x52]',
+    SEPARATOR,
+    '    0x40: SSTORE v101, v102',
+    '',
+    '    Begin block 0x52',
+    '    prev=[0x40], succ=[0x40]',
+    SEPARATOR,
+    '    0x52: JUMP ',
+    '',
+    # the head block is printed again when a loop leads back to it, as the recursive pretty-printer did
+    '    Begin block 0x40',
+    '    prev=[0x52], succ=[0x52]',
+    SEPARATOR,
+    '    0x40: SSTORE v101, v102',
+    '',
+    '}',
+    '',
+    'function helper(0x103) private {',
+    '    Begin block 0x60',
+    '    prev=[], succ=[]',
+    SEPARATOR,
+    '    0x60: v108 = ADD v103, v103',
+    '    0x61: RETURNPRIVATE v108',
+    '',
+    '}',
+    '',
+]) + '\n'
+
+
+def read_output(out_dir: str) -> str:
+    with open(join(out_dir, visualizeout.OUTPUT_FILE)) as f:
+        return f.read()
+
+
+def test_example_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_facts(str(tmp_path), EXAMPLE_FACTS)
+
+    visualizeout.visualize(str(tmp_path))
+    assert read_output(str(tmp_path)) == EXAMPLE_TAC
+
+
+def test_empty_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_facts(str(tmp_path), {fname: [] for fname in EXAMPLE_FACTS})
+
+    visualizeout.visualize(str(tmp_path))
+    assert read_output(str(tmp_path)) == ''
+
+
+def test_batch_same_output(tmp_path, monkeypatch):
+    out_dirs = [str(tmp_path / 'work' / f'contract{seed}' / 'out') for seed in SEEDS]
+    for seed, out_dir in enumerate(out_dirs):
+        os.makedirs(out_dir)
+        if seed:
+            write_random_facts(out_dir, seed)
+        else:
+            write_facts(out_dir, EXAMPLE_FACTS)
+    # not a contract's output dir
+    os.makedirs(tmp_path / 'work' / 'empty' / 'out')
+
+    result = subprocess.run([sys.executable, VISUALIZEOUT, '--batch', str(tmp_path / 'work'), '-j', '2'], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert f'Pretty-printed {len(out_dirs)} of {len(out_dirs)} contracts.' in result.stdout
+
+    assert visualizeout.find_out_dirs(str(tmp_path / 'work')) == sorted(out_dirs)
+    assert read_output(out_dirs[0]) == EXAMPLE_TAC
+    # as pretty-printed one at a time
+    for out_dir in out_dirs[1:]:
+        batch_output = read_output(out_dir)
+        monkeypatch.chdir(tmp_path)
+        visualizeout.visualize(out_dir)
+        assert read_output(out_dir) == batch_output
+
+
+def test_deep_chain(tmp_path, monkeypatch):
+    """A function whose CFG is deeper than the recursion limit"""
+    num_blocks = sys.getrecursionlimit() * 2
+    blocks = [f'0x{i:x}' for i in range(num_blocks)]
+    write_facts(str(tmp_path), {
+        'InFunction.csv': [(block, '0x0') for block in blocks],
+        'PublicFunction.csv': [('0x0', '0x0')],
+        'HighLevelFunctionName.csv': [('0x0', 'fallback()')],
+        'IRFunctionEntry.csv': [(blocks[0],)],
+        'FormalArgs.csv': [],
+        'TAC_Block.csv': [(f'{block}S0', block) for block in blocks],
+        'TAC_Op.csv': [(f'{block}S0', 'JUMP') for block in blocks],
+        'TAC_Use.csv': [],
+        'TAC_Def.csv': [],
+        'LocalBlockEdge.csv': list(zip(blocks, blocks[1:])),
+        'TAC_Variable_Value.csv': [],
+    })
+    monkeypatch.chdir(tmp_path)
+
+    visualizeout.visualize(str(tmp_path))
+    output = read_output(str(tmp_path))
+    assert [line.split()[-1] for line in output.splitlines() if line.strip().startswith('Begin block')] == blocks
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Unit tests of the archives of the working directories of analyzed contracts (src/work_archive.py)"""
+
+import io
+import os
+import zipfile
+
+import pytest
+
+from src.work_archive import ARCHIVE_SUFFIX, DEFAULT_ARCHIVE_KEEP, WorkArchive, pack, select_files, unpack
+
+PATTERNS = DEFAULT_ARCHIVE_KEEP.split(',')
+
+
+def make_work_dir(path, contents: str = 'S1\tADD\n') -> str:
+    os.makedirs(path / 'out' / 'cfg_cache')
+    (path / 'contract.hex').write_text('0x6080604052')
+    (path / 'out' / 'TAC_Op.csv').write_text(contents)
+    (path / 'out' / 'cfg_cache' / 'cfg.pickle').write_bytes(b'cache')
+    (path / 'out' / 'Verbatim_Op.csv').symlink_to('TAC_Op.csv')
+    # a typical mtime, with sub-microsecond digits
+    os.utime(path / 'out' / 'TAC_Op.csv', ns=(1_700_000_000_123_456_789, 1_700_000_000_123_456_789))
+    return str(path)
+
+
+def read_work_dir(path) -> dict:
+    return {os.path.relpath(os.path.join(root, fname), path): open(os.path.join(root, fname)).read()
+            for root, _, files in os.walk(path) for fname in files}
+
+
+def test_select_files(tmp_path):
+    work_dir = make_work_dir(tmp_path / 'work')
+    os.makedirs(tmp_path / 'work' / 'facts')
+    (tmp_path / 'work' / 'facts' / 'Statement_Opcode.facts').write_text('0x0\tPUSH1\n')
+    (tmp_path / 'work' / 'out' / 'Facts_Op.csv').symlink_to(tmp_path / 'work' / 'facts' / 'Statement_Opcode.facts')
+
+    assert select_files(work_dir, PATTERNS) == [
+        # the target of a kept symlink, in the working dir
+        'facts/Statement_Opcode.facts',
+        'out/Facts_Op.csv',
+        'out/TAC_Op.csv',
+        'out/Verbatim_Op.csv',
+    ]
+    assert select_files(work_dir, ['*.hex', 'out/cfg_cache/*']) == ['contract.hex', 'out/cfg_cache/cfg.pickle']
+    assert select_files(work_dir, ['!out/*']) == []
+
+
+def test_pack_unpack(tmp_path):
+    work_dir = make_work_dir(tmp_path / 'work')
+    buffer = io.BytesIO()
+    pack(work_dir, PATTERNS, buffer)
+
+    buffer.seek(0)
+    unpack(buffer, str(tmp_path / 'restored'))
+    assert read_work_dir(tmp_path / 'restored') == {'out/TAC_Op.csv': 'S1\tADD\n', 'out/Verbatim_Op.csv': 'S1\tADD\n'}
+    assert os.path.islink(tmp_path / 'restored' / 'out' / 'Verbatim_Op.csv')
+    # to the nanosecond, as fingerprinted by the client manifests
+    assert os.stat(tmp_path / 'restored' / 'out' / 'TAC_Op.csv').st_mtime_ns == 1_700_000_000_123_456_789
+
+
+@pytest.mark.parametrize("mode", ['contract', 'shard'])
+def test_store_restore(mode: str, tmp_path):
+    os.makedirs(tmp_path / 'work')
+    archive = WorkArchive(str(tmp_path / 'work'), mode, PATTERNS)
+    contract_dir = str(tmp_path / 'work' / 'a.hex')
+
+    assert not archive.exists(contract_dir)
+    assert not archive.restore(contract_dir, str(tmp_path / 'miss'))
+
+    archive.store(contract_dir, make_work_dir(tmp_path / 'tmp'))
+    assert not os.path.exists(tmp_path / 'tmp')
+    assert archive.exists(contract_dir)
+    assert not archive.exists(str(tmp_path / 'work' / 'b.hex'))
+
+    assert archive.restore(contract_dir, str(tmp_path / 'restored'))
+    assert read_work_dir(tmp_path / 'restored') == {'out/TAC_Op.csv': 'S1\tADD\n', 'out/Verbatim_Op.csv': 'S1\tADD\n'}
+
+    # superseded
+    archive.store(contract_dir, make_work_dir(tmp_path / 'tmp', 'S1\tSUB\n'))
+    assert archive.restore(contract_dir, str(tmp_path / 'restored2'))
+    assert read_work_dir(tmp_path / 'restored2')['out/TAC_Op.csv'] == 'S1\tSUB\n'
+
+    archive.remove(contract_dir)
+    assert not archive.exists(contract_dir)
+    assert not archive.restore(contract_dir, str(tmp_path / 'restored3'))
+    archive.remove(contract_dir)
+
+
+def test_exists_does_not_read_archive(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'work')
+    archive = WorkArchive(str(tmp_path / 'work'), 'shard', PATTERNS)
+    contract_dir = str(tmp_path / 'work' / 'a.hex')
+    archive.store(contract_dir, make_work_dir(tmp_path / 'tmp'))
+
+    def read(*_):
+        raise AssertionError('archive read')
+    monkeypatch.setattr(zipfile.ZipFile, 'read', read)
+    assert archive.exists(contract_dir)
+
+
+def shard_members(archive: WorkArchive, contract_dir: str):
+    with zipfile.ZipFile(archive.shard_path(contract_dir)) as shard:
+        return [(info.filename, info.file_size > 0) for info in shard.infolist()]
+
+
+def test_compact_shards(tmp_path):
+    os.makedirs(tmp_path / 'work')
+    archive = WorkArchive(str(tmp_path / 'work'), 'shard', PATTERNS)
+    contract_dirs = [str(tmp_path / 'work' / f'{i}.hex') for i in range(40)]
+    for i, contract_dir in enumerate(contract_dirs):
+        archive.store(contract_dir, make_work_dir(tmp_path / 'tmp', f'S{i}\tADD\n'))
+    # superseded, removed and removed then added again
+    archive.store(contract_dirs[0], make_work_dir(tmp_path / 'tmp', 'S0\tSUB\n'))
+    archive.remove(contract_dirs[1])
+    archive.remove(contract_dirs[2])
+    archive.store(contract_dirs[2], make_work_dir(tmp_path / 'tmp', 'S2\tSUB\n'))
+
+    shard_paths = {archive.shard_path(contract_dir) for contract_dir in contract_dirs}
+    untouched = {path: os.stat(path).st_mtime_ns for path in shard_paths - {archive.shard_path(contract_dirs[i]) for i in range(3)}}
+
+    archive.compact_shards()
+    for i in range(3):
+        members = shard_members(archive, contract_dirs[i])
+        assert len(members) == len(set(members)) and all(non_empty for _, non_empty in members)
+    assert f'1.hex{ARCHIVE_SUFFIX}' not in dict(shard_members(archive, contract_dirs[1]))
+    # shards without superseded archives are not rewritten
+    assert {path: os.stat(path).st_mtime_ns for path in untouched} == untouched
+
+    assert not archive.exists(contract_dirs[1])
+    for i, contract_dir in enumerate(contract_dirs):
+        if i != 1:
+            assert archive.restore(contract_dir, str(tmp_path / 'restored' / str(i)))
+            expected = f'S{i}\t{"SUB" if i in (0, 2) else "ADD"}\n'
+            assert read_work_dir(tmp_path / 'restored' / str(i))['out/TAC_Op.csv'] == expected
+
+
+def test_compact_contract_mode(tmp_path):
+    os.makedirs(tmp_path / 'work')
+    archive = WorkArchive(str(tmp_path / 'work'), 'contract', PATTERNS)
+    archive.store(str(tmp_path / 'work' / 'a.hex'), make_work_dir(tmp_path / 'tmp'))
+    archive.compact_shards()
+    assert os.listdir(tmp_path / 'work') == [f'a.hex{ARCHIVE_SUFFIX}']
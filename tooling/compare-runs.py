@@ -1,6 +1,11 @@
 import json
 from pathlib import Path
 import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from src.common import is_json_lines
 
 rels = [
 #  'Analytics_NonModeledMSTORE',
@@ -113,7 +118,10 @@ def process_result_file(filename, output_set=None):
 
     relset = set(rels)
     with open(filename) as json_file:
-        data = json.load(json_file)
+        if is_json_lines(filename):
+            data = [json.loads(line) for line in json_file if line.strip()]
+        else:
+            data = json.load(json_file)
         for contract in data:
             name = contract[0].replace('.hex', '')
             have_output = set(contract[1])